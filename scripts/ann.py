@@ -0,0 +1,276 @@
+#!/usr/bin/python
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+class IVFFlat:
+    """
+    Inverted-file index over a matrix of L2-normalized vectors. Rows of the matrix
+    are kept sorted by list, so list `i` is the contiguous slice
+    `offsets[i]:offsets[i + 1]` and only centroids and offsets need to be stored
+    next to it. Rows past `offsets[-1]` (added after the index was built) form an
+    unindexed tail that is always scanned exactly.
+    """
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray) -> None:
+        self.centroids = centroids
+        self.offsets = offsets
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def indexed(self) -> int:
+        return int(self.offsets[-1])
+
+    @classmethod
+    def build(
+        cls,
+        vectors: np.ndarray,
+        nlist: int | None = None,
+        n_iter: int = 10,
+        seed: int = 0,
+    ) -> tuple["IVFFlat", np.ndarray]:
+        """
+        Trains centroids with spherical k-means and groups rows by nearest centroid.
+
+        Args:
+            vectors (np.ndarray): L2-normalized vectors to index.
+            nlist (int | None, optional): Number of lists. If None, sqrt of the number
+            of vectors. Defaults to None.
+            n_iter (int, optional): Number of k-means iterations. Defaults to 10.
+            seed (int, optional): Random seed. Defaults to 0.
+
+        Returns:
+            tuple[IVFFlat, np.ndarray]: Index and the row order the matrix has to be
+            rearranged into (`vectors[order]`) for the index to be valid.
+        """
+        if nlist is None or nlist <= 0:
+            nlist = max(1, int(np.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+        centroids = train_centroids(vectors, nlist, n_iter=n_iter, seed=seed)
+        labels = assign(vectors, centroids)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=nlist)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(centroids, offsets), order
+
+    def search(
+        self, vectors: np.ndarray, query: np.ndarray, top_k: int, nprobe: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Scans `nprobe` lists closest to the query plus the unindexed tail.
+
+        Args:
+            vectors (np.ndarray): Matrix the index was built for.
+            query (np.ndarray): L2-normalized query vector.
+            top_k (int): Number of rows to return.
+            nprobe (int): Number of lists to scan.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Rows and scores, best first.
+        """
+        lists, _ = top_k_rows(self.centroids @ query, nprobe)
+        ranges = [
+            (self.offsets[i], self.offsets[i + 1])
+            for i in lists
+            if self.offsets[i + 1] > self.offsets[i]
+        ]
+        if self.indexed < len(vectors):
+            ranges.append((self.indexed, len(vectors)))
+        if not ranges:
+            return top_k_rows(np.empty(0, dtype=np.float32), top_k)
+        candidates = np.concatenate([np.arange(start, end) for start, end in ranges])
+        scores = np.concatenate([vectors[start:end] @ query for start, end in ranges])
+        best, best_scores = top_k_rows(scores, top_k)
+        return candidates[best], best_scores
+
+    def remove_rows(self, keep: np.ndarray) -> None:
+        """
+        Shifts list offsets after rows of the matrix were removed.
+
+        Args:
+            keep (np.ndarray): Boolean mask of rows that remain.
+        """
+        kept_rows = np.flatnonzero(keep)
+        self.offsets = np.searchsorted(kept_rows, self.offsets).astype(np.int64)
+
+    def save(self, path: Path, name: str) -> None:
+        save_array(path.joinpath(f"{name}.centroids.npy"), self.centroids)
+        save_array(path.joinpath(f"{name}.offsets.npy"), self.offsets)
+
+    @classmethod
+    def load(cls, path: Path, name: str, mmap: bool = True) -> "IVFFlat | None":
+        centroids_path = path.joinpath(f"{name}.centroids.npy")
+        offsets_path = path.joinpath(f"{name}.offsets.npy")
+        if not (centroids_path.is_file() and offsets_path.is_file()):
+            return None
+        mmap_mode = "r" if mmap else None
+        return cls(
+            np.load(centroids_path, mmap_mode=mmap_mode),
+            np.load(offsets_path),
+        )
+
+
+def train_centroids(
+    vectors: np.ndarray,
+    nlist: int,
+    n_iter: int = 10,
+    seed: int = 0,
+    max_points_per_list: int = 256,
+) -> np.ndarray:
+    """
+    Spherical k-means on a random sample of vectors.
+
+    Args:
+        vectors (np.ndarray): L2-normalized vectors.
+        nlist (int): Number of centroids.
+        n_iter (int, optional): Number of iterations. Defaults to 10.
+        seed (int, optional): Random seed. Defaults to 0.
+        max_points_per_list (int, optional): Sample size per centroid.
+        Defaults to 256.
+
+    Returns:
+        np.ndarray: L2-normalized centroids.
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * max_points_per_list)
+    sample = np.asarray(
+        vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    )
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = assign(sample, centroids)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=nlist)
+        non_empty = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)])[non_empty]
+        centroids[non_empty] = np.add.reduceat(sample[order], starts, axis=0)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(sample_size, len(empty))]
+        centroids = normalize(centroids)
+    return centroids
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray, batch_size: int = 65536):
+    """
+    Returns the nearest (highest cosine) centroid for every vector.
+
+    Args:
+        vectors (np.ndarray): L2-normalized vectors.
+        centroids (np.ndarray): L2-normalized centroids.
+        batch_size (int, optional): Rows scored at once. Defaults to 65536.
+
+    Returns:
+        np.ndarray: Centroid number for every vector.
+    """
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), batch_size):
+        batch = np.asarray(vectors[start : start + batch_size])
+        labels[start : start + batch_size] = np.argmax(batch @ centroids.T, axis=1)
+    return labels
+
+
+def recall_report(
+    vectors: np.ndarray,
+    ivf: IVFFlat,
+    queries: np.ndarray,
+    top_k: int = 10,
+    nprobes: list[int] | None = None,
+) -> list[dict]:
+    """
+    Measures recall@k and latency of IVF search against exact search on the same
+    vectors, for several `nprobe` values.
+
+    Args:
+        vectors (np.ndarray): Matrix the index was built for.
+        ivf (IVFFlat): Index to evaluate.
+        queries (np.ndarray): L2-normalized query vectors.
+        top_k (int, optional): k in recall@k. Defaults to 10.
+        nprobes (list[int] | None, optional): nprobe values to evaluate. If None,
+        powers of 2 up to nlist. Defaults to None.
+
+    Returns:
+        list[dict]: One row per nprobe with `nprobe`, `recall` and mean `latency_ms`;
+        the first row (nprobe `exact`) is the exact search baseline.
+    """
+    if nprobes is None:
+        nprobes = [2**i for i in range(int(np.log2(ivf.nlist)) + 1)]
+    exact = []
+    start = time.perf_counter()
+    for query in queries:
+        exact.append(set(top_k_rows(vectors @ query, top_k)[0].tolist()))
+    exact_latency = (time.perf_counter() - start) / len(queries)
+    report = [{"nprobe": "exact", "recall": 1.0, "latency_ms": 1000 * exact_latency}]
+    for nprobe in nprobes:
+        hits = 0
+        start = time.perf_counter()
+        for query, expected in zip(queries, exact):
+            rows, _ = ivf.search(vectors, query, top_k, nprobe)
+            hits += len(expected.intersection(rows.tolist()))
+        latency = (time.perf_counter() - start) / len(queries)
+        report.append(
+            {
+                "nprobe": nprobe,
+                "recall": hits / sum(len(expected) for expected in exact),
+                "latency_ms": 1000 * latency,
+            }
+        )
+    return report
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    L2-normalizes a vector or each row of a matrix. Zero vectors are left as-is.
+
+    Args:
+        vectors (np.ndarray): Vector or matrix.
+
+    Returns:
+        np.ndarray: Normalized float32 copy.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def top_k_rows(scores: np.ndarray, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns positions and values of `top_k` highest scores, highest first.
+
+    Args:
+        scores (np.ndarray): 1-D array of scores.
+        top_k (int): Number of scores to return.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Positions and scores.
+    """
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    if top_k < len(scores):
+        rows = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        rows = np.arange(len(scores))
+    rows = rows[np.argsort(-scores[rows], kind="stable")]
+    return rows, scores[rows]
+
+
+def save_array(file_path: Path, array: np.ndarray) -> None:
+    """
+    Saves an array through a temporary file and an atomic rename, so that processes
+    that have the previous version memory-mapped keep reading a consistent file.
+
+    Args:
+        file_path (Path): Target `.npy` file.
+        array (np.ndarray): Array to save.
+    """
+    tmp_path = file_path.with_name(f"{file_path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, file_path)
@@ -0,0 +1,588 @@
+#!/usr/bin/python
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from scripts.ann import normalize
+
+# `last_used` of cache hits is written in batches, once this many hits are pending
+# or this many seconds have passed since the last write (and before every put, so
+# that eviction sees them)
+_TOUCH_FLUSH_ENTRIES = 1000
+_TOUCH_FLUSH_SECONDS = 60.0
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding store in a SQLite file, keyed on model name and a hash of
+    the embedded text. Holds at most `max_entries` vectors, evicting the least
+    recently used ones. Lookups only read; their use times are kept in memory and
+    written in batches (see `flush`), hits pending at exit are not recorded.
+    """
+
+    def __init__(self, path: str | Path, max_entries: int = 100000) -> None:
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # key -> last use time of cache hits not yet written
+        self._touched: dict[str, int] = {}
+        self._flushed = time.monotonic()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        """
+        Returns cache key of a text embedded with a given model.
+
+        Args:
+            model_name (str): Embedding model name.
+            text (str): Embedded text.
+
+        Returns:
+            str: Hex digest.
+        """
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model_name: str, texts: list[str]) -> list[list[float] | None]:
+        """
+        Returns cached embeddings of given texts, None for texts not in cache.
+
+        Args:
+            model_name (str): Embedding model name.
+            texts (list[str]): Texts to look up.
+
+        Returns:
+            list[list[float] | None]: Embeddings in order of texts.
+        """
+        keys = [self.make_key(model_name, text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = list(set(keys[start : start + 500]))
+                rows = self._connection.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN "
+                    f"({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                found.update(rows)
+            now = time.time_ns()
+            self._touched.update((key, now) for key in found)
+            if (
+                len(self._touched) >= _TOUCH_FLUSH_ENTRIES
+                or time.monotonic() - self._flushed >= _TOUCH_FLUSH_SECONDS
+            ):
+                self._flush()
+                self._connection.commit()
+        return [
+            np.frombuffer(found[key], dtype=np.float32).tolist() if key in found else None
+            for key in keys
+        ]
+
+    def put_many(
+        self, model_name: str, texts: list[str], vectors: list[list[float]]
+    ) -> None:
+        """
+        Stores embeddings of given texts and evicts least recently used entries
+        above `max_entries`.
+
+        Args:
+            model_name (str): Embedding model name.
+            texts (list[str]): Embedded texts.
+            vectors (list[list[float]]): Their embeddings.
+        """
+        now = time.time_ns()
+        rows = [
+            (
+                self.make_key(model_name, text),
+                np.asarray(vector, dtype=np.float32).tobytes(),
+                now,
+            )
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._flush()
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) "
+                "VALUES (?, ?, ?)",
+                rows,
+            )
+            (count,) = self._connection.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()
+            if count > self.max_entries:
+                self._connection.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings "
+                    "ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._connection.commit()
+
+    def flush(self) -> None:
+        """
+        Writes use times of cache hits that are still pending.
+        """
+        with self._lock:
+            self._flush()
+            self._connection.commit()
+
+    def _flush(self) -> None:
+        # called with the lock held, the caller commits
+        if self._touched:
+            self._connection.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, key) for key, now in self._touched.items()],
+            )
+            self._touched = {}
+        self._flushed = time.monotonic()
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._connection.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()
+        return count
+
+
+class CachedEmbeddings:
+    """
+    Wraps an embeddings client (e.g. langchain's OpenAIEmbeddings) so that only
+    texts missing from an EmbeddingCache are sent to the API.
+    """
+
+    def __init__(self, embeddings, cache: EmbeddingCache, model_name: str) -> None:
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """
+        Returns embeddings of texts, calling the API for cache misses only.
+
+        Args:
+            texts (list[str]): Texts to embed.
+
+        Returns:
+            list[list[float]]: Embeddings in order of texts.
+        """
+        result, missing = self._lookup(texts)
+        if missing:
+            vectors = self.embeddings.embed_documents(missing)
+            result = self._merge(texts, result, missing, vectors)
+        return result
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """
+        Async version of `embed_documents`. SQLite is read and written in a worker
+        thread, not to block the event loop.
+        """
+        result, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            vectors = await self.embeddings.aembed_documents(missing)
+            result = await asyncio.to_thread(
+                self._merge, texts, result, missing, vectors
+            )
+        return result
+
+    def embed_query(self, text: str) -> list[float]:
+        """
+        Returns embedding of a query, calling the API on cache miss only.
+
+        Args:
+            text (str): Query to embed.
+
+        Returns:
+            list[float]: Embedding.
+        """
+        (vector,) = self.cache.get_many(self.model_name, [text])
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many(self.model_name, [text], [vector])
+        return vector
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """
+        Async version of `embed_query`, with SQLite calls in a worker thread.
+        """
+        (vector,) = await asyncio.to_thread(self.cache.get_many, self.model_name, [text])
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            await asyncio.to_thread(
+                self.cache.put_many, self.model_name, [text], [vector]
+            )
+        return vector
+
+    def _lookup(self, texts: list[str]) -> tuple[list, list[str]]:
+        result = self.cache.get_many(self.model_name, texts)
+        # deduplicated, order-preserving list of texts to embed
+        missing = list(dict.fromkeys(t for t, v in zip(texts, result) if v is None))
+        return result, missing
+
+    def _merge(
+        self, texts: list[str], result: list, missing: list[str], vectors: list
+    ) -> list[list[float]]:
+        self.cache.put_many(self.model_name, missing, vectors)
+        embedded = dict(zip(missing, vectors))
+        return [embedded[t] if v is None else v for t, v in zip(texts, result)]
+
+
+_embedding_caches: dict[Path, EmbeddingCache] = {}
+_embedding_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(path: str | Path, max_entries: int = 100000) -> EmbeddingCache:
+    """
+    Returns a process-wide EmbeddingCache for a given file, opening it on first use.
+
+    Args:
+        path (str | Path): SQLite file path.
+        max_entries (int, optional): Cache size cap. Defaults to 100000.
+
+    Returns:
+        EmbeddingCache: Shared cache.
+    """
+    path = Path(path).resolve()
+    with _embedding_caches_lock:
+        if path not in _embedding_caches:
+            _embedding_caches[path] = EmbeddingCache(path, max_entries=max_entries)
+        return _embedding_caches[path]
+
+
+class ParseCache:
+    """
+    Persistent store of parsed files in a SQLite file. An entry is valid while the
+    file keeps its size and content and the parser keeps its version; files whose
+    size and mtime did not change are not even read.
+    """
+
+    def __init__(self, path: str | Path, version: str) -> None:
+        self.path = Path(path)
+        self.version = version
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS parsed (path TEXT PRIMARY KEY, "
+            "size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, hash TEXT NOT NULL, "
+            "version TEXT NOT NULL, sentences TEXT NOT NULL)"
+        )
+        self._connection.commit()
+
+    def get(self, file_path: str | Path) -> list[str] | None:
+        """
+        Returns cached sentences of a file, None if the file is not in cache or has
+        changed since it was parsed.
+
+        Args:
+            file_path (str | Path): Parsed file path.
+
+        Returns:
+            list[str] | None: Sentences.
+        """
+        key = str(Path(file_path).resolve())
+        row = self._connection.execute(
+            "SELECT size, mtime_ns, hash, version, sentences FROM parsed WHERE path = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        size, mtime_ns, content_hash, version, sentences = row
+        stat = os.stat(file_path)
+        if version != self.version or stat.st_size != size:
+            return None
+        if stat.st_mtime_ns != mtime_ns:
+            # touched, but possibly not modified
+            if hash_file(file_path) != content_hash:
+                return None
+            self._connection.execute(
+                "UPDATE parsed SET mtime_ns = ? WHERE path = ?",
+                (stat.st_mtime_ns, key),
+            )
+            self._connection.commit()
+        return json.loads(sentences)
+
+    def put(self, file_path: str | Path, sentences: list[str]) -> None:
+        """
+        Stores sentences of a parsed file.
+
+        Args:
+            file_path (str | Path): Parsed file path.
+            sentences (list[str]): Its sentences.
+        """
+        stat = os.stat(file_path)
+        self._connection.execute(
+            "INSERT OR REPLACE INTO parsed "
+            "(path, size, mtime_ns, hash, version, sentences) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                str(Path(file_path).resolve()),
+                stat.st_size,
+                stat.st_mtime_ns,
+                hash_file(file_path),
+                self.version,
+                json.dumps(sentences, ensure_ascii=False),
+            ),
+        )
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __len__(self) -> int:
+        (count,) = self._connection.execute("SELECT COUNT(*) FROM parsed").fetchone()
+        return count
+
+
+def hash_file(file_path: str | Path, block_size: int = 1 << 20) -> str:
+    """
+    Returns sha256 hex digest of a file content.
+
+    Args:
+        file_path (str | Path): File to hash.
+        block_size (int, optional): Bytes read at once. Defaults to 1 MiB.
+
+    Returns:
+        str: Hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class AnswerCache:
+    """
+    In-memory LRU cache of query answers with a time-to-live, keyed on the
+    normalized query text and the query parameters (namespace, threshold,
+    text_field). Entries of a namespace are dropped as soon as it is modified
+    through `invalidate_namespace`.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+        _answer_caches.add(self)
+
+    @staticmethod
+    def make_key(query: str, namespace: str, threshold: float, text_field: str) -> tuple:
+        """
+        Returns cache key of a query.
+
+        Args:
+            query (str): User query.
+            namespace (str): Namespace searched.
+            threshold (float): Answer threshold.
+            text_field (str): Metadata field with an answer.
+
+        Returns:
+            tuple: Key.
+        """
+        return (normalize_query(query), namespace, threshold, text_field)
+
+    def get(self, key: tuple):
+        """
+        Returns a cached value or None if missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, value) -> None:
+        """
+        Stores a value, evicting the least recently used entry above `max_entries`.
+        """
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, namespace: str | None = None) -> None:
+        """
+        Drops entries of a namespace, or all entries if namespace is None.
+        """
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[1] == namespace]:
+                del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SemanticCache:
+    """
+    Second answer cache tier keyed on query embeddings: a query whose embedding is
+    within `max_distance` (cosine distance) of a cached query asked with the same
+    parameters gets the cached answer. Keeps at most `max_entries` embeddings in
+    one matrix, evicting the least recently used ones.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_distance: float = 0.05) -> None:
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.hits = 0
+        self.misses = 0
+        self._vectors: np.ndarray | None = None
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._last_used = np.zeros(max_entries, dtype=np.int64)
+        self._params = np.full(max_entries, -1, dtype=np.int64)
+        # ids of (namespace, threshold, text_field) of live entries only, so that
+        # the dict never outgrows the cache
+        self._param_ids: dict[tuple, int] = {}
+        self._next_param_id = 0
+        self._namespaces: list[str | None] = [None] * max_entries
+        self._values: list = [None] * max_entries
+        self._counter = 0
+        self._lock = threading.Lock()
+        _answer_caches.add(self)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, vector: list[float], namespace: str, threshold: float, text_field: str):
+        """
+        Returns the value cached for the nearest query embedding, or None if there is
+        none within `max_distance`.
+
+        Args:
+            vector (list[float]): Query embedding.
+            namespace (str): Namespace searched.
+            threshold (float): Answer threshold.
+            text_field (str): Metadata field with an answer.
+        """
+        with self._lock:
+            param_id = self._param_ids.get((namespace, threshold, text_field))
+            if self._vectors is None or param_id is None:
+                self.misses += 1
+                return None
+            scores = self._vectors @ normalize(vector)
+            scores[~self._valid | (self._params != param_id)] = -np.inf
+            slot = int(np.argmax(scores))
+            if scores[slot] < 1 - self.max_distance:
+                self.misses += 1
+                return None
+            self._counter += 1
+            self._last_used[slot] = self._counter
+            self.hits += 1
+            return self._values[slot]
+
+    def put(
+        self,
+        vector: list[float],
+        namespace: str,
+        threshold: float,
+        text_field: str,
+        value,
+    ) -> None:
+        """
+        Stores a value for a query embedding.
+        """
+        vector = normalize(vector)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), np.float32)
+            free = np.flatnonzero(~self._valid)
+            slot = int(free[0]) if len(free) else int(np.argmin(self._last_used))
+            self._drop(slot)
+            params = (namespace, threshold, text_field)
+            if params not in self._param_ids:
+                self._param_ids[params] = self._next_param_id
+                self._next_param_id += 1
+            self._counter += 1
+            self._vectors[slot] = vector
+            self._valid[slot] = True
+            self._last_used[slot] = self._counter
+            self._params[slot] = self._param_ids[params]
+            self._namespaces[slot] = namespace
+            self._values[slot] = value
+
+    def invalidate(self, namespace: str | None = None) -> None:
+        """
+        Drops entries of a namespace, or all entries if namespace is None.
+        """
+        with self._lock:
+            for slot in np.flatnonzero(self._valid):
+                if namespace is None or self._namespaces[slot] == namespace:
+                    self._drop(slot)
+
+    def _drop(self, slot: int) -> None:
+        # called with the lock held; forgets parameters no live entry uses
+        if not self._valid[slot]:
+            return
+        self._valid[slot] = False
+        self._values[slot] = None
+        param_id = self._params[slot]
+        if not (self._valid & (self._params == param_id)).any():
+            for params, id_ in list(self._param_ids.items()):
+                if id_ == param_id:
+                    del self._param_ids[params]
+
+    def __len__(self) -> int:
+        return int(self._valid.sum())
+
+
+_answer_caches: weakref.WeakSet = weakref.WeakSet()
+
+
+def invalidate_namespace(namespace: str | None = None) -> None:
+    """
+    Drops cached answers of a modified namespace from all answer caches of the
+    process. Called by the loader whenever data in a namespace changes.
+
+    Args:
+        namespace (str | None, optional): Modified namespace. If None, all entries
+        are dropped. Defaults to None.
+    """
+    for answer_cache in list(_answer_caches):
+        answer_cache.invalidate(namespace)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query for exact-match caching: lowercases it, collapses whitespace
+    (including trailing newlines) and strips trailing `?`, `!` and `.`. Other
+    punctuation is kept, as it can change the meaning (e.g. "3.5" and "35").
+
+    Args:
+        query (str): User query.
+
+    Returns:
+        str: Normalized query.
+    """
+    return re.sub(r"[\s?!.]+$", "", " ".join(query.casefold().split()))
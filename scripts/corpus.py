@@ -0,0 +1,121 @@
+#!/usr/bin/python
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+import repackage
+
+repackage.up()
+from scripts.ingestion import content_hash
+
+# pyarrow is imported on first use, it is slow to import and only needed by
+# commands reading or writing a Parquet corpus
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+
+def write_corpus(
+    records: Iterable[dict], file_path: str | Path, batch_size: int = 1024
+) -> int:
+    """
+    Writes parsed chunks to a Parquet file, `batch_size` rows per record batch. The
+    file is written through a temporary file and an atomic rename, so readers never
+    see a partial corpus.
+
+    Args:
+        records (Iterable[dict]): Records with `text`, `source`, `file_type` and
+        `chunk_index` keys.
+        file_path (str | Path): Parquet file to write.
+        batch_size (int, optional): Number of rows per batch. Defaults to 1024.
+
+    Returns:
+        int: Number of rows written.
+    """
+    import pyarrow.parquet as pq
+
+    file_path = Path(file_path)
+    tmp_path = file_path.with_name(f"{file_path.name}.tmp")
+    rows = 0
+    batch = []
+    with pq.ParquetWriter(tmp_path, _schema()) as writer:
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                writer.write_batch(_to_record_batch(batch))
+                rows += len(batch)
+                batch = []
+        if batch or not rows:
+            writer.write_batch(_to_record_batch(batch))
+            rows += len(batch)
+    os.replace(tmp_path, file_path)
+    return rows
+
+
+def read_batches(
+    file_path: str | Path, columns: list[str] | None = None, batch_size: int = 1024
+) -> Iterator["pa.RecordBatch"]:
+    """
+    Reads a corpus in record batches from a memory-mapped Parquet file.
+
+    Args:
+        file_path (str | Path): Parquet file to read.
+        columns (list[str] | None, optional): Columns to read. If None, all columns.
+        Defaults to None.
+        batch_size (int, optional): Maximal number of rows per batch.
+        Defaults to 1024.
+
+    Yields:
+        Iterator[pa.RecordBatch]: Record batches.
+    """
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(file_path, memory_map=True)
+    yield from parquet_file.iter_batches(batch_size=batch_size, columns=columns)
+
+
+def read_records(file_path: str | Path, batch_size: int = 1024) -> Iterator[dict]:
+    """
+    Reads a corpus as records to be loaded into an index (see
+    `loader.BaseIndex.load_records_into_index`).
+
+    Args:
+        file_path (str | Path): Parquet file to read.
+        batch_size (int, optional): Number of rows read at once. Defaults to 1024.
+
+    Yields:
+        Iterator[dict]: Records with `text`, `source`, `file_type` and `chunk_index`
+        keys.
+    """
+    columns = ["text", "source", "file_type", "chunk_index"]
+    for batch in read_batches(file_path, columns=columns, batch_size=batch_size):
+        yield from batch.to_pylist()
+
+
+def _schema() -> "pa.Schema":
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("text", pa.string()),
+            ("source", pa.string()),
+            ("file_type", pa.string()),
+            ("chunk_index", pa.int32()),
+            ("content_hash", pa.string()),
+        ]
+    )
+
+
+def _to_record_batch(records: list[dict]) -> "pa.RecordBatch":
+    import pyarrow as pa
+
+    texts = [record["text"] for record in records]
+    return pa.RecordBatch.from_arrays(
+        [
+            pa.array(texts, pa.string()),
+            pa.array([record["source"] for record in records], pa.string()),
+            pa.array([record.get("file_type") for record in records], pa.string()),
+            pa.array([record.get("chunk_index") for record in records], pa.int32()),
+            pa.array([content_hash(text) for text in texts], pa.string()),
+        ],
+        schema=_schema(),
+    )
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+import re
+import zlib
+from functools import lru_cache
+
+import numpy as np
+import repackage
+
+repackage.up()
+from config.config import load_config
+from scripts.ann import normalize
+
+config = load_config()
+
+# dimension of OpenAI embedding models used by the project (text-embedding-ada-002)
+OPENAI_DIMENSION = 1536
+
+
+class HashingEmbeddings:
+    """
+    Offline, CPU-only embeddings: words and character n-grams of words are hashed
+    (signed feature hashing) into `dimension` buckets, counts are damped with log and
+    vectors are L2-normalized, so that cosine similarity reflects shared vocabulary
+    (n-grams make it tolerant to Polish inflection). Deterministic across processes
+    and machines. Implements the subset of langchain's Embeddings interface used by
+    the project.
+    """
+
+    def __init__(self, dimension: int = 1024, ngram_range: tuple[int, int] = (3, 4)):
+        self.dimension = dimension
+        self.ngram_range = ngram_range
+        # identifies vectors in caches, like OpenAIEmbeddings.model
+        self.model = f"hashing-{dimension}-{ngram_range[0]}-{ngram_range[1]}"
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_array([text])[0].tolist()
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        # CPU-bound and fast, nothing to await
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return self.embed_query(text)
+
+    def embed_array(self, texts: list[str]) -> np.ndarray:
+        """
+        Embeds texts into a matrix.
+
+        Args:
+            texts (list[str]): Texts to embed.
+
+        Returns:
+            np.ndarray: float32 matrix, one L2-normalized row per text.
+        """
+        buckets = []
+        lengths = []
+        for text in texts:
+            text_buckets = [
+                bucket
+                for word in re.findall(r"\w+", text.casefold())
+                for bucket in self._word_buckets(word)
+            ]
+            buckets.extend(text_buckets)
+            lengths.append(len(text_buckets))
+        buckets = np.asarray(buckets, dtype=np.int64)
+        rows = np.repeat(np.arange(len(texts)), lengths)
+        counts = np.bincount(
+            rows * self.dimension + np.abs(buckets) - 1,
+            weights=np.sign(buckets),
+            minlength=len(texts) * self.dimension,
+        ).reshape(len(texts), self.dimension)
+        return normalize(np.sign(counts) * np.log1p(np.abs(counts)))
+
+    @lru_cache(maxsize=1 << 18)
+    def _word_buckets(self, word: str) -> tuple[int, ...]:
+        # signed 1-based bucket numbers of a word and its character n-grams
+        features = [word]
+        padded = f"<{word}>"
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            features.extend(padded[i : i + n] for i in range(max(1, len(padded) - n + 1)))
+        buckets = []
+        for feature in features:
+            # crc32 is stable across processes, unlike hash()
+            digest = zlib.crc32(feature.encode("utf-8"))
+            bucket = digest % self.dimension + 1
+            buckets.append(bucket if digest >> 31 else -bucket)
+        return tuple(buckets)
+
+
+def get_embeddings():
+    """
+    Returns an embeddings client of the backend selected in config.json
+    (`embeddings.backend`): `openai` (default) or `local`.
+
+    Raises:
+        ValueError: If the backend is unknown.
+
+    Returns:
+        OpenAIEmbeddings | HashingEmbeddings: Embeddings client.
+    """
+    backend = config.get("embeddings", {}).get("backend", "openai")
+    if backend == "openai":
+        # langchain takes seconds to import, so only when needed
+        from langchain.embeddings.openai import OpenAIEmbeddings
+
+        return OpenAIEmbeddings(
+            model=config["openai"]["model_name"],
+            openai_api_key=config["openai"]["api_key"],
+        )
+    elif backend == "local":
+        return HashingEmbeddings(dimension=get_dimension())
+    else:
+        raise ValueError(f"Unknown embeddings backend `{backend}`.")
+
+
+def get_dimension() -> int:
+    """
+    Returns dimension of embeddings of the backend selected in config.json.
+
+    Returns:
+        int: Dimension.
+    """
+    embeddings_config = config.get("embeddings", {})
+    if embeddings_config.get("backend", "openai") == "local":
+        return embeddings_config.get("dimension", 1024)
+    return OPENAI_DIMENSION
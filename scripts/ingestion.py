@@ -0,0 +1,603 @@
+#!/usr/bin/python
+import hashlib
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Iterable
+
+import repackage
+
+repackage.up()
+from scripts.metrics import Metrics, get_metrics
+
+_STOP = object()
+
+
+class IngestionPipeline:
+    """
+    Splits, embeds and upserts records in overlapping stages:
+
+        producer (caller thread) -> embed queue -> N embedding workers
+        -> upsert queue -> M upsert workers
+
+    Queues are bounded, so at most `queue_size` batches wait in each stage and
+    memory stays flat regardless of the input size. All workers share one
+    TextProcessing instance.
+
+    Chunk ids are derived from the record source and chunk text. With a manifest,
+    chunks already uploaded are skipped and, if `prune`, chunks of the loaded
+    sources that are no longer produced are deleted from the index, so a reload
+    only costs the size of the change.
+
+    Chunks are packed into embedding requests of at most `batch_limit` chunks and
+    `token_budget` tokens (see TokenBudget). Requests throttled by the provider are
+    retried up to `max_retries` times, split to fit the reduced budget.
+
+    Every stage reports to `metrics` (records, chunks and tokens produced, latency
+    and size of embedding and upsert requests, errors), so that a slow run can be
+    attributed to parsing and splitting or to the network.
+
+    With a checkpoint, every upserted batch is journaled together with the number
+    of records committed so far (all their chunks upserted), so that a run that
+    crashed or was interrupted can be resumed after them (see Checkpoint).
+    """
+
+    def __init__(
+        self,
+        index,
+        text_processing,
+        namespace: str,
+        target_column: str,
+        batch_limit: int = 100,
+        embed_workers: int = 4,
+        upsert_workers: int = 2,
+        queue_size: int = 8,
+        manifest: "Manifest | None" = None,
+        prune: bool = True,
+        metrics: Metrics | None = None,
+        token_budget: "TokenBudget | None" = None,
+        max_retries: int = 3,
+        retry_backoff: float = 1.0,
+        checkpoint: "Checkpoint | None" = None,
+    ) -> None:
+        self.index = index
+        self.text_processing = text_processing
+        self.namespace = namespace
+        self.target_column = target_column
+        self.batch_limit = batch_limit
+        self.embed_workers = embed_workers
+        self.upsert_workers = upsert_workers
+        self._embed_queue = queue.Queue(maxsize=queue_size)
+        self._upsert_queue = queue.Queue(maxsize=queue_size)
+        self._failed = threading.Event()
+        self._errors: list[BaseException] = []
+        self._lock = threading.Lock()
+        self.manifest = manifest
+        self.prune = prune
+        self.metrics = metrics if metrics is not None else get_metrics()
+        self.token_budget = token_budget if token_budget is not None else TokenBudget()
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.checkpoint = checkpoint
+        self.upserted = 0
+        self.skipped = 0
+        self.deleted = 0
+        # records skipped when resuming from the checkpoint
+        self.resumed = 0
+        # chunk id -> source of every chunk produced in this run
+        self._seen: dict[str, str] = {}
+        # sources of all records of this run, the only ones pruned
+        self._sources: set[str] = set()
+        # batch number -> records committed once it and all previous batches are
+        # upserted, for batches not committed yet
+        self._in_flight: dict[int, int] = {}
+        self._done: set[int] = set()
+
+    def run(
+        self,
+        records: Iterable[dict],
+        resume: bool = False,
+        input_key: str | None = None,
+    ) -> int:
+        """
+        Loads records into the index.
+
+        Args:
+            records (Iterable[dict]): Records to load, dicts with `text` and `source`
+            keys. Other keys are stored in metadata of the record chunks.
+            resume (bool, optional): Whether to skip records committed by an
+            interrupted run of the same input. Defaults to False.
+            input_key (str | None, optional): Identifies the input (and its
+            version), so that a checkpoint of another input is not resumed. If
+            None, records are never skipped. Defaults to None.
+
+        Raises:
+            RuntimeError: If any of the workers failed; the first error is chained.
+
+        Returns:
+            int: Number of vectors upserted.
+        """
+        completed = False
+        prune = self.prune
+        if self.checkpoint is not None:
+            offset, ids = self.checkpoint.load(input_key)
+            if self.manifest is not None and ids:
+                # chunks upserted by an interrupted run are in the index, whether
+                # it is resumed or not
+                self.manifest.entries.update(ids)
+                self.manifest.save()
+            if resume and offset:
+                records = itertools.islice(records, offset, None)
+                self.resumed = offset
+                # chunks of skipped records are not seen, nothing can be pruned
+                prune = False
+            self.checkpoint.start(input_key, self.resumed)
+        start = time.perf_counter()
+        embedders = self._start(self._embed_worker, self.embed_workers)
+        upserters = self._start(self._upsert_worker, self.upsert_workers)
+        try:
+            for seq, (offset, *batch) in enumerate(self._batches(records)):
+                with self._lock:
+                    self._in_flight[seq] = self.resumed + offset
+                wait_start = time.perf_counter()
+                put = self._put(self._embed_queue, (seq, *batch))
+                self.metrics.inc(
+                    "producer_wait_seconds", time.perf_counter() - wait_start
+                )
+                if not put:
+                    break
+            completed = True
+        finally:
+            self._stop(self._embed_queue, embedders)
+            self._stop(self._upsert_queue, upserters)
+            if self.manifest is not None:
+                # vanished chunks are only known after a complete pass
+                if completed and prune and not self._errors:
+                    self._delete_vanished()
+                self.manifest.save()
+            if self.checkpoint is not None:
+                self.checkpoint.close()
+                # kept to resume from unless the run completed
+                if completed and not self._errors:
+                    self.checkpoint.delete()
+            self.metrics.observe("ingestion_seconds", time.perf_counter() - start)
+        if self._errors:
+            raise RuntimeError("Ingestion failed.") from self._errors[0]
+        return self.upserted
+
+    def _batches(self, records: Iterable[dict]):
+        ids = []
+        texts = []
+        metadatas = []
+        token_counts = []
+        for i, (record, record_chunks) in enumerate(self._split(records)):
+            self.metrics.inc("records_total")
+            self._sources.add(record["source"])
+            # first get metadata fields for this record: its provenance (source,
+            # file type, ...; pinecone does not accept null values) and text
+            metadata = {
+                key: value
+                for key, value in record.items()
+                if key != "text" and value is not None
+            }
+            metadata[self.target_column] = record["text"]
+            # create individual metadata dicts for each chunk, skipping chunks
+            # that are already in the index
+            for j, (text, n_tokens) in enumerate(record_chunks):
+                self.metrics.inc("chunks_total")
+                self.metrics.inc("tokens_total", n_tokens)
+                id_ = chunk_id(record["source"], text)
+                if id_ in self._seen:
+                    continue
+                self._seen[id_] = record["source"]
+                if self.manifest is not None and id_ in self.manifest.entries:
+                    self.skipped += 1
+                    self.metrics.inc("chunks_skipped_total")
+                    continue
+                # flush before the chunk would overflow the request
+                if texts and (
+                    len(texts) >= self.batch_limit
+                    or sum(token_counts) + n_tokens > self.token_budget.value
+                ):
+                    # with the number of records whose chunks are all batched
+                    yield i, ids, texts, metadatas, token_counts
+                    ids = []
+                    texts = []
+                    metadatas = []
+                    token_counts = []
+                ids.append(id_)
+                texts.append(text)
+                metadatas.append({"chunk": j, self.target_column: text, **metadata})
+                token_counts.append(n_tokens)
+        if texts:
+            yield i + 1, ids, texts, metadatas, token_counts
+
+    def _split(self, records: Iterable[dict], group_size: int = 64):
+        # records are split in groups, so that they are tokenized in batches
+        records = iter(records)
+        while group := list(itertools.islice(records, group_size)):
+            texts = [record["text"] for record in group]
+            with self.metrics.timer("split_seconds"):
+                splitter = self.text_processing.text_splitter
+                chunks = splitter.split_texts_with_lengths(texts)
+            yield from zip(group, chunks)
+
+    def _embed_worker(self) -> None:
+        while (batch := self._embed_queue.get()) is not _STOP:
+            if self._failed.is_set():
+                continue
+            seq, ids, texts, metadatas, token_counts = batch
+            try:
+                embeds = self._embed(texts, token_counts)
+            except BaseException as e:
+                self.metrics.inc("errors_total", stage="embed")
+                self._fail(e)
+                continue
+            self._put(self._upsert_queue, (seq, ids, embeds, metadatas))
+
+    def _embed(self, texts: list[str], token_counts: list[int], attempt: int = 0):
+        self.metrics.inc("embedding_requests_total")
+        self.metrics.observe("embedding_batch_size", len(texts))
+        self.metrics.observe("embedding_batch_tokens", sum(token_counts))
+        start = time.perf_counter()
+        try:
+            embeds = self.text_processing.embed.embed_documents(texts)
+            self.token_budget.record(time.perf_counter() - start)
+            return embeds
+        except Exception as e:
+            if attempt >= self.max_retries or not is_throttling_error(e):
+                raise
+        finally:
+            self.metrics.observe("embedding_seconds", time.perf_counter() - start)
+        # throttled: back off and retry in requests that fit the reduced budget
+        self.token_budget.throttle()
+        self.metrics.inc("retries_total", stage="embed")
+        time.sleep(self.retry_backoff * 2**attempt)
+        embeds = []
+        for part in pack(token_counts, self.token_budget.value, self.batch_limit):
+            embeds.extend(self._embed(texts[part], token_counts[part], attempt + 1))
+        return embeds
+
+    def _upsert_worker(self) -> None:
+        while (batch := self._upsert_queue.get()) is not _STOP:
+            if self._failed.is_set():
+                continue
+            seq, ids, embeds, metadatas = batch
+            self.metrics.inc("upsert_requests_total")
+            self.metrics.observe(
+                "upsert_payload_bytes", payload_size((ids, embeds, metadatas))
+            )
+            try:
+                with self.metrics.timer("upsert_seconds"):
+                    self.index.upsert(
+                        vectors=list(zip(ids, embeds, metadatas)),
+                        namespace=self.namespace,
+                    )
+            except BaseException as e:
+                self.metrics.inc("errors_total", stage="upsert")
+                self._fail(e)
+                continue
+            with self._lock:
+                self.upserted += len(ids)
+                if self.manifest is not None:
+                    for id_ in ids:
+                        self.manifest.entries[id_] = self._seen[id_]
+                self._commit(seq, ids)
+
+    def _commit(self, seq: int, ids: list[str]) -> None:
+        # called with the lock held; batches are upserted out of order, records
+        # are committed once all batches up to theirs are upserted
+        self._done.add(seq)
+        offset = None
+        while self._in_flight and (first := next(iter(self._in_flight))) in self._done:
+            offset = self._in_flight.pop(first)
+            self._done.remove(first)
+        if self.checkpoint is not None:
+            self.checkpoint.commit(offset, {id_: self._seen[id_] for id_ in ids})
+
+    def _delete_vanished(self, batch_size: int = 1000) -> None:
+        # chunks of other sources (e.g. other files loaded into the namespace) stay
+        vanished = [
+            id_
+            for id_, source in self.manifest.entries.items()
+            if source in self._sources and id_ not in self._seen
+        ]
+        for start in range(0, len(vanished), batch_size):
+            ids = vanished[start : start + batch_size]
+            self.index.delete(ids=ids, namespace=self.namespace)
+            for id_ in ids:
+                del self.manifest.entries[id_]
+            self.deleted += len(ids)
+            self.metrics.inc("chunks_deleted_total", len(ids))
+
+    def _start(self, target, n: int) -> list[threading.Thread]:
+        threads = [threading.Thread(target=target, daemon=True) for _ in range(max(1, n))]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def _stop(self, q: queue.Queue, threads: list[threading.Thread]) -> None:
+        for _ in threads:
+            q.put(_STOP)
+        for thread in threads:
+            thread.join()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        # a bounded put that gives up once a worker has failed, so that the
+        # producer is never stuck on a queue nobody consumes from
+        while not self._failed.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fail(self, error: BaseException) -> None:
+        with self._lock:
+            self._errors.append(error)
+        self._failed.set()
+
+
+class TokenBudget:
+    """
+    Maximal number of tokens in an embedding request, adapted to the provider the
+    way TCP adapts its congestion window: it grows by a tenth of `max_tokens` after
+    every request answered within `target_latency` seconds, shrinks in proportion
+    to the latency of slower requests and is halved whenever the provider throttles
+    (HTTP 429, timeouts). It stays between `min_tokens` and `max_tokens`.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 20000,
+        min_tokens: int = 1000,
+        target_latency: float | None = None,
+    ) -> None:
+        if not 0 < min_tokens <= max_tokens:
+            raise ValueError("Token budget must satisfy 0 < min_tokens <= max_tokens.")
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.target_latency = target_latency
+        self.value = max_tokens
+        self._lock = threading.Lock()
+
+    def record(self, latency: float) -> None:
+        """
+        Adapts the budget to the latency of a successful request.
+
+        Args:
+            latency (float): Request latency in seconds.
+        """
+        with self._lock:
+            if self.target_latency is not None and latency > self.target_latency:
+                value = self.value * self.target_latency / latency
+            else:
+                value = self.value + self.max_tokens // 10
+            self.value = int(min(self.max_tokens, max(self.min_tokens, value)))
+
+    def throttle(self) -> None:
+        """
+        Halves the budget after the provider refused or timed out a request.
+        """
+        with self._lock:
+            self.value = max(self.min_tokens, self.value // 2)
+
+
+def pack(token_counts: list[int], max_tokens: int, max_items: int) -> list[slice]:
+    """
+    Packs consecutive items into batches of at most `max_items` items and
+    `max_tokens` tokens. An item larger than `max_tokens` gets a batch of its own.
+
+    Args:
+        token_counts (list[int]): Token counts of items.
+        max_tokens (int): Maximal number of tokens in a batch.
+        max_items (int): Maximal number of items in a batch.
+
+    Returns:
+        list[slice]: Slices of the items, in order.
+    """
+    batches = []
+    start = 0
+    tokens = 0
+    for i, n_tokens in enumerate(token_counts):
+        if i > start and (i - start >= max_items or tokens + n_tokens > max_tokens):
+            batches.append(slice(start, i))
+            start = i
+            tokens = 0
+        tokens += n_tokens
+    if start < len(token_counts):
+        batches.append(slice(start, len(token_counts)))
+    return batches
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    """
+    Tells whether an error means that the provider throttled a request: HTTP 429
+    (e.g. openai's RateLimitError) or a timeout.
+
+    Args:
+        error (BaseException): Error raised by a client.
+
+    Returns:
+        bool: Whether the request may succeed if retried smaller and later.
+    """
+    for attribute in ("http_status", "status_code", "status"):
+        if getattr(error, attribute, None) == 429:
+            return True
+    return isinstance(error, TimeoutError) or type(error).__name__ in (
+        "RateLimitError",
+        "Timeout",
+        "APITimeoutError",
+        "ReadTimeout",
+        "ConnectTimeout",
+    )
+
+
+class Manifest:
+    """
+    Local record of chunks uploaded to an index namespace (chunk id -> source).
+    It is only valid as long as the namespace is modified through this loader.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.entries: dict[str, str] = {}
+        if self.path.is_file():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def save(self) -> None:
+        """
+        Writes the manifest through a temporary file and an atomic rename.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def delete(self) -> None:
+        """
+        Forgets all entries and removes the manifest file.
+        """
+        self.entries = {}
+        self.path.unlink(missing_ok=True)
+
+
+class Checkpoint:
+    """
+    Journal of an ingestion run, one JSON line per upserted batch with the number
+    of input records committed so far (null if unchanged) and ids of the batch
+    chunks, after a header naming the input. Lines are synced to disk as they are
+    written, so the journal survives a crash; a torn last line is ignored.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._file = None
+
+    def load(self, input_key: str | None = None) -> tuple[int, dict[str, str]]:
+        """
+        Reads the journal of a previous run.
+
+        Args:
+            input_key (str | None, optional): Input of the run to resume. If it
+            does not match the journal header, no records are committed.
+            Defaults to None.
+
+        Returns:
+            tuple[int, dict[str, str]]: Number of committed records and chunk id ->
+            source of upserted chunks.
+        """
+        offset = 0
+        ids = {}
+        header = {}
+        if not self.path.is_file():
+            return offset, ids
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if "input" in entry:
+                    header = entry
+                    offset = entry["offset"]
+                    continue
+                if entry["offset"] is not None:
+                    offset = entry["offset"]
+                ids.update(entry["ids"])
+        if input_key is None or header.get("input") != input_key:
+            offset = 0
+        return offset, ids
+
+    def start(self, input_key: str | None, offset: int = 0) -> None:
+        """
+        Starts a new journal, replacing the previous one.
+
+        Args:
+            input_key (str | None): Input of the run.
+            offset (int, optional): Number of records committed before the run
+            started. Defaults to 0.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._write({"input": input_key, "offset": offset})
+
+    def commit(self, offset: int | None, ids: dict[str, str]) -> None:
+        """
+        Journals an upserted batch.
+
+        Args:
+            offset (int | None): Number of records committed, None if unchanged.
+            ids (dict[str, str]): Chunk id -> source of the batch chunks.
+        """
+        self._write({"offset": offset, "ids": ids})
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def delete(self) -> None:
+        """
+        Removes the journal file.
+        """
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+    def _write(self, entry: dict) -> None:
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+
+def chunk_id(source: str, text: str) -> str:
+    """
+    Returns a deterministic chunk id derived from its source and content.
+
+    Args:
+        source (str): Source the chunk comes from (e.g. file name).
+        text (str): Chunk text.
+
+    Returns:
+        str: Hex id.
+    """
+    key = f"{source}\0{content_hash(text)}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def payload_size(batch: tuple[list, list, list]) -> int:
+    """
+    Returns approximate size of an upsert request: ids and metadata serialized as
+    JSON and values as float32.
+
+    Args:
+        batch (tuple[list, list, list]): Ids, vectors and metadata.
+
+    Returns:
+        int: Size in bytes.
+    """
+    ids, embeds, metadatas = batch
+    size = sum(len(id_) + 4 * len(embed) for id_, embed in zip(ids, embeds))
+    for metadata in metadatas:
+        size += len(json.dumps(metadata, ensure_ascii=False).encode("utf-8"))
+    return size
+
+
+def content_hash(text: str) -> str:
+    """
+    Returns sha256 hex digest of a text.
+
+    Args:
+        text (str): Text to hash.
+
+    Returns:
+        str: Hex digest.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
@@ -1,18 +1,39 @@
 #!/usr/bin/python
-import repackage
+import asyncio
+import atexit
+import threading
 
-repackage.up()
-from langchain.vectorstores import Pinecone
+import repackage
 
 repackage.up()
-from scripts.loader import PineconeIndex, TextProcessing
+from scripts.cache import AnswerCache, SemanticCache
+from scripts.loader import TextProcessing, close_session, get_index
+from scripts.ratelimit import INTERACTIVE
+from scripts.tracing import NULL_TRACE, Trace, get_tracer
 
 repackage.up()
 from config.config import load_config
 
 config = load_config()
-pinecone_index = PineconeIndex()
-text_processing = TextProcessing()
+index = get_index()
+text_processing = TextProcessing(priority=INTERACTIVE)
+answer_cache = (
+    AnswerCache(
+        max_entries=config["answer_cache"]["max_entries"],
+        ttl=config["answer_cache"]["ttl"],
+    )
+    if config.get("answer_cache", {}).get("enabled", False)
+    else None
+)
+semantic_cache = (
+    SemanticCache(
+        max_entries=config["semantic_cache"]["max_entries"],
+        max_distance=config["semantic_cache"]["max_distance"],
+    )
+    if config.get("semantic_cache", {}).get("enabled", False)
+    else None
+)
+tracer = get_tracer()
 
 
 def make_conversation(
@@ -41,29 +62,219 @@ def make_conversation(
     Returns:
         str: Answer for user question.
     """
+    return run_sync(
+        amake_conversation(
+            query,
+            namespace=namespace,
+            threshold=threshold,
+            text_field=text_field,
+            verbose=verbose,
+        )
+    )
+
+
+async def amake_conversation(
+    query: str,
+    namespace: str = None,
+    threshold: float = None,
+    text_field: str = None,
+    verbose: bool = False,
+) -> str:
+    """
+    Async version of `make_conversation`; many calls can be served concurrently
+    from one event loop. Every call is traced (see `tracing.get_tracer`).
+    """
+    with tracer.trace("make_conversation") as trace:
+        with trace.span("normalization"):
+            namespace, threshold, text_field = get_defaults(
+                namespace, threshold, text_field
+            )
+            key = AnswerCache.make_key(query, namespace, threshold, text_field)
+        trace.set(namespace=namespace)
+        if answer_cache is not None:
+            with trace.span("cache_lookup", cache="answer") as span:
+                cached = answer_cache.get(key)
+                span.set(hit=cached is not None)
+            if cached is not None:
+                trace.set(score=cached[1], answer_cache_hit=True)
+                return format_answer(*cached, verbose)
+        with trace.span("embedding"):
+            vector = await text_processing.embed.aembed_query(query)
+        answer, score = await search(vector, namespace, threshold, text_field, trace)
+        trace.set(score=score, answer_cache_hit=False)
+        if answer_cache is not None:
+            answer_cache.put(key, (answer, score))
+        return format_answer(answer, score, verbose)
+
+
+def make_conversations(
+    queries: list[str],
+    namespace: str = None,
+    threshold: float = None,
+    text_field: str = None,
+) -> list[tuple[str, float]]:
+    """
+    Answers many queries at once: embeds all of them in one batched request and
+    runs vector searches concurrently.
+
+    Args:
+        queries (list[str]): User queries.
+        namespace (str, optional): See `make_conversation`. Defaults to None.
+        threshold (float, optional): See `make_conversation`. Defaults to None.
+        text_field (str, optional): See `make_conversation`. Defaults to None.
+
+    Returns:
+        list[tuple[str, float]]: Answers with their scores, in order of queries.
+    """
+    return run_sync(
+        amake_conversations(
+            queries, namespace=namespace, threshold=threshold, text_field=text_field
+        )
+    )
+
+
+async def amake_conversations(
+    queries: list[str],
+    namespace: str = None,
+    threshold: float = None,
+    text_field: str = None,
+) -> list[tuple[str, float]]:
+    """
+    Async version of `make_conversations`.
+    """
+    namespace, threshold, text_field = get_defaults(namespace, threshold, text_field)
+    keys = [AnswerCache.make_key(q, namespace, threshold, text_field) for q in queries]
+    if answer_cache is None:
+        answers = [None] * len(queries)
+    else:
+        answers = [answer_cache.get(key) for key in keys]
+    misses = [i for i, answer in enumerate(answers) if answer is None]
+    if not misses:
+        return answers
+    vectors = await text_processing.embed.aembed_documents([queries[i] for i in misses])
+    results = await asyncio.gather(
+        *(search(vector, namespace, threshold, text_field) for vector in vectors)
+    )
+    for i, result in zip(misses, results):
+        answers[i] = result
+        if answer_cache is not None:
+            answer_cache.put(keys[i], result)
+    return answers
+
+
+async def search(
+    vector: list[float],
+    namespace: str,
+    threshold: float,
+    text_field: str,
+    trace: Trace = NULL_TRACE,
+) -> tuple[str, float]:
+    """
+    Returns an answer for a query embedding from the semantic cache (if enabled and
+    a close enough query was answered before) or from the index.
+
+    Args:
+        vector (list[float]): Query embedding.
+        namespace (str): Namespace to search in.
+        threshold (float): Minimal score of a valid answer.
+        text_field (str): Metadata field with an answer.
+        trace (Trace, optional): Trace to add spans to. Defaults to NULL_TRACE.
+
+    Returns:
+        tuple[str, float]: Answer and score.
+    """
+    if semantic_cache is not None:
+        with trace.span("cache_lookup", cache="semantic") as span:
+            cached = semantic_cache.get(vector, namespace, threshold, text_field)
+            span.set(hit=cached is not None)
+        if cached is not None:
+            return cached
+    with trace.span("vector_search", namespace=namespace) as span:
+        res = await index.aquery(vector, top_k=1, namespace=namespace)
+        span.set(matches=len(res))
+    with trace.span("thresholding", threshold=threshold) as span:
+        answer, score = get_answer(res, threshold, text_field)
+        span.set(score=score, found=bool(res) and score > threshold)
+    if semantic_cache is not None:
+        semantic_cache.put(vector, namespace, threshold, text_field, (answer, score))
+    return answer, score
+
+
+def run_sync(coroutine):
+    """
+    Runs a coroutine to completion in the background event loop shared by the
+    synchronous entry points, so that they reuse its HTTP session (and its pooled
+    connections) and can also be called from a thread running an event loop.
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_loop()).result()
+
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    # started on first use, runs until the interpreter exits
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, daemon=True).start()
+            atexit.register(_close_loop)
+        return _loop
+
+
+def _close_loop() -> None:
+    asyncio.run_coroutine_threadsafe(close_session(), _loop).result(timeout=5)
+    _loop.call_soon_threadsafe(_loop.stop)
+
+
+def get_defaults(
+    namespace: str | None, threshold: float | None, text_field: str | None
+) -> tuple[str, float, str]:
+    """
+    Fills in query parameters that were not given with values from config.json.
+
+    Returns:
+        tuple[str, float, str]: Namespace, threshold and text field.
+    """
     if namespace is None:
         namespace = config["pinecone"]["namespace"]["raw"]
     if threshold is None:
         threshold = config["openai"]["threshold"]
     if text_field is None:
         text_field = config["pinecone"]["target_column"]
-    vectorstore = Pinecone(
-        index=pinecone_index.index,
-        # embedding=text_processing.embed.embed_query,
-        embedding=text_processing.embed,
-        text_key=text_field,
-        namespace=namespace,
-    )
-    res = vectorstore.similarity_search_with_score(query, k=1, namespace=namespace)
-    # res is a list of tuples, where 1st elem is a Document object with 2 attrs:
-    # page_content (str) and metadata (dict) and 2nd is a score (distance from
-    # question to the nearest answer)
-    answer = res[0][0].page_content
+    return namespace, threshold, text_field
+
+
+def get_answer(
+    res: list[tuple[dict, float]], threshold: float, text_field: str
+) -> tuple[str, float]:
+    """
+    Returns the best match if its score exceeds threshold, `Not in KB.` otherwise.
+
+    Args:
+        res (list[tuple[dict, float]]): Result of an index query.
+        threshold (float): Minimal score of a valid answer.
+        text_field (str): Metadata field with an answer.
+
+    Returns:
+        tuple[str, float]: Answer and score.
+    """
+    # res is a list of tuples, where 1st elem is a metadata dict of the nearest
+    # record and 2nd is a score (distance from question to the nearest answer)
+    if not res:
+        return "Not in KB.", 0.0
     score = res[0][1]
     if score > threshold:
-        if verbose:
-            return f"score: {score} {answer}"
-        return answer
+        return res[0][0][text_field], score
+    return "Not in KB.", score
+
+
+def format_answer(answer: str, score: float, verbose: bool = False) -> str:
+    """
+    Formats an answer, prefixed with its score if `verbose`.
+    """
     if verbose:
-        return f"score: {score} Not in KB."
-    return "Not in KB."
+        return f"score: {score} {answer}"
+    return answer
@@ -1,45 +1,321 @@
 #!/usr/bin/python
+import asyncio
+import json
 import os
+import re
+import shutil
+import threading
+import weakref
+from abc import ABC, abstractmethod
+from functools import cached_property
 from pathlib import Path, WindowsPath
-from uuid import uuid4
+from typing import TYPE_CHECKING, Iterable
 
-import pinecone
+import numpy as np
 import repackage
-import tiktoken
-from datasets import Dataset, load_dataset
-from langchain.embeddings.openai import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from pinecone.core.client.exceptions import ApiException, NotFoundException
 from tqdm.auto import tqdm
 
 repackage.up()
 from config.config import load_config
+from scripts.ann import IVFFlat, normalize, recall_report, save_array, top_k_rows
+from scripts.cache import CachedEmbeddings, get_embedding_cache, invalidate_namespace
+from scripts.corpus import read_records
+from scripts.embeddings import get_dimension, get_embeddings
+from scripts.ingestion import Checkpoint, IngestionPipeline, Manifest, TokenBudget
+from scripts.ratelimit import (
+    BULK,
+    INTERACTIVE,
+    RateLimitedEmbeddings,
+    RateLimitedIndex,
+    get_rate_limiter,
+)
+from scripts.splitter import TokenTextSplitter
+
+# heavy dependencies (pinecone, datasets, tiktoken, aiohttp, langchain) are
+# imported on first use, so that commands not needing them start fast
+if TYPE_CHECKING:
+    import aiohttp
+    import tiktoken
+    from datasets import Dataset
 
 config = load_config()
 
 
-class PineconeIndex:
-    def __init__(self, index_name: str | None = None) -> None:
-        pinecone.init(
-            api_key=config["pinecone"]["api_key"], environment=config["pinecone"]["env"]
+class BaseIndex(ABC):
+    """
+    Ingestion and retrieval logic shared by all index backends. Subclasses set
+    `self.index_name` and implement `_connect`, returning a client that exposes the
+    subset of the `pinecone.Index` API used here (`upsert`, `query`, `delete`,
+    `describe_index_stats`).
+    """
+
+    def load_data_into_index(
+        self,
+        path: str | Path | WindowsPath,
+        namespace: str | None = None,
+        resume: bool = False,
+    ):
+        """
+        Loads data to index from a Parquet corpus written by `parser.main` or from a
+        CSV file. The latter operates only on a 1-column file with a header
+        `sentences`.
+
+        Args:
+            path (str | Path | WindowsPath): data file to parse and load into index.
+            resume (bool, optional): Whether to continue an interrupted load of the
+            same (unchanged) file after its last checkpoint. Defaults to False.
+        """
+        string_path = convert_path_to_string(path)
+
+        if namespace is None:
+            namespace = config["pinecone"]["namespace"]["raw"]
+        # a checkpoint is only resumed for the same version of the file
+        stat = os.stat(string_path)
+        input_key = f"{Path(string_path).resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+
+        if string_path.endswith(".parquet"):
+            self.load_records_into_index(
+                tqdm(read_records(string_path), unit="chunk"),
+                namespace,
+                resume=resume,
+                input_key=input_key,
+            )
+            return
+        from datasets import load_dataset
+
+        data = load_dataset("csv", split="train", data_files=string_path, sep=";")
+        target_column = config["pinecone"]["target_column"]
+        source = Path(string_path).name
+        self.load_records_into_index(
+            ({"text": record[target_column], "source": source} for record in tqdm(data)),
+            namespace,
+            resume=resume,
+            input_key=input_key,
+        )
+
+    def load_files_into_index(
+        self,
+        path: str | Path | None = None,
+        namespace: str | None = None,
+        workers: int | None = None,
+    ) -> None:
+        """
+        Parses documents and streams their sentences straight into the index, without
+        the intermediate CSV file. Embedding starts while later files are still
+        being parsed.
+
+        Args:
+            path (str | Path | None, optional): File or directory to parse. If None,
+            the `data` directory. Defaults to None.
+            namespace (str | None, optional): Namespace to load data into. If None,
+            taken from config.json. Defaults to None.
+            workers (int | None, optional): Number of parsing processes. If None,
+            taken from config.json. Defaults to None.
+        """
+        from scripts.parser import iter_records
+
+        if path is not None:
+            path = str(path)
+        self.load_records_into_index(
+            tqdm(iter_records(path, workers=workers), unit="sentence"), namespace
+        )
+
+    def load_records_into_index(
+        self,
+        records: Iterable[dict],
+        namespace: str | None = None,
+        resume: bool = False,
+        input_key: str | None = None,
+    ) -> None:
+        """
+        Splits, embeds and upserts records (dicts with `text` and `source` keys).
+        Upserted batches are checkpointed, so that an interrupted load never embeds
+        them again.
+
+        Args:
+            records (Iterable[dict]): Records to load.
+            namespace (str | None, optional): Namespace to load data into. If None,
+            taken from config.json. Defaults to None.
+            resume (bool, optional): Whether to skip records committed by an
+            interrupted load of the same input. Defaults to False.
+            input_key (str | None, optional): Identifies the input, see
+            `IngestionPipeline.run`. Defaults to None.
+        """
+        if namespace is None:
+            namespace = config["pinecone"]["namespace"]["raw"]
+        batching_config = config.get("embedding_batching", {})
+        index = self.index
+        limiter = get_rate_limiter("index")
+        if limiter is not None:
+            # upserts give way to queries sharing the quota
+            index = RateLimitedIndex(index, limiter, priority=BULK)
+        pipeline = IngestionPipeline(
+            index=index,
+            text_processing=self.text_processing,
+            namespace=namespace,
+            target_column=config["pinecone"]["target_column"],
+            batch_limit=config["general"]["batch_limit"],
+            embed_workers=config["general"].get("embed_workers", 4),
+            upsert_workers=config["general"].get("upsert_workers", 2),
+            queue_size=config["general"].get("queue_size", 8),
+            manifest=self.get_manifest(namespace),
+            token_budget=TokenBudget(
+                max_tokens=batching_config.get("max_tokens", 20000),
+                min_tokens=batching_config.get("min_tokens", 1000),
+                target_latency=batching_config.get("target_latency"),
+            ),
+            max_retries=batching_config.get("max_retries", 3),
+            retry_backoff=batching_config.get("retry_backoff", 1.0),
+            checkpoint=self.get_checkpoint(namespace),
+        )
+        try:
+            upserted = pipeline.run(records, resume=resume, input_key=input_key)
+        finally:
+            invalidate_namespace(namespace)
+        if pipeline.resumed:
+            print(f"Resumed after {pipeline.resumed} records committed before.")
+        print(
+            f"{upserted} vectors uploaded to namespace `{namespace}` "
+            f"({pipeline.skipped} unchanged, {pipeline.deleted} deleted)."
+        )
+
+    def _delete_data(self, namespace: str) -> None:
+        """
+        Deletes all data in a given namespace.
+
+        Args:
+            namespace (str): Namespace to delete data in.
+        """
+        self.index.delete(delete_all=True, namespace=namespace)
+        self.get_manifest(namespace).delete()
+        self.get_checkpoint(namespace).delete()
+        invalidate_namespace(namespace)
+        print(f"All data in namespace `{namespace}` successfully deleted.")
+
+    def query(
+        self, vector: list[float], top_k: int = 1, namespace: str | None = None
+    ) -> list[tuple[dict, float]]:
+        """
+        Returns `top_k` nearest records to a given vector.
+
+        Args:
+            vector (list[float]): Query vector.
+            top_k (int, optional): Number of records to return. Defaults to 1.
+            namespace (str | None, optional): Namespace to search in. Defaults to None.
+
+        Returns:
+            list[tuple[dict, float]]: Metadata of matched records with their scores,
+            best match first.
+        """
+        limiter = get_rate_limiter("index")
+        if limiter is not None:
+            limiter.acquire(priority=INTERACTIVE)
+        return self._query(vector, top_k, namespace)
+
+    async def aquery(
+        self, vector: list[float], top_k: int = 1, namespace: str | None = None
+    ) -> list[tuple[dict, float]]:
+        """
+        Async version of `query`. Backends without network I/O answer in place.
+        """
+        limiter = get_rate_limiter("index")
+        if limiter is not None:
+            await limiter.aacquire(priority=INTERACTIVE)
+        return self._query(vector, top_k, namespace)
+
+    def _query(
+        self, vector: list[float], top_k: int, namespace: str | None
+    ) -> list[tuple[dict, float]]:
+        res = self.index.query(
+            vector=vector, top_k=top_k, namespace=namespace, include_metadata=True
+        )
+        return [(match.get("metadata", {}), match["score"]) for match in res["matches"]]
+
+    def get_manifest(self, namespace: str) -> Manifest:
+        """
+        Returns the local manifest of chunks uploaded to a namespace of this index.
+
+        Args:
+            namespace (str): Namespace.
+
+        Returns:
+            Manifest: Manifest.
+        """
+        return Manifest(
+            self._manifest_dir().joinpath(f"{_namespace_file_name(namespace)}.json")
+        )
+
+    def get_checkpoint(self, namespace: str) -> Checkpoint:
+        """
+        Returns the checkpoint journal of loads into a namespace of this index,
+        kept next to its manifest.
+
+        Args:
+            namespace (str): Namespace.
+
+        Returns:
+            Checkpoint: Checkpoint.
+        """
+        return Checkpoint(
+            self._manifest_dir().joinpath(
+                f"{_namespace_file_name(namespace)}.checkpoint.jsonl"
+            )
+        )
+
+    def _manifest_dir(self) -> Path:
+        return Path(__file__).parent.parent.joinpath(
+            config.get("manifest", {}).get("path", "manifests"), self.index_name
         )
+
+    @property
+    def index(self):
+        # connected on first use, like text_processing
+        if getattr(self, "_index", None) is None:
+            self._index = self._connect()
+        return self._index
+
+    @abstractmethod
+    def _connect(self):
+        """
+        Returns a client of the index backend. Called on first use of `index`.
+        """
+
+    @property
+    def text_processing(self) -> "TextProcessing":
+        # one tokenizer and embeddings client per index, shared by all batches
+        if getattr(self, "_text_processing", None) is None:
+            self._text_processing = TextProcessing()
+        return self._text_processing
+
+    def __info__(self):
+        return self.index.describe_index_stats()
+
+
+class PineconeIndex(BaseIndex):
+    def __init__(self, index_name: str | None = None) -> None:
         if index_name is None:
             self.index_name = config["pinecone"]["index_name"]
         else:
             self.index_name = index_name
+
+    def _connect(self):
+        pinecone = get_pinecone()
         # if self.index_name not in pinecone.list_indexes():
         #     self.create_index()
-        self.index = pinecone.Index(self.index_name)
+        return pinecone.Index(self.index_name)
 
     def create_index(self) -> None:
         """
         Creates index if not exists.
         """
+        pinecone = get_pinecone()
+        from pinecone.core.client.exceptions import ApiException
+
         try:
             pinecone.create_index(
                 name=self.index_name,
                 metric="cosine",
-                dimension=1536,
+                dimension=get_dimension(),
             )
             print(f"Index `{self.index_name}` created.")
         except ApiException:
@@ -49,97 +325,563 @@ class PineconeIndex:
         """
         Deletes index.
         """
+        pinecone = get_pinecone()
+        from pinecone.core.client.exceptions import NotFoundException
+
         try:
             pinecone.delete_index(self.index_name)
+            shutil.rmtree(self._manifest_dir(), ignore_errors=True)
             print(f"Index `{self.index_name}` deleted.")
         except NotFoundException:
             print(f"Index `{self.index_name}` not found.")
 
-    def load_data_into_index(
-        self, path: str | Path | WindowsPath, namespace: str | None = None
-    ):
+    async def aquery(
+        self, vector: list[float], top_k: int = 1, namespace: str | None = None
+    ) -> list[tuple[dict, float]]:
+        """
+        Async version of `query`, calling Pinecone REST API with aiohttp.
+        """
+        limiter = get_rate_limiter("index")
+        if limiter is not None:
+            await limiter.aacquire(priority=INTERACTIVE)
+        async with get_session().post(
+            f"{self.index.configuration.host}/query",
+            headers={"Api-Key": config["pinecone"]["api_key"]},
+            json={
+                "vector": list(vector),
+                "topK": top_k,
+                "namespace": namespace or "",
+                "includeMetadata": True,
+            },
+        ) as response:
+            response.raise_for_status()
+            res = await response.json()
+        return [(match.get("metadata", {}), match["score"]) for match in res["matches"]]
+
+    def __repr__(self):
+        return get_pinecone().describe_index(self.index_name)
+
+
+class LocalIndex(BaseIndex):
+    """
+    In-process index kept in NumPy matrices and persisted to a local directory.
+    Drop-in replacement for PineconeIndex that needs no network connection.
+    """
+
+    def __init__(
+        self, index_name: str | None = None, path: str | Path | None = None
+    ) -> None:
+        if index_name is None:
+            self.index_name = config["pinecone"]["index_name"]
+        else:
+            self.index_name = index_name
+        if path is None:
+            path = Path(__file__).parent.parent.joinpath(
+                config["local_index"]["path"], self.index_name
+            )
+        self.path = Path(path)
+
+    def _connect(self) -> "LocalVectorStore":
+        return LocalVectorStore(
+            self.path,
+            mmap=config["local_index"].get("mmap", True),
+            nprobe=config["local_index"].get("nprobe", 8),
+        )
+
+    def create_index(self) -> None:
+        """
+        Creates index directory if not exists.
         """
-        Loads data to index from a CSV file. Operates only on a 1-column file
-        with a header `sentences`.
+        if self.path.is_dir():
+            print(f"Index `{self.index_name}` already exists.")
+        else:
+            self.path.mkdir(parents=True)
+            print(f"Index `{self.index_name}` created.")
+
+    def _delete_index(self) -> None:
+        """
+        Deletes index directory together with all namespaces.
+        """
+        if self.path.is_dir():
+            shutil.rmtree(self.path)
+            shutil.rmtree(self._manifest_dir(), ignore_errors=True)
+            # reopened empty on next use
+            self._index = None
+            print(f"Index `{self.index_name}` deleted.")
+        else:
+            print(f"Index `{self.index_name}` not found.")
+
+    def load_records_into_index(
+        self,
+        records: Iterable[dict],
+        namespace: str | None = None,
+        resume: bool = False,
+        input_key: str | None = None,
+    ) -> None:
+        if namespace is None:
+            namespace = config["pinecone"]["namespace"]["raw"]
+        self._check_checkpoint(namespace)
+        try:
+            super().load_records_into_index(records, namespace, resume, input_key)
+        except BaseException:
+            # the vectorstore is kept in memory, save what the checkpoint and the
+            # manifest record as upserted
+            self.index.save(namespace)
+            raise
+        ns = self.index.namespaces.get(namespace)
+        min_vectors = config["local_index"].get("ann_min_vectors", 10000)
+        if ns is not None and ns.size >= min_vectors:
+            # rebuild once a tenth of the namespace has been appended after the
+            # last build, as the unindexed tail is scanned exactly on every query
+            if ns.ivf is None or ns.size - ns.ivf.indexed > ns.size // 10:
+                self.build_ann(namespace)
+                return
+        self.index.save(namespace)
+
+    def _check_checkpoint(self, namespace: str) -> None:
+        """
+        Discards the checkpoint of a load killed before the vectorstore was saved:
+        its journal lists chunks that never reached disk, and trusting it would
+        skip them forever. Chunks saved before are in the manifest, so starting over
+        embeds only the lost ones.
 
         Args:
-            path (str | Path | WindowsPath): data file to parse and load into index.
+            namespace (str): Namespace.
         """
-        string_path = convert_path_to_string(path)
+        checkpoint = self.get_checkpoint(namespace)
+        _, ids = checkpoint.load()
+        ns = self.index.namespaces.get(namespace or "")
+        positions = ns.positions if ns is not None else {}
+        if any(id_ not in positions for id_ in ids):
+            checkpoint.delete()
+            print(
+                f"Checkpoint of namespace `{namespace}` discarded, the interrupted "
+                "load was not saved."
+            )
 
+    def build_ann(self, namespace: str | None = None) -> None:
+        """
+        Builds an IVF index on a namespace and persists it.
+
+        Args:
+            namespace (str | None, optional): Namespace to index. If None, taken from
+            config.json. Defaults to None.
+        """
         if namespace is None:
             namespace = config["pinecone"]["namespace"]["raw"]
+        self.index.build_ann(namespace, nlist=config["local_index"].get("nlist"))
+        self.index.save(namespace)
+        print(f"ANN index built on namespace `{namespace}`.")
+
+    def ann_report(self, namespace: str | None = None, top_k: int = 10) -> list[dict]:
+        """
+        Returns recall@k and latency of the ANN index for several nprobe values,
+        measured against exact search on the same namespace.
+
+        Args:
+            namespace (str | None, optional): Namespace to evaluate. If None, taken
+            from config.json. Defaults to None.
+            top_k (int, optional): k in recall@k. Defaults to 10.
+
+        Returns:
+            list[dict]: Rows with `nprobe`, `recall` and `latency_ms`.
+        """
+        if namespace is None:
+            namespace = config["pinecone"]["namespace"]["raw"]
+        return self.index.ann_report(namespace, top_k=top_k)
+
+    def _delete_data(self, namespace: str) -> None:
+        super()._delete_data(namespace)
+        self.index.save(namespace)
+
+    def __repr__(self):
+        return f"LocalIndex(name={self.index_name}, path={self.path})"
 
-        data = load_dataset("csv", split="train", data_files=string_path, sep=";")
-        target_column = config["pinecone"]["target_column"]
-        texts = []
-        metadatas = []
 
-        for _, record in enumerate(tqdm(data)):
-            # first get metadata fields for this record
-            metadata = {target_column: record[target_column]}
+class LocalVectorStore:
+    """
+    Minimal in-memory counterpart of `pinecone.Index`. Every namespace is one
+    contiguous float32 matrix of L2-normalized vectors, so cosine top-k is a single
+    matrix-vector product. Namespaces with an IVF index built on them are searched
+    approximately, scanning only `nprobe` lists.
+    """
 
-            # now we create chunks from the record text
-            record_texts = TextProcessing().text_splitter.split_text(
-                record[target_column]
+    def __init__(
+        self, path: str | Path | None = None, mmap: bool = False, nprobe: int = 8
+    ) -> None:
+        self.path = None if path is None else Path(path)
+        self.nprobe = nprobe
+        self.namespaces: dict[str, _Namespace] = {}
+        # upserts come from several ingestion workers at once
+        self._lock = threading.RLock()
+        if self.path is not None and self.path.is_dir():
+            for file_path in sorted(self.path.glob("*.json")):
+                name, ns = _Namespace.load(self.path, file_path.stem, mmap=mmap)
+                self.namespaces[name] = ns
+
+    def upsert(self, vectors, namespace: str | None = None, **kwargs) -> dict:
+        """
+        Inserts or overwrites vectors given as (id, values, metadata) tuples.
+        """
+        namespace = namespace or ""
+        vectors = list(vectors)
+        if not vectors:
+            return {"upserted_count": 0}
+        ids = [vector[0] for vector in vectors]
+        values = np.asarray([vector[1] for vector in vectors], dtype=np.float32)
+        metadatas = [vector[2] if len(vector) > 2 else {} for vector in vectors]
+        with self._lock:
+            if namespace not in self.namespaces:
+                self.namespaces[namespace] = _Namespace(values.shape[1])
+            self.namespaces[namespace].upsert(ids, values, metadatas)
+        return {"upserted_count": len(ids)}
+
+    def query(
+        self,
+        vector: list[float],
+        top_k: int = 1,
+        namespace: str | None = None,
+        include_metadata: bool = True,
+        nprobe: int | None = None,
+        **kwargs,
+    ) -> dict:
+        """
+        Cosine search (exact, or IVF if built). Returns a dict shaped like a Pinecone
+        QueryResponse.
+        """
+        with self._lock:
+            ns = self.namespaces.get(namespace or "")
+            if ns is None or ns.size == 0:
+                return {"matches": [], "namespace": namespace}
+            rows, scores = ns.search(
+                np.asarray(vector, dtype=np.float32), top_k, nprobe or self.nprobe
             )
+            matches = []
+            for row, score in zip(rows, scores):
+                match = {"id": ns.ids[row], "score": float(score)}
+                if include_metadata:
+                    match["metadata"] = dict(ns.metadata[row])
+                matches.append(match)
+        return {"matches": matches, "namespace": namespace}
+
+    def delete(
+        self,
+        ids: list[str] | None = None,
+        delete_all: bool = False,
+        namespace: str | None = None,
+        **kwargs,
+    ) -> dict:
+        """
+        Deletes given ids or, if `delete_all`, the whole namespace.
+        """
+        namespace = namespace or ""
+        with self._lock:
+            if delete_all:
+                self.namespaces.pop(namespace, None)
+            elif ids and namespace in self.namespaces:
+                self.namespaces[namespace].delete(ids)
+        return {}
+
+    def describe_index_stats(self) -> dict:
+        namespaces = {
+            name: {"vector_count": ns.size} for name, ns in self.namespaces.items()
+        }
+        dimensions = [ns.dimension for ns in self.namespaces.values()]
+        return {
+            "dimension": dimensions[0] if dimensions else 0,
+            "namespaces": namespaces,
+            "total_vector_count": sum(ns.size for ns in self.namespaces.values()),
+        }
+
+    def build_ann(self, namespace: str | None = None, nlist: int | None = None) -> None:
+        """
+        Builds (or rebuilds) an IVF index on a namespace.
+
+        Args:
+            namespace (str | None, optional): Namespace to index. Defaults to None.
+            nlist (int | None, optional): Number of IVF lists. If None, sqrt of the
+            number of vectors. Defaults to None.
+        """
+        with self._lock:
+            ns = self.namespaces.get(namespace or "")
+            if ns is not None and ns.size > 0:
+                ns.build_ivf(nlist)
+
+    def ann_report(
+        self,
+        namespace: str | None = None,
+        top_k: int = 10,
+        nprobes: list[int] | None = None,
+        n_queries: int = 100,
+        seed: int = 0,
+    ) -> list[dict]:
+        """
+        Measures recall@k of the IVF index of a namespace against exact search,
+        using vectors sampled from the namespace as queries.
+
+        Args:
+            namespace (str | None, optional): Namespace to evaluate. Defaults to None.
+            top_k (int, optional): k in recall@k. Defaults to 10.
+            nprobes (list[int] | None, optional): nprobe values to evaluate.
+            Defaults to None.
+            n_queries (int, optional): Number of sampled queries. Defaults to 100.
+            seed (int, optional): Random seed. Defaults to 0.
 
-            # create individual metadata dicts for each chunk
-            record_metadatas = [
-                {"chunk": j, target_column: text, **metadata}
-                for j, text in enumerate(record_texts)
-            ]
-            # append these to current batches
-            texts.extend(record_texts)
-            metadatas.extend(record_metadatas)
-            # if we have reached the batch_limit we can add texts
-            if len(texts) >= config["general"]["batch_limit"]:
-                ids = [str(uuid4()) for _ in range(len(texts))]
-                embeds = TextProcessing().embed.embed_documents(texts)
-                self.index.upsert(
-                    vectors=zip(ids, embeds, metadatas), namespace=namespace
-                )
-                texts = []
-                metadatas = []
-
-        if len(texts) > 0:
-            ids = [str(uuid4()) for _ in range(len(texts))]
-            embeds = TextProcessing().embed.embed_documents(texts)
-            self.index.upsert(vectors=zip(ids, embeds, metadatas), namespace=namespace)
-        print(f"{len(data)} vectors uploaded to namespace `{namespace}`.")
+        Raises:
+            ValueError: If there is no IVF index built on the namespace.
 
-    def _delete_data(self, namespace: str) -> None:
+        Returns:
+            list[dict]: See `ann.recall_report`.
         """
-        Deletes all data in a given namespace.
+        ns = self.namespaces.get(namespace or "")
+        if ns is None or ns.ivf is None:
+            raise ValueError(f"No ANN index built on namespace `{namespace}`.")
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(ns.size, min(n_queries, ns.size), replace=False)
+        queries = np.asarray(ns.vectors[np.sort(rows)])
+        return recall_report(ns.vectors, ns.ivf, queries, top_k=top_k, nprobes=nprobes)
+
+    def save(self, namespace: str | None = None) -> None:
+        """
+        Writes a namespace to disk (or removes its files if it was deleted).
 
         Args:
-            namespace (str): Namespace to delete data in.
+            namespace (str | None, optional): Namespace to persist. If None, all
+            namespaces are persisted. Defaults to None.
         """
-        self.index.delete(delete_all=True, namespace=namespace)
-        print(f"All data in namespace `{namespace}` successfully deleted.")
+        if self.path is None:
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            names = list(self.namespaces) if namespace is None else [namespace or ""]
+            for name in names:
+                if name in self.namespaces:
+                    self.namespaces[name].save(self.path, name)
+                else:
+                    file_name = _namespace_file_name(name)
+                    self.path.joinpath(f"{file_name}.json").unlink(missing_ok=True)
+                    _remove_stale_files(self.path, file_name)
+
+
+class _Namespace:
+    def __init__(self, dimension: int, capacity: int = 1024) -> None:
+        self.dimension = dimension
+        self._vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        self.size = 0
+        self.ids: list[str] = []
+        self.metadata: list[dict] = []
+        self.positions: dict[str, int] = {}
+        self.ivf: IVFFlat | None = None
+        # number of the files the namespace was last saved to
+        self.generation = 0
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[: self.size]
+
+    def upsert(self, ids: list[str], values: np.ndarray, metadatas: list[dict]) -> None:
+        if values.shape[1] != self.dimension:
+            raise ValueError(
+                f"Vector dimension {values.shape[1]} does not match index dimension "
+                f"{self.dimension}."
+            )
+        if not self._vectors.flags.writeable:
+            # memory-mapped read-only: copy into process memory before writing
+            self._vectors = np.array(self._vectors)
+        values = normalize(values)
+        for id_, vector, metadata in zip(ids, values, metadatas):
+            row = self.positions.get(id_)
+            if row is None:
+                row = self.size
+                self._reserve(row + 1)
+                self.size += 1
+                self.ids.append(id_)
+                self.metadata.append(metadata)
+                self.positions[id_] = row
+            else:
+                self.metadata[row] = metadata
+            self._vectors[row] = vector
+
+    def delete(self, ids: list[str]) -> None:
+        rows = [self.positions[id_] for id_ in ids if id_ in self.positions]
+        if not rows:
+            return
+        keep = np.ones(self.size, dtype=bool)
+        keep[rows] = False
+        self._vectors = np.ascontiguousarray(self.vectors[keep])
+        self.size = len(self._vectors)
+        self.ids = [id_ for id_, k in zip(self.ids, keep) if k]
+        self.metadata = [metadata for metadata, k in zip(self.metadata, keep) if k]
+        self.positions = {id_: row for row, id_ in enumerate(self.ids)}
+        if self.ivf is not None:
+            self.ivf.remove_rows(keep)
+
+    def search(
+        self, vector: np.ndarray, top_k: int, nprobe: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        vector = normalize(vector)
+        if self.ivf is not None and nprobe and nprobe < self.ivf.nlist:
+            return self.ivf.search(self.vectors, vector, top_k, nprobe)
+        return top_k_rows(self.vectors @ vector, top_k)
+
+    def build_ivf(self, nlist: int | None = None) -> None:
+        self.ivf, order = IVFFlat.build(self.vectors, nlist)
+        self._vectors = np.ascontiguousarray(self.vectors[order])
+        self.ids = [self.ids[row] for row in order]
+        self.metadata = [self.metadata[row] for row in order]
+        self.positions = {id_: row for row, id_ in enumerate(self.ids)}
+
+    def _reserve(self, size: int) -> None:
+        if size <= len(self._vectors):
+            return
+        grown = np.zeros((max(size, 2 * len(self._vectors)), self.dimension), np.float32)
+        grown[: self.size] = self.vectors
+        self._vectors = grown
+
+    def save(self, path: Path, name: str) -> None:
+        file_name = _namespace_file_name(name)
+        # vectors and the IVF index go to new files named after the next generation
+        # and the json pointing at them is renamed last, so that the rename is the
+        # single commit point: a crash before it leaves the previous generation
+        # intact, and no file memory-mapped by a running process is ever replaced
+        # a namespace deleted and filled again starts from generation 0, files of
+        # the one on disk must not be overwritten either
+        generation = 1 + max(
+            [self.generation]
+            + [gen or 0 for _, gen in _generation_files(path, file_name)]
+        )
+        generation_name = f"{file_name}.{generation}"
+        save_array(path.joinpath(f"{generation_name}.npy"), self.vectors)
+        if self.ivf is not None:
+            self.ivf.save(path, generation_name)
+        json_path = path.joinpath(f"{file_name}.json")
+        tmp_path = json_path.with_name(f"{json_path.name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            data = {
+                "namespace": name,
+                "generation": generation,
+                "ids": self.ids,
+                "metadata": self.metadata,
+            }
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, json_path)
+        self.generation = generation
+        _remove_stale_files(path, file_name, generation)
+
+    @classmethod
+    def load(
+        cls, path: Path, file_name: str, mmap: bool = False
+    ) -> tuple[str, "_Namespace"]:
+        with open(path.joinpath(f"{file_name}.json"), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        generation = data.get("generation")
+        # stores saved before generations were introduced have a single set of files
+        generation_name = file_name if generation is None else f"{file_name}.{generation}"
+        # with mmap the matrix stays in the page cache, shared by all processes
+        # that serve the same index, until a process modifies it
+        mmap_mode = "r" if mmap else None
+        vectors = np.load(path.joinpath(f"{generation_name}.npy"), mmap_mode=mmap_mode)
+        if not len(data["ids"]) == len(data["metadata"]) == len(vectors):
+            raise ValueError(
+                f"Files of namespace `{data['namespace']}` in `{path}` are inconsistent: "
+                f"{len(data['ids'])} ids, {len(data['metadata'])} metadata and "
+                f"{len(vectors)} vectors. Reload the namespace."
+            )
+        ns = cls(vectors.shape[1], capacity=0)
+        ns._vectors = vectors
+        ns.size = len(vectors)
+        ns.ids = data["ids"]
+        ns.metadata = data["metadata"]
+        ns.positions = {id_: row for row, id_ in enumerate(ns.ids)}
+        ns.generation = generation or 0
+        ns.ivf = IVFFlat.load(path, generation_name, mmap=mmap)
+        if ns.ivf is not None and ns.ivf.indexed > ns.size:
+            # built for other vectors: search exactly until the index is rebuilt
+            print(
+                f"IVF index of namespace `{data['namespace']}` does not match its "
+                "vectors and is ignored."
+            )
+            ns.ivf = None
+        return data["namespace"], ns
+
+
+def _generation_files(path: Path, file_name: str) -> Iterable[tuple[Path, int | None]]:
+    # vector and IVF files of a namespace with their generation (None for files
+    # saved before generations were introduced)
+    pattern = re.compile(
+        rf"{re.escape(file_name)}(?:\.(\d+))?\.(?:centroids\.|offsets\.)?npy"
+    )
+    for file_path in path.iterdir():
+        match = pattern.fullmatch(file_path.name)
+        if match is not None:
+            generation = match.group(1)
+            yield file_path, None if generation is None else int(generation)
+
+
+def _remove_stale_files(
+    path: Path, file_name: str, generation: int | None = None
+) -> None:
+    # files of generations other than `generation` (all of them if None)
+    for file_path, file_generation in list(_generation_files(path, file_name)):
+        if generation is not None and file_generation == generation:
+            continue
+        try:
+            file_path.unlink()
+        except OSError:
+            # on Windows a file memory-mapped by a running process cannot be
+            # removed; it is removed by a later save
+            pass
 
-    def __repr__(self):
-        return pinecone.describe_index(self.index_name)
 
-    def __info__(self):
-        return self.index.describe_index_stats()
+def _namespace_file_name(namespace: str) -> str:
+    # Pinecone's default namespace is an empty string
+    return namespace or "__default__"
 
 
 class TextProcessing:
-    def __init__(self) -> None:
-        self.tokenizer = tiktoken.get_encoding(config["tiktoken"]["encoding"])
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=400,
-            chunk_overlap=20,
-            length_function=self.tiktoken_len,
+    """
+    Tokenizer, text splitter and embeddings client, each created on first use.
+    Embedding requests are rate limited (if set in config.json) with a given
+    priority: INTERACTIVE for chatbot queries, BULK for ingestion.
+    """
+
+    def __init__(self, priority: int = BULK) -> None:
+        self.priority = priority
+
+    @cached_property
+    def tokenizer(self) -> "tiktoken.Encoding":
+        import tiktoken
+
+        return tiktoken.get_encoding(config["tiktoken"]["encoding"])
+
+    @cached_property
+    def text_splitter(self) -> TokenTextSplitter:
+        splitter_config = config.get("text_splitter", {})
+        return TokenTextSplitter(
+            self.tokenizer,
+            chunk_size=splitter_config.get("chunk_size", 400),
+            chunk_overlap=splitter_config.get("chunk_overlap", 20),
             separators=["\n\n", "\n", " ", ""],
         )
-        self.embed = OpenAIEmbeddings(
-            model=config["openai"]["model_name"],
-            openai_api_key=config["openai"]["api_key"],
-        )
 
-    def get_split_text(self, data: Dataset) -> RecursiveCharacterTextSplitter:
+    @cached_property
+    def embed(self):
+        embed = get_embeddings()
+        model_name = embed.model
+        limiter = get_rate_limiter("embeddings")
+        if limiter is not None:
+            # inside the cache, so that cache hits take no tokens
+            embed = RateLimitedEmbeddings(embed, limiter, priority=self.priority)
+        cache_config = config.get("embedding_cache", {})
+        if cache_config.get("enabled", False):
+            cache = get_embedding_cache(
+                Path(__file__).parent.parent.joinpath(cache_config["path"]),
+                max_entries=cache_config["max_entries"],
+            )
+            embed = CachedEmbeddings(embed, cache, model_name=model_name)
+        return embed
+
+    def get_split_text(self, data: "Dataset") -> list[str]:
         """
         Splits text into chunks.
 
@@ -147,7 +889,7 @@ class TextProcessing:
             data (Dataset): Dataset to apply split on.
 
         Returns:
-            RecursiveCharacterTextSplitter: _description_
+            list[str]: First 3 chunks of the first record.
         """
         target_column = config["pinecone"]["target_column"]
         return self.text_splitter.split_text(data[0][target_column])[:3]
@@ -166,6 +908,80 @@ class TextProcessing:
         return len(tokens)
 
 
+# one aiohttp session per event loop, as sessions cannot be shared between loops
+_sessions: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def get_session() -> "aiohttp.ClientSession":
+    """
+    Returns an aiohttp session shared by all requests made in the running event loop.
+
+    Returns:
+        aiohttp.ClientSession: Session.
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        import aiohttp
+
+        session = _sessions[loop] = aiohttp.ClientSession()
+    return session
+
+
+async def close_session() -> None:
+    """
+    Closes the aiohttp session of the running event loop, if any.
+    """
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+_pinecone_initialized = False
+
+
+def get_pinecone():
+    """
+    Imports and initializes the pinecone client on first use.
+
+    Returns:
+        module: `pinecone` module.
+    """
+    import pinecone
+
+    global _pinecone_initialized
+    if not _pinecone_initialized:
+        pinecone.init(
+            api_key=config["pinecone"]["api_key"], environment=config["pinecone"]["env"]
+        )
+        _pinecone_initialized = True
+    return pinecone
+
+
+def get_index(index_name: str | None = None) -> BaseIndex:
+    """
+    Returns an index of the backend selected in config.json (`general.vectorstore`):
+    `pinecone` (default) or `local`.
+
+    Args:
+        index_name (str | None, optional): Index name. If None, taken from
+        config.json. Defaults to None.
+
+    Raises:
+        ValueError: If the backend is unknown.
+
+    Returns:
+        BaseIndex: PineconeIndex or LocalIndex.
+    """
+    backend = config["general"].get("vectorstore", "pinecone")
+    if backend == "pinecone":
+        return PineconeIndex(index_name)
+    elif backend == "local":
+        return LocalIndex(index_name)
+    else:
+        raise ValueError(f"Unknown vectorstore `{backend}`.")
+
+
 def convert_path_to_string(path: str | Path | WindowsPath) -> str:
     """
     Converts Path or WindowsPath to string.
@@ -194,4 +1010,4 @@ def convert_path_to_string(path: str | Path | WindowsPath) -> str:
 if __name__ == "__main__":
     target_filename = config["pinecone"]["target_filename"]["raw"]
     path = Path(__file__).parent.parent.joinpath(target_filename)
-    PineconeIndex().load_data_into_index(path)
+    get_index().load_data_into_index(path)
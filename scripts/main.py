@@ -1,8 +1,7 @@
 #!/usr/bin/python
-from interface import make_conversation
+from interface import format_answer, make_conversations
 
 
-# TODO: add possiblity to deal with multiple questions from users
 def main(verbose: bool = False):
     queries = [
         "Jakie powinny być marginesy w pracy?",
@@ -13,10 +12,10 @@ def main(verbose: bool = False):
         "Ile mieszkańców ma Warszawa?",
     ]
 
-    for query in queries:
+    for query, (answer, score) in zip(queries, make_conversations(queries)):
         print(100 * "#")
         print(query)
-        print(make_conversation(query=query, verbose=verbose))
+        print(format_answer(answer, score, verbose=verbose))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,266 @@
+#!/usr/bin/python
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import repackage
+
+repackage.up()
+from config.config import load_config
+
+config = load_config()
+
+# name -> (type, help) of metrics reported by the project, in report order
+DESCRIPTIONS = {
+    "files_parsed_total": ("counter", "Files parsed, by file type and status."),
+    "parse_seconds": ("summary", "Parse time of a file, by file type."),
+    "records_total": ("counter", "Records (parsed sentences, CSV rows) ingested."),
+    "chunks_total": ("counter", "Chunks produced by the text splitter."),
+    "tokens_total": ("counter", "Tokens in chunks produced by the text splitter."),
+    "chunks_skipped_total": ("counter", "Chunks already in the index (manifest)."),
+    "chunks_deleted_total": ("counter", "Chunks no longer produced, deleted."),
+    "split_seconds": ("summary", "Time to split a group of records."),
+    "producer_wait_seconds": (
+        "counter",
+        "Time the producer waited for room in the embed queue (backpressure).",
+    ),
+    "embedding_requests_total": ("counter", "Embedding requests."),
+    "embedding_seconds": ("summary", "Latency of an embedding request."),
+    "embedding_batch_size": ("summary", "Texts per embedding request."),
+    "embedding_batch_tokens": ("summary", "Tokens per embedding request."),
+    "upsert_requests_total": ("counter", "Upsert requests."),
+    "upsert_seconds": ("summary", "Latency of an upsert request."),
+    "upsert_payload_bytes": (
+        "summary",
+        "Approximate upsert request size (ids and metadata as JSON, float32 values).",
+    ),
+    "retries_total": ("counter", "Requests retried, by stage."),
+    "rate_limit_wait_seconds": (
+        "counter",
+        "Time spent waiting for a rate limiter, by limiter and priority.",
+    ),
+    "errors_total": ("counter", "Failed operations, by stage."),
+    "ingestion_seconds": ("summary", "Wall time of an ingestion run."),
+}
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters and summaries (count, sum, min and max of
+    observed values), with optional labels. Reported in Prometheus text format
+    (`to_prometheus`) and as a JSON-serializable summary (`summary`).
+    """
+
+    def __init__(self, prefix: str = "chatbot") -> None:
+        self.prefix = prefix
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._summaries: dict[str, dict[tuple, list[float]]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Increments a counter.
+
+        Args:
+            name (str): Metric name.
+            value (float, optional): Increment. Defaults to 1.
+            **labels: Label values of the series.
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """
+        Records an observation (e.g. latency or size) in a summary.
+
+        Args:
+            name (str): Metric name.
+            value (float): Observed value.
+            **labels: Label values of the series.
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._summaries.setdefault(name, {})
+            if key not in series:
+                series[key] = [0, 0.0, math.inf, -math.inf]
+            stats = series[key]
+            stats[0] += 1
+            stats[1] += value
+            stats[2] = min(stats[2], value)
+            stats[3] = max(stats[3], value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """
+        Observes wall time of the `with` block in seconds, also if it raises.
+
+        Args:
+            name (str): Metric name.
+            **labels: Label values of the series.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self) -> None:
+        """
+        Drops all recorded values.
+        """
+        with self._lock:
+            self._counters = {}
+            self._summaries = {}
+
+    def summary(self) -> dict:
+        """
+        Returns recorded values: counters as numbers and summaries as dicts with
+        `count`, `sum`, `mean`, `min` and `max`. Series with labels are keyed by
+        their labels (`key=value,...`).
+
+        Returns:
+            dict: Metric name -> value, or label string -> value.
+        """
+        counters, summaries = self._snapshot()
+        result = {}
+        for name in _ordered(counters.keys() | summaries.keys()):
+            if name in counters:
+                values = counters[name]
+            else:
+                values = {
+                    key: {
+                        "count": count,
+                        "sum": total,
+                        "mean": total / count,
+                        "min": low,
+                        "max": high,
+                    }
+                    for key, (count, total, low, high) in summaries[name].items()
+                }
+            if list(values) == [()]:
+                result[name] = values[()]
+            else:
+                result[name] = {
+                    ",".join(f"{k}={v}" for k, v in key): value
+                    for key, value in sorted(values.items())
+                }
+        return result
+
+    def to_prometheus(self) -> str:
+        """
+        Returns recorded values in Prometheus text exposition format. Summaries are
+        exposed as `_count` and `_sum` series.
+
+        Returns:
+            str: Exposition text.
+        """
+        counters, summaries = self._snapshot()
+        lines = []
+        for name in _ordered(counters.keys() | summaries.keys()):
+            full_name = f"{self.prefix}_{name}"
+            kind = "counter" if name in counters else "summary"
+            description = DESCRIPTIONS.get(name, (kind, name))[1]
+            lines.append(f"# HELP {full_name} {description}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            if name in counters:
+                for key, value in sorted(counters[name].items()):
+                    lines.append(f"{full_name}{_labels(key)} {_number(value)}")
+            else:
+                for key, (count, total, _, _) in sorted(summaries[name].items()):
+                    lines.append(f"{full_name}_count{_labels(key)} {count}")
+                    lines.append(f"{full_name}_sum{_labels(key)} {_number(total)}")
+        return "\n".join(lines) + "\n"
+
+    def _snapshot(self) -> tuple[dict, dict]:
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            summaries = {
+                name: {key: list(stats) for key, stats in series.items()}
+                for name, series in self._summaries.items()
+            }
+        return counters, summaries
+
+    def save(self, directory: str | Path, name: str = "ingestion") -> None:
+        """
+        Writes `{name}.prom` (e.g. for node exporter's textfile collector) and
+        `{name}.json` to a directory, each through a temporary file and an atomic
+        rename.
+
+        Args:
+            directory (str | Path): Directory to write to.
+            name (str, optional): Base name of the files. Defaults to "ingestion".
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for suffix, content in (
+            (".prom", self.to_prometheus()),
+            (".json", json.dumps(self.summary(), indent=4)),
+        ):
+            file_path = directory.joinpath(f"{name}{suffix}")
+            tmp_path = file_path.with_name(f"{file_path.name}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp_path, file_path)
+
+
+def _ordered(names) -> list[str]:
+    # known metrics in order of DESCRIPTIONS, the rest alphabetically
+    order = {name: i for i, name in enumerate(DESCRIPTIONS)}
+    return sorted(names, key=lambda name: (order.get(name, len(order)), name))
+
+
+def _labels(key: tuple) -> str:
+    if not key:
+        return ""
+    values = []
+    for label, value in key:
+        value = str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+        values.append(f'{label}="{value}"')
+    return "{" + ",".join(values) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """
+    Returns the process-wide metrics registry.
+
+    Returns:
+        Metrics: Shared registry.
+    """
+    return _metrics
+
+
+def save_metrics(name: str = "ingestion", metrics: Metrics | None = None) -> Path:
+    """
+    Writes metrics to the directory set in config.json (`metrics.path`) and prints
+    their JSON summary.
+
+    Args:
+        name (str, optional): Base name of the files. Defaults to "ingestion".
+        metrics (Metrics | None, optional): Registry to write. If None, the
+        process-wide one. Defaults to None.
+
+    Returns:
+        Path: Directory the files were written to.
+    """
+    if metrics is None:
+        metrics = get_metrics()
+    directory = Path(__file__).parent.parent.joinpath(
+        config.get("metrics", {}).get("path", "metrics")
+    )
+    metrics.save(directory, name)
+    print(json.dumps(metrics.summary(), indent=4))
+    print(f"Metrics written to `{directory}`.")
+    return directory
@@ -0,0 +1,184 @@
+#!/usr/bin/python
+import re
+import threading
+
+import repackage
+
+repackage.up()
+from config.config import load_config
+
+config = load_config()
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+PAGE_NUMBER_PATTERN = re.compile(r"\d{1,3} z \d{1,3}")
+CODE_PATTERN = re.compile(r"EP-\d{1,2}|K_[KUW]?\d{1,2}")
+# texts of a list are normalized together, joined with a character that no rule
+# matches
+_SEPARATOR = "\0"
+
+
+class Normalizer:
+    """
+    Text cleanup chain compiled once: replacement of characters (`str.replace` or a
+    `str.translate` table for single characters, a combined regex for longer keys),
+    optional removal of page numbers, keywords and codes, and collapsing of
+    whitespaces. Replacements and removals are applied in a single scan of the text,
+    whitespaces in a second one without Python callbacks.
+
+    Replacements are applied simultaneously rather than one key after another, and
+    a removed fragment leaves a single space if it was next to a whitespace. As the
+    whitespace pass comes last, whitespaces inside replacement values (of single
+    characters and longer keys alike) are collapsed as well: the result never has
+    runs of whitespaces.
+    """
+
+    def __init__(
+        self,
+        replacement_dict: dict | None = None,
+        remove_page_numbers: bool = False,
+        keywords: list[str] | None = None,
+        remove_codes: bool = False,
+    ) -> None:
+        if replacement_dict is None:
+            replacement_dict = {}
+        elif not isinstance(replacement_dict, dict):
+            raise TypeError("Must be a dictionary.")
+        chars = {key: value for key, value in replacement_dict.items() if len(key) == 1}
+        self._table = str.maketrans(chars)
+        # a chain of str.replace is much faster than str.translate with a dict, and
+        # gives the same result unless a replacement contains another replaced char
+        self._chars = None
+        if not any(key in value for key in chars for value in chars.values()):
+            self._chars = list(chars.items())
+        self._replacements = {
+            key: value for key, value in replacement_dict.items() if len(key) > 1
+        }
+        removals = []
+        if remove_page_numbers:
+            removals.append(PAGE_NUMBER_PATTERN.pattern)
+        if keywords:
+            removals.extend(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+        if remove_codes:
+            removals.append(CODE_PATTERN.pattern)
+        self._removal = re.compile("|".join(removals)) if removals else None
+        alternatives = []
+        if removals:
+            # a run of removed fragments; whitespaces around it are left to the
+            # whitespace pass, a leading \s* would make the regex try every position
+            removal = "|".join(removals)
+            alternatives.append(rf"(?P<removal>(?:{removal})(?:\s*(?:{removal}))*)")
+        if self._replacements:
+            keys = sorted(self._replacements, key=len, reverse=True)
+            alternatives.append(f"(?P<replacement>{'|'.join(map(re.escape, keys))})")
+        # None if there is nothing but whitespaces to normalize
+        self._pattern = re.compile("|".join(alternatives)) if alternatives else None
+
+    def __call__(self, text: str | list[str]) -> str | list[str]:
+        """
+        Normalizes text or list of texts.
+
+        Args:
+            text (str | list[str]): Text or list of texts.
+
+        Raises:
+            TypeError: If text is neither string nor list of strings.
+
+        Returns:
+            str | list[str]: Text or list of texts.
+        """
+        if isinstance(text, str):
+            return self.normalize(text)
+        elif isinstance(text, list):
+            return self.normalize_many(text)
+        raise TypeError("Text must be string or list of strings.")
+
+    def normalize(self, text: str) -> str:
+        """
+        Normalizes a text.
+
+        Args:
+            text (str): Text.
+
+        Returns:
+            str: Normalized and stripped text.
+        """
+        return self._sub(self._translate(text)).strip()
+
+    def normalize_many(self, texts: list[str]) -> list[str]:
+        """
+        Normalizes texts in bulk, in one pass over all of them.
+
+        Args:
+            texts (list[str]): Texts.
+
+        Raises:
+            TypeError: If any of texts is not a string.
+
+        Returns:
+            list[str]: Normalized and stripped texts.
+        """
+        if not all(isinstance(text, str) for text in texts):
+            raise TypeError("Text must be string or list of strings.")
+        if not texts:
+            return []
+        joined = _SEPARATOR.join(texts)
+        if joined.count(_SEPARATOR) != len(texts) - 1:
+            return [self.normalize(text) for text in texts]
+        normalized = self._sub(self._translate(joined))
+        return [text.strip() for text in normalized.split(_SEPARATOR)]
+
+    def _translate(self, text: str) -> str:
+        if self._chars is None:
+            return text.translate(self._table)
+        for key, value in self._chars:
+            text = text.replace(key, value)
+        return text
+
+    def _sub(self, text: str) -> str:
+        if self._pattern is not None:
+            text = self._pattern.sub(self._replace, text)
+        # a string replacement, so that runs of whitespaces cost no Python calls
+        return WHITESPACE_PATTERN.sub(" ", text)
+
+    def _replace(self, match: re.Match) -> str:
+        if match.lastgroup == "replacement":
+            return self._replacements[match.group()]
+        if match.lastgroup == "removal" and not self._removal.sub("", match.group()):
+            # no whitespace around or between removed fragments
+            return ""
+        return " "
+
+
+_normalizers: dict[tuple, Normalizer] = {}
+_normalizers_lock = threading.Lock()
+
+
+def get_normalizer(
+    remove_page_numbers: bool = False,
+    keywords: tuple[str, ...] = (),
+    remove_codes: bool = False,
+) -> Normalizer:
+    """
+    Returns a process-wide Normalizer with the replacement dictionary from
+    config.json, compiling it on first use.
+
+    Args:
+        remove_page_numbers (bool, optional): Whether to remove page numbers (i.e.
+        '2 z 5'). Defaults to False.
+        keywords (tuple[str, ...], optional): Keywords to remove. Defaults to ().
+        remove_codes (bool, optional): Whether to remove codes ('kody efektów
+        kształcenia'). Defaults to False.
+
+    Returns:
+        Normalizer: Shared normalizer.
+    """
+    key = (remove_page_numbers, tuple(keywords), remove_codes)
+    with _normalizers_lock:
+        if key not in _normalizers:
+            _normalizers[key] = Normalizer(
+                config["general"]["replacement_dictionary"],
+                remove_page_numbers=remove_page_numbers,
+                keywords=list(keywords),
+                remove_codes=remove_codes,
+            )
+        return _normalizers[key]
@@ -1,49 +1,294 @@
 #!/usr/bin/python
+import hashlib
+import json
 import os
 import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator
 
-import aspose.pdf as pdf
 import repackage
-import spacy
-import win32com.client
 from docx import Document
 from pdfminer.high_level import extract_text
 
 repackage.up()
 from config.config import load_config
+from scripts.cache import ParseCache
+from scripts.corpus import write_corpus
+from scripts.metrics import get_metrics, save_metrics
+from scripts.normalization import (
+    CODE_PATTERN,
+    PAGE_NUMBER_PATTERN,
+    WHITESPACE_PATTERN,
+    Normalizer,
+    get_normalizer,
+)
+
+# aspose, spacy and win32com are imported on first use, they are slow to import
+# and win32com is Windows-only
+if TYPE_CHECKING:
+    import aspose.pdf as pdf
 
 config = load_config()
 
-
-def main(path: str | None = None, verbose: bool = False):
-    """
-    Main parser of different files. Adds chunks of texts to a local CSV file.
+# bump whenever parsing output changes, to invalidate parse cache
+PARSER_VERSION = "2"
+SPACY_MODEL = "pl_core_news_sm"
+# only the dependency parser (and its tok2vec) is needed to split sentences
+SPACY_UNUSED_COMPONENTS = [
+    "tagger",
+    "morphologizer",
+    "attribute_ruler",
+    "lemmatizer",
+    "ner",
+]
+_nlp_pipelines = {}
+_nlp_lock = threading.Lock()
+
+
+def main(
+    path: str | None = None,
+    verbose: bool = False,
+    workers: int | None = None,
+    file_path: str | None = None,
+):
+    """
+    Main parser of different files. Writes chunks of texts to a local Parquet file
+    (with their source, file type and position) or, for other file extensions,
+    appends them to a CSV file.
 
     Args:
         path (str | None, optional): Local path files are in. Defaults to None.
         verbose (bool): Whether to print out info if a file has been parsed.
+        workers (int | None, optional): Number of processes to parse files in. If
+        None, taken from config.json. Defaults to None.
+        file_path (str | None, optional): File to write chunks to. If None, taken
+        from config.json. Defaults to None.
     """
+    if file_path is None:
+        file_name = config["pinecone"]["target_filename"]["raw"]
+        file_path = str(Path(__file__).parent.parent.joinpath(file_name))
+    if file_path.endswith(".parquet"):
+        rows = write_corpus(iter_records(path, workers, verbose), file_path)
+        print(f"{rows} chunks written to `{file_path}`.")
+        save_metrics("parsing")
+        return
     list_of_files = get_files_in_dir(path)
-    for file_path in list_of_files:
-        if file_path.endswith(".pdf"):
-            try:
-                text = PDFParser(file_path)
-                list_of_sentences = text.parse()
-                add_lines(list_of_sentences)
-                if verbose:
-                    print(f"File `{file_path}` parsed")
-            except RuntimeError:
-                # TODO: problem with ASPOSE client -> check another solution?
-                print(f"File `{file_path}` NOT parsed")
-        elif file_path.endswith(".docx"):
-            text = DOCXParser(file_path)
-            list_of_sentences = text.parse()
-            add_lines(list_of_sentences)
-            if verbose:
-                print(f"File `{file_path}` parsed")
+    for parsed_file_path, list_of_sentences in parse_files(list_of_files, workers):
+        if list_of_sentences is None:
+            continue
+        add_lines(list_of_sentences, file_path)
+        if verbose:
+            print(f"File `{parsed_file_path}` parsed")
+    save_metrics("parsing")
+
+
+def parse_files(
+    file_paths: list[str], workers: int | None = None
+) -> Iterator[tuple[str, list[str] | None]]:
+    """
+    Parses PDF and DOCX files, in a pool of processes if `workers` > 1. Other files
+    are skipped. A file that fails to parse is reported and yields None, the rest of
+    the files are parsed anyway. If parse cache is enabled in config.json, only new
+    and modified files are parsed.
+
+    Args:
+        file_paths (list[str]): Paths of files to parse.
+        workers (int | None, optional): Number of processes. If None, taken from
+        config.json (1 if not set). Defaults to None.
+
+    Yields:
+        Iterator[tuple[str, list[str] | None]]: File path and its sentences, in order
+        of `file_paths`.
+    """
+    if workers is None:
+        workers = config["general"].get("parse_workers", 1)
+    file_paths = [f for f in file_paths if f.endswith(".pdf") or f.endswith(".docx")]
+    cache = get_parse_cache()
+    try:
+        cached = [cache.get(f) if cache is not None else None for f in file_paths]
+        misses = [f for f, sentences in zip(file_paths, cached) if sentences is None]
+        if workers > 1 and len(misses) > 1:
+            max_workers = min(workers, len(misses))
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = _bounded_map(
+                    executor, _parse_file_safe, misses, 2 * max_workers
+                )
+                yield from _merge_results(file_paths, cached, results, cache)
         else:
+            results = map(_parse_file_safe, misses)
+            yield from _merge_results(file_paths, cached, results, cache)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def get_parse_cache() -> ParseCache | None:
+    """
+    Opens parse cache set in config.json.
+
+    Returns:
+        ParseCache | None: Parse cache, None if disabled.
+    """
+    cache_config = config.get("parse_cache", {})
+    if not cache_config.get("enabled", False):
+        return None
+    return ParseCache(
+        Path(__file__).parent.parent.joinpath(cache_config["path"]),
+        version=get_parse_cache_version(),
+    )
+
+
+def get_parse_cache_version() -> str:
+    """
+    Returns the version parsed files are cached with: PARSER_VERSION and a hash of
+    settings parsing output depends on (replacement dictionary from config.json and
+    the spaCy model splitting sentences), so that changing any of them invalidates
+    parse cache.
+
+    Returns:
+        str: Parse cache version.
+    """
+    settings = {
+        "replacement_dictionary": config["general"]["replacement_dictionary"],
+        "spacy_model": SPACY_MODEL,
+    }
+    # keys are not sorted, order of replacements matters
+    digest = hashlib.sha256(
+        json.dumps(settings, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return f"{PARSER_VERSION}-{digest[:16]}"
+
+
+def iter_records(
+    path: str | None = None, workers: int | None = None, verbose: bool = False
+) -> Iterator[dict]:
+    """
+    Parses files and yields their sentences as records to be loaded into an index
+    (see `loader.BaseIndex.load_records_into_index`) or written to a corpus file.
+
+    Args:
+        path (str | None, optional): File or directory to parse. If None, the `data`
+        directory. Defaults to None.
+        workers (int | None, optional): Number of processes. If None, taken from
+        config.json. Defaults to None.
+        verbose (bool): Whether to print out info if a file has been parsed.
+
+    Yields:
+        Iterator[dict]: Records with `text`, `source` (file path relative to the
+        parsed directory), `file_type` and `chunk_index` keys.
+    """
+    if path is None:
+        path = str(Path(__file__).parent.parent.joinpath("data"))
+    for file_path, sentences in parse_files(get_files_in_dir(path), workers=workers):
+        if sentences is None:
             continue
+        if os.path.isdir(path):
+            source = Path(os.path.relpath(file_path, path)).as_posix()
+        else:
+            source = os.path.basename(file_path)
+        file_type = get_parser(file_path).file_type
+        for chunk_index, sentence in enumerate(sentences):
+            yield {
+                "text": sentence,
+                "source": source,
+                "file_type": file_type,
+                "chunk_index": chunk_index,
+            }
+        if verbose:
+            print(f"File `{file_path}` parsed")
+
+
+def parse_file(file_path: str) -> list[str]:
+    """
+    Parses a single PDF or DOCX file with a matching parser.
+
+    Args:
+        file_path (str): Path of a file to parse.
+
+    Raises:
+        TypeError: If file is neither PDF nor DOCX.
+
+    Returns:
+        list[str]: List of sentences.
+    """
+    return get_parser(file_path).parse()
+
+
+def get_parser(file_path: str) -> "PDFParser | DOCXParser":
+    """
+    Returns a parser matching a file extension.
+
+    Args:
+        file_path (str): Path of a file to parse.
+
+    Raises:
+        TypeError: If file is neither PDF nor DOCX.
+
+    Returns:
+        PDFParser | DOCXParser: Parser.
+    """
+    if file_path.endswith(".pdf"):
+        return PDFParser(file_path)
+    elif file_path.endswith(".docx"):
+        return DOCXParser(file_path)
+    raise TypeError("File must be PDF or DOCX.")
+
+
+def _parse_file_safe(file_path: str) -> tuple[list[str] | None, str | None, float]:
+    # errors are returned as strings, as not every exception survives pickling
+    # on its way back from a worker process; parse time is measured in the worker
+    start = time.perf_counter()
+    try:
+        return parse_file(file_path), None, time.perf_counter() - start
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+
+def _bounded_map(
+    executor: Executor, fn, items: Iterable, max_in_flight: int
+) -> Iterator:
+    # like `executor.map`, but a new item is submitted only when a result is taken,
+    # so at most `max_in_flight` results (sentences of whole files) wait in memory
+    # for a slow consumer
+    items = iter(items)
+    pending = deque(executor.submit(fn, item) for item in islice(items, max_in_flight))
+    while pending:
+        result = pending.popleft().result()
+        for item in islice(items, 1):
+            pending.append(executor.submit(fn, item))
+        yield result
+
+
+def _merge_results(
+    file_paths: list[str],
+    cached: list[list[str] | None],
+    results,
+    cache: ParseCache | None,
+) -> Iterator:
+    # `results` holds outcomes of files missing from `cached`, in order
+    metrics = get_metrics()
+    for file_path, sentences in zip(file_paths, cached):
+        file_type = get_parser(file_path).file_type
+        if sentences is None:
+            sentences, error, seconds = next(results)
+            metrics.observe("parse_seconds", seconds, file_type=file_type)
+            if error is not None:
+                # TODO: problem with ASPOSE client -> check another solution?
+                print(f"File `{file_path}` NOT parsed ({error})")
+                metrics.inc("files_parsed_total", file_type=file_type, status="error")
+                metrics.inc("errors_total", stage="parse")
+            else:
+                metrics.inc("files_parsed_total", file_type=file_type, status="ok")
+                if cache is not None:
+                    cache.put(file_path, sentences)
+        else:
+            metrics.inc("files_parsed_total", file_type=file_type, status="cached")
+        yield file_path, sentences
 
 
 class DOCXParser:
@@ -67,21 +312,19 @@ class DOCXParser:
             t1 = extract_text_from_docx(self.file_path)
             t2 = remove_preambule_before_par(t1)
             t3 = remove_attachments(t2)
-            t4 = replace_forbidden_chars(t3)
+            t4 = get_normalizer()(t3)
             return split_on_points(t4)
         elif self.file_type.capitalize() == "Pytania":
             t1 = extract_text_from_docx(self.file_path)
             t2 = remove_preambule_before_point(t1)
-            t3 = remove_page_numbers(t2)
-            t4 = replace_whitespaces(t3)
-            t5 = replace_forbidden_chars(t4)
-            t6 = add_category(t5, self.file_path)
-            return [t6]
+            # page numbers, whitespaces and forbidden chars in one pass
+            t3 = get_normalizer(remove_page_numbers=True)(t2)
+            t4 = add_category(t3, self.file_path)
+            return [t4]
         else:
             t1 = extract_text_from_docx(self.file_path)
             t2 = chunk_text(t1)
-            t3 = replace_whitespaces(t2)
-            return replace_forbidden_chars(t3)
+            return get_normalizer()(t2)
 
 
 class PDFParser:
@@ -99,14 +342,12 @@ class PDFParser:
             header = get_header(text=t1, file_path=self.file_path)
             json_ = jsonize_pdf(t1)
             text_list = prettify_json(json=json_, header=header)
-            t2 = replace_forbidden_chars(text_list)
-            return replace_whitespaces(t2)
+            return get_normalizer()(text_list)
         else:
             # TODO: modify if new PDF files arrive
-            t1 = extract_text_from_textual_pdf(self.file_path)
-            t2 = replace_forbidden_chars(t1)
-            t3 = replace_whitespaces(t2)
-            return [t3]
+            # raw pdfminer text, new lines are collapsed by the normalizer
+            t1 = extract_text(self.file_path)
+            return [get_normalizer()(t1)]
 
 
 def get_files_in_dir(path_to_search: str | None = None) -> list:
@@ -152,6 +393,8 @@ def extract_text_from_docx(file_path: str) -> str:
         text = " ".join([paragraph.text for paragraph in doc.paragraphs])
         return text
     elif file_path.endswith(".doc"):
+        import win32com.client
+
         word = win32com.client.Dispatch("Word.Application")
         word.visible = False
         wb = word.Documents.Open(file_path)
@@ -249,24 +492,12 @@ def replace_forbidden_chars(
         (str | list[str]): Text or list of texts.
     """
     if replacement_dict is None:
-        replacement_dict = config["general"]["replacement_dictionary"]
+        normalizer = get_normalizer()
     elif not isinstance(replacement_dict, dict):
         raise TypeError("Must be a dictionary.")
-    if isinstance(text, str):
-        for key in replacement_dict:
-            text = text.replace(key, replacement_dict[key])
-        return replace_whitespaces(text.strip())
-    elif isinstance(text, list):
-        result = []
-        for elem in text:
-            if not isinstance(elem, str):
-                raise TypeError("Text must be string or list of strings.")
-            for key in replacement_dict:
-                elem = elem.replace(key, replacement_dict[key])
-            result.append(replace_whitespaces(elem.strip()))
-        return result
     else:
-        raise TypeError("Text must be string or list of strings.")
+        normalizer = Normalizer(replacement_dict)
+    return normalizer(text)
 
 
 def replace_whitespaces(text: str | list[str]) -> str | list[str]:
@@ -280,9 +511,9 @@ def replace_whitespaces(text: str | list[str]) -> str | list[str]:
         str | list[str]: Text or list of texts.
     """
     if isinstance(text, str):
-        return re.sub(r"\s+", " ", text)
+        return WHITESPACE_PATTERN.sub(" ", text)
     elif isinstance(text, list):
-        return [re.sub(r"\s+", " ", t) for t in text]
+        return [WHITESPACE_PATTERN.sub(" ", t) for t in text]
     else:
         raise TypeError("Text must be string of list of strings.")
 
@@ -297,7 +528,7 @@ def remove_page_numbers(text: str) -> str:
     Returns:
         str: Text.
     """
-    return re.sub(r"\d{1,3} z \d{1,3}", "", text)
+    return PAGE_NUMBER_PATTERN.sub("", text)
 
 
 def add_category(text: str, file_path: str) -> str:
@@ -316,6 +547,56 @@ def add_category(text: str, file_path: str) -> str:
     return replace_whitespaces(result.strip())
 
 
+def get_nlp(model: str = SPACY_MODEL, language_detector: bool = False):
+    """
+    Returns a spaCy pipeline, loaded once per process. Components that are not
+    needed for sentence splitting are excluded.
+
+    Args:
+        model (str, optional): spaCy model name. Defaults to SPACY_MODEL.
+        language_detector (bool, optional): Whether to add `language_detector` pipe.
+        Defaults to False.
+
+    Returns:
+        spacy.language.Language: spaCy pipeline.
+    """
+    key = (model, language_detector)
+    with _nlp_lock:
+        if key not in _nlp_pipelines:
+            import spacy
+
+            nlp = spacy.load(model, exclude=SPACY_UNUSED_COMPONENTS)
+            if language_detector:
+                import spacy_fastlang  # registers `language_detector` factory
+
+                nlp.add_pipe("language_detector")
+            _nlp_pipelines[key] = nlp
+        return _nlp_pipelines[key]
+
+
+def segment_texts(
+    texts: Iterable[str], detect_language: bool = False, batch_size: int = 32
+) -> Iterator[tuple[list[str], str | None]]:
+    """
+    Splits many texts into sentences (and optionally detects their language) in one
+    streaming pass of `nlp.pipe`.
+
+    Args:
+        texts (Iterable[str]): Texts to process.
+        detect_language (bool, optional): Whether to detect language of the texts.
+        Defaults to False.
+        batch_size (int, optional): Number of texts processed at once. Defaults to 32.
+
+    Yields:
+        Iterator[tuple[list[str], str | None]]: Sentences of a text and its language
+        (None if not detected), in order of `texts`.
+    """
+    nlp = get_nlp(language_detector=detect_language)
+    for doc in nlp.pipe(texts, batch_size=batch_size):
+        sentences = [sent.text.strip() for sent in doc.sents]
+        yield sentences, doc._.language if detect_language else None
+
+
 def determine_language(text: str) -> str:
     """
     Returns a language, that given text is written in.
@@ -326,13 +607,20 @@ def determine_language(text: str) -> str:
     Returns:
         str: Language. Tested for pl, en, de.
     """
-    import spacy_fastlang
+    return determine_languages([text])[0]
+
 
-    nlp = spacy.load("pl_core_news_sm")
-    nlp.add_pipe("language_detector")
-    doc = nlp(text)
+def determine_languages(texts: Iterable[str]) -> list[str]:
+    """
+    Batched version of `determine_language`.
 
-    return doc._.language
+    Args:
+        texts (Iterable[str]): Texts to check.
+
+    Returns:
+        list[str]: Languages, in order of `texts`.
+    """
+    return [language for _, language in segment_texts(texts, detect_language=True)]
 
 
 def chunk_text(text: str) -> list[str]:
@@ -346,9 +634,32 @@ def chunk_text(text: str) -> list[str]:
     Returns:
         list[str]: List of strings after chunking.
     """
-    nlp = spacy.load("pl_core_news_sm")
-    doc = nlp(text)
-    sentences = [sent.text.strip() for sent in doc.sents]
+    return chunk_texts([text])[0]
+
+
+def chunk_texts(texts: Iterable[str]) -> list[list[str]]:
+    """
+    Batched version of `chunk_text`.
+
+    Args:
+        texts (Iterable[str]): Strings to chunk.
+
+    Returns:
+        list[list[str]]: Chunks of every string, in order of `texts`.
+    """
+    return [chunk_sentences(sentences) for sentences, _ in segment_texts(texts)]
+
+
+def chunk_sentences(sentences: list[str]) -> list[str]:
+    """
+    Joins sentences into overlapping 3-sentence chunks (see `chunk_text`).
+
+    Args:
+        sentences (list[str]): Sentences of a text.
+
+    Returns:
+        list[str]: List of chunks.
+    """
     result = []
     for i, _ in enumerate(sentences):
         if i < len(sentences) - 2:
@@ -368,6 +679,8 @@ def extract_text_from_pdf(file_path: str) -> str:
     Returns:
         str: Full text of a PDF file
     """
+    import aspose.pdf as pdf
+
     pdfDocument = pdf.Document(file_path)
     full_text = []
     # TODO: add check for pages number and whether all pages are used in parsing
@@ -392,7 +705,7 @@ def extract_text_from_textual_pdf(file_path: str) -> str:
     return replace_whitespaces(result.strip())
 
 
-def get_raw_text_from_tables(pdfDocument: pdf.Document, iterator: int) -> str:
+def get_raw_text_from_tables(pdfDocument: "pdf.Document", iterator: int) -> str:
     """
     Returns raw text (single string) from a table in a PDF file.
 
@@ -406,6 +719,8 @@ def get_raw_text_from_tables(pdfDocument: pdf.Document, iterator: int) -> str:
     # TODO: add exception handling if there is no table in the file.
     # TODO: add exception handling if there is a problem with pages number.
     # Initialize TableAbsorber object
+    import aspose.pdf as pdf
+
     tableAbsorber = pdf.text.TableAbsorber()
 
     # Parse all the tables on first page
@@ -522,8 +837,7 @@ def remove_codes(text: str) -> str:
     Returns:
         str: New string.
     """
-    pattern = r"(EP-\d{1,2})|(K_[KUW]?\d{1,2})"
-    result = re.sub(pattern=pattern, repl="", string=text)
+    result = CODE_PATTERN.sub("", text)
     return replace_whitespaces(result.strip())
 
 
@@ -0,0 +1,291 @@
+#!/usr/bin/python
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import repackage
+
+repackage.up()
+from config.config import load_config
+from scripts.metrics import get_metrics
+
+config = load_config()
+
+# priority classes: interactive traffic (chatbot queries) always goes ahead of bulk
+# traffic (ingestion batches)
+INTERACTIVE = 0
+BULK = 1
+# longest single sleep of a waiting caller, so that it notices interactive callers
+# coming and going
+_MAX_SLEEP = 0.05
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all callers of a quota: holds up to `capacity` tokens,
+    refilled at `rate` tokens per second, and every request takes `cost` tokens
+    (1 by default, i.e. the bucket limits requests per second).
+
+    Interactive callers may empty the bucket. Bulk callers leave `reserve` (a
+    fraction of capacity) to interactive ones and do not take tokens at all while
+    an interactive caller is waiting, so a bulk load cannot delay user queries by
+    more than a single refill.
+
+    With `path`, the bucket lives in a file guarded by a file lock and is shared
+    by all processes using the same file (e.g. the chatbot and a nightly reload);
+    otherwise it is shared by threads and event loops of the process.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float | None = None,
+        reserve: float = 0.2,
+        path: str | Path | None = None,
+        name: str = "default",
+    ) -> None:
+        if rate <= 0:
+            raise ValueError("Rate must be positive.")
+        if not 0 <= reserve < 1:
+            raise ValueError("Reserve must be between 0 and 1.")
+        if capacity is None:
+            # enough for a bulk request besides the reserve
+            capacity = max(rate, 1 / (1 - reserve))
+        if capacity * (1 - reserve) < 1:
+            raise ValueError(
+                "Capacity left to bulk callers (capacity * (1 - reserve)) must be at "
+                "least 1."
+            )
+        self.rate = rate
+        self.capacity = capacity
+        self.reserve = reserve
+        self.name = name
+        self.path = None if path is None else Path(path)
+        self._lock = threading.Lock()
+        self._file_lock = None
+        if self.path is not None:
+            # imported on first use, cross-process limiting is optional
+            from filelock import FileLock
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file_lock = FileLock(f"{self.path}.lock")
+        self._state = {
+            "tokens": self.capacity,
+            "updated": time.time(),
+            "interactive_until": 0.0,
+        }
+
+    def acquire(self, cost: float = 1, priority: int = BULK) -> float:
+        """
+        Blocks until `cost` tokens are taken from the bucket.
+
+        Args:
+            cost (float, optional): Tokens to take. Defaults to 1.
+            priority (int, optional): INTERACTIVE or BULK. Defaults to BULK.
+
+        Returns:
+            float: Time waited in seconds.
+        """
+        start = None
+        while wait := self.try_acquire(cost, priority):
+            start = start or time.perf_counter()
+            time.sleep(min(wait, _MAX_SLEEP))
+        return self._waited(start, priority)
+
+    async def aacquire(self, cost: float = 1, priority: int = INTERACTIVE) -> float:
+        """
+        Async version of `acquire`, waiting without blocking the event loop. A
+        file-backed bucket is read and written in a worker thread, as the file lock
+        may be held by another process.
+        """
+        start = None
+        while wait := await self._atry_acquire(cost, priority):
+            start = start or time.perf_counter()
+            await asyncio.sleep(min(wait, _MAX_SLEEP))
+        return self._waited(start, priority)
+
+    async def _atry_acquire(self, cost: float, priority: int) -> float:
+        if self.path is None:
+            # in memory only, the lock is never held for long
+            return self.try_acquire(cost, priority)
+        return await asyncio.to_thread(self.try_acquire, cost, priority)
+
+    def try_acquire(self, cost: float = 1, priority: int = BULK) -> float:
+        """
+        Takes `cost` tokens from the bucket if possible, without waiting.
+
+        Args:
+            cost (float, optional): Tokens to take; capped at the capacity
+            available to the priority class. Defaults to 1.
+            priority (int, optional): INTERACTIVE or BULK. Defaults to BULK.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise seconds to wait before
+            trying again.
+        """
+        if priority == INTERACTIVE:
+            cost = min(cost, self.capacity)
+        else:
+            # bulk callers never get the reserve, larger requests would never fit
+            cost = min(cost, self.capacity * (1 - self.reserve))
+        with self._locked():
+            now = time.time()
+            state = self._load()
+            elapsed = max(0.0, now - state["updated"])
+            tokens = min(self.capacity, state["tokens"] + elapsed * self.rate)
+            if priority == INTERACTIVE:
+                available = tokens
+            elif now < state["interactive_until"]:
+                # an interactive caller is waiting for the tokens being refilled
+                self._store(tokens, now, state["interactive_until"])
+                return state["interactive_until"] - now
+            else:
+                available = tokens - self.reserve * self.capacity
+            if available >= cost:
+                self._store(tokens - cost, now, state["interactive_until"])
+                return 0.0
+            wait = (cost - available) / self.rate
+            interactive_until = state["interactive_until"]
+            if priority == INTERACTIVE:
+                # hold bulk callers back until this caller gets its tokens
+                interactive_until = max(interactive_until, now + wait + _MAX_SLEEP)
+            self._store(tokens, now, interactive_until)
+            return wait
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if self._file_lock is None:
+                yield
+            else:
+                with self._file_lock:
+                    yield
+
+    def _load(self) -> dict:
+        if self.path is not None and self.path.is_file():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._state = json.load(f)
+        return self._state
+
+    def _store(self, tokens: float, updated: float, interactive_until: float) -> None:
+        self._state = {
+            "tokens": tokens,
+            "updated": updated,
+            "interactive_until": interactive_until,
+        }
+        if self.path is not None:
+            tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._state, f)
+            os.replace(tmp_path, self.path)
+
+    def _waited(self, start: float | None, priority: int) -> float:
+        if start is None:
+            return 0.0
+        waited = time.perf_counter() - start
+        get_metrics().inc(
+            "rate_limit_wait_seconds",
+            waited,
+            limiter=self.name,
+            priority="interactive" if priority == INTERACTIVE else "bulk",
+        )
+        return waited
+
+
+class RateLimitedEmbeddings:
+    """
+    Wraps an embeddings client so that every request first takes a token from a
+    RateLimiter, with the priority of the caller.
+    """
+
+    def __init__(self, embeddings, limiter: RateLimiter, priority: int = BULK) -> None:
+        self.embeddings = embeddings
+        self.limiter = limiter
+        self.priority = priority
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.limiter.acquire(priority=self.priority)
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        self.limiter.acquire(priority=self.priority)
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        await self.limiter.aacquire(priority=self.priority)
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        await self.limiter.aacquire(priority=self.priority)
+        return await self.embeddings.aembed_query(text)
+
+    def __getattr__(self, name: str):
+        # e.g. `model` of the wrapped client
+        return getattr(self.embeddings, name)
+
+
+class RateLimitedIndex:
+    """
+    Wraps an index client (`pinecone.Index` or LocalVectorStore) so that `upsert`,
+    `query` and `delete` first take a token from a RateLimiter, with the priority
+    of the caller. Other attributes are passed through.
+    """
+
+    def __init__(self, index, limiter: RateLimiter, priority: int = BULK) -> None:
+        self.index = index
+        self.limiter = limiter
+        self.priority = priority
+
+    def upsert(self, *args, **kwargs):
+        self.limiter.acquire(priority=self.priority)
+        return self.index.upsert(*args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        self.limiter.acquire(priority=self.priority)
+        return self.index.query(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self.limiter.acquire(priority=self.priority)
+        return self.index.delete(*args, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self.index, name)
+
+
+_limiters: dict[str, RateLimiter | None] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str) -> RateLimiter | None:
+    """
+    Returns the process-wide rate limiter of a quota set in config.json
+    (`rate_limit.<name>` with `rate`, `capacity`, `reserve` and optional `path` of
+    a file shared with other processes), creating it on first use.
+
+    Args:
+        name (str): Quota name, `embeddings` or `index`.
+
+    Returns:
+        RateLimiter | None: Rate limiter, None if the quota is not limited.
+    """
+    with _limiters_lock:
+        if name not in _limiters:
+            limit_config = config.get("rate_limit", {}).get(name)
+            if limit_config is None:
+                _limiters[name] = None
+            else:
+                path = limit_config.get("path")
+                if path is not None:
+                    path = Path(__file__).parent.parent.joinpath(path)
+                _limiters[name] = RateLimiter(
+                    rate=limit_config["rate"],
+                    capacity=limit_config.get("capacity"),
+                    reserve=limit_config.get("reserve", 0.2),
+                    path=path,
+                    name=name,
+                )
+        return _limiters[name]
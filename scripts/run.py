@@ -1,18 +1,16 @@
 #!/usr/bin/python
 import argparse
+from pathlib import Path
 
 import repackage
-from loader import PineconeIndex
+from loader import LocalIndex, get_index
 
 repackage.up()
-from interface import make_conversation
-
 from config.config import load_config
+from scripts.metrics import save_metrics
 
 
 def main():
-    pi = PineconeIndex()
-
     config = load_config()
     parser = argparse.ArgumentParser(
         prog="ChatBot",
@@ -57,6 +55,27 @@ def main():
         const=config["pinecone"]["target_filename"]["raw"],
         type=str,
     )
+    group.add_argument(
+        "--ingest",
+        help="Parses files in a given directory and loads them straight into an index.",
+        nargs="?",
+        const=str(Path(__file__).parent.parent.joinpath("data")),
+        type=str,
+    )
+    group.add_argument(
+        "--build_ann",
+        help="Builds an ANN index on a given local index namespace.",
+        nargs="?",
+        const=config["pinecone"]["namespace"]["raw"],
+        type=str,
+    )
+    group.add_argument(
+        "--ann_report",
+        help="Prints recall@10 and latency of the ANN index for several nprobe values.",
+        nargs="?",
+        const=config["pinecone"]["namespace"]["raw"],
+        type=str,
+    )
     group.add_argument(
         "--make_conversation",
         help="Enables to talk with chatbot.",
@@ -64,8 +83,17 @@ def main():
         const="aaa",
         type=str,
     )
+    parser.add_argument(
+        "--resume",
+        help="With --load_data, continues an interrupted load after its last checkpoint.",
+        action="store_true",
+    )
     parser.add_argument("-v", "--verbose", action="store_true")
     args = parser.parse_args()
+    if args.resume and not args.load_data:
+        parser.error("--resume can only be used with --load_data")
+    # the index connects on first use, so --help and argument errors are fast
+    pi = get_index()
     if args.create_index:
         print(pi.create_index())
     elif args.recreate_index:
@@ -77,9 +105,29 @@ def main():
             pi._delete_index()
     elif args.delete_data:
         pi._delete_data(vars(args)["delete_data"])
-    elif args.load_data:
-        pi.load_data_into_index(vars(args)["load_data"])
+    elif args.load_data or args.ingest:
+        try:
+            if args.load_data:
+                pi.load_data_into_index(vars(args)["load_data"], resume=args.resume)
+            else:
+                pi.load_files_into_index(vars(args)["ingest"])
+        finally:
+            # also when ingestion failed, to see how far it got
+            save_metrics("ingestion")
+    elif args.build_ann or args.ann_report:
+        if not isinstance(pi, LocalIndex):
+            print("ANN index is available for the local vectorstore only.")
+        elif args.build_ann:
+            pi.build_ann(vars(args)["build_ann"])
+        else:
+            for row in pi.ann_report(vars(args)["ann_report"]):
+                print(
+                    f"nprobe: {row['nprobe']} recall: {row['recall']:.3f} "
+                    f"latency: {row['latency_ms']:.3f} ms"
+                )
     elif args.make_conversation:
+        from interface import make_conversation
+
         while True:
             query = input("O co chcesz mnie zapytać?\n")
             if query == "q":
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+import re
+import threading
+
+import numpy as np
+import tiktoken
+
+_token_lengths: dict[str, np.ndarray] = {}
+_token_lengths_lock = threading.Lock()
+
+
+class TokenTextSplitter:
+    """
+    Splits texts into chunks of at most `chunk_size` tokens, overlapping by up to
+    `chunk_overlap` tokens. Like langchain's RecursiveCharacterTextSplitter with a
+    token length function, chunks are cut on the first separator of `separators`
+    found in the window, but each text is tokenized only once: cuts are made on
+    token offsets and chunk text is sliced from the token spans.
+    """
+
+    def __init__(
+        self,
+        tokenizer: tiktoken.Encoding,
+        chunk_size: int = 400,
+        chunk_overlap: int = 20,
+        separators: list[str] | None = None,
+    ) -> None:
+        if chunk_overlap >= chunk_size:
+            raise ValueError("Chunk overlap must be smaller than chunk size.")
+        self.tokenizer = tokenizer
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        if separators is None:
+            separators = ["\n\n", "\n", " ", ""]
+        self.separators = [s.encode("utf-8") for s in separators if s]
+        self._token_lengths = get_token_lengths(tokenizer)
+
+    def split_text(self, text: str) -> list[str]:
+        """
+        Splits a text into chunks.
+
+        Args:
+            text (str): Text to split.
+
+        Returns:
+            list[str]: Chunks.
+        """
+        return self.split_texts([text])[0]
+
+    def split_texts(self, texts: list[str]) -> list[list[str]]:
+        """
+        Splits texts into chunks, tokenizing all of them in one batch.
+
+        Args:
+            texts (list[str]): Texts to split.
+
+        Returns:
+            list[list[str]]: Chunks of every text, in order of `texts`.
+        """
+        batch = self.split_texts_with_lengths(texts)
+        return [[chunk for chunk, _ in chunks] for chunks in batch]
+
+    def split_texts_with_lengths(self, texts: list[str]) -> list[list[tuple[str, int]]]:
+        """
+        Same as `split_texts`, but also returns number of tokens of every chunk.
+
+        Args:
+            texts (list[str]): Texts to split.
+
+        Returns:
+            list[list[tuple[str, int]]]: Chunks with their token counts.
+        """
+        batch = self.tokenizer.encode_batch(texts, disallowed_special=())
+        return [self._split(text, tokens) for text, tokens in zip(texts, batch)]
+
+    def _split(self, text: str, tokens: list[int]) -> list[tuple[str, int]]:
+        data = text.encode("utf-8")
+        # byte offset of every token boundary, tokens concatenate to the text
+        offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+        np.cumsum(self._token_lengths[tokens], out=offsets[1:])
+        levels = self._boundary_levels(data, offsets)
+        chunks = []
+        start = 0
+        while start < len(tokens):
+            end = min(start + self.chunk_size, len(tokens))
+            if end < len(tokens):
+                # the last boundary with the best separator within the window
+                window = levels[start + 1 : end + 1]
+                level = window.min()
+                end = start + 1 + int(np.flatnonzero(window == level)[-1])
+            else:
+                level = 0
+            chunk = data[offsets[start] : offsets[end]].decode("utf-8", errors="ignore")
+            if chunk.strip():
+                chunks.append((chunk.strip(), end - start))
+            if end == len(tokens):
+                break
+            # the overlap starts on a boundary at least as good as the cut
+            low = max(start + 1, end - self.chunk_overlap)
+            candidates = np.flatnonzero(levels[low:end] <= level)
+            start = low + int(candidates[0]) if len(candidates) else end
+        return chunks
+
+    def _boundary_levels(self, data: bytes, offsets: np.ndarray) -> np.ndarray:
+        # level of a boundary is the position of the first separator that ends
+        # before or starts after it; boundaries with no separator come next and
+        # boundaries inside a multi-byte character last
+        levels = np.full(len(offsets), len(self.separators), dtype=np.int64)
+        inner = offsets[1:-1]
+        levels[1:-1][(np.frombuffer(data, np.uint8)[inner] & 0xC0) == 0x80] += 1
+        for level in reversed(range(len(self.separators))):
+            separator = self.separators[level]
+            starts = [m.start() for m in re.finditer(re.escape(separator), data)]
+            if not starts:
+                continue
+            starts = np.asarray(starts, dtype=np.int64)
+            positions = np.concatenate([starts, starts + len(separator)])
+            levels[np.isin(offsets, positions)] = level
+        levels[[0, -1]] = 0
+        return levels
+
+
+def get_token_lengths(tokenizer: tiktoken.Encoding) -> np.ndarray:
+    """
+    Returns byte length of every token of an encoding, computed once per process.
+
+    Args:
+        tokenizer (tiktoken.Encoding): Encoding.
+
+    Returns:
+        np.ndarray: Lengths indexed by token.
+    """
+    with _token_lengths_lock:
+        if tokenizer.name not in _token_lengths:
+            lengths = np.zeros(tokenizer.n_vocab, dtype=np.int64)
+            for token in range(tokenizer.n_vocab):
+                try:
+                    lengths[token] = len(tokenizer.decode_single_token_bytes(token))
+                except KeyError:
+                    # gaps in the vocabulary and special tokens, never produced
+                    # as specials are encoded as plain text
+                    continue
+            _token_lengths[tokenizer.name] = lengths
+        return _token_lengths[tokenizer.name]
@@ -0,0 +1,243 @@
+#!/usr/bin/python
+import collections
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import repackage
+
+repackage.up()
+from config.config import load_config
+
+config = load_config()
+
+
+class Span:
+    """
+    Timed leg of a trace with its attributes (e.g. hit/miss flags).
+    """
+
+    def __init__(self, name: str, start: float, attributes: dict) -> None:
+        self.name = name
+        self.start = start
+        self.duration = 0.0
+        self.attributes = attributes
+
+    def set(self, **attributes) -> None:
+        """
+        Sets attributes of the span.
+        """
+        self.attributes.update(attributes)
+
+    def to_dict(self, trace_start: float) -> dict:
+        return {
+            "name": self.name,
+            "start_ms": 1000 * (self.start - trace_start),
+            "duration_ms": 1000 * self.duration,
+            **self.attributes,
+        }
+
+
+class Trace:
+    """
+    Timings of a single call: sequential or concurrent spans, each measured with a
+    monotonic clock relative to the trace start, and attributes of the whole call
+    (e.g. namespace and score).
+    """
+
+    def __init__(self, name: str, **attributes) -> None:
+        self.name = name
+        self.trace_id = os.urandom(8).hex()
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.attributes = attributes
+        self.spans: list[Span] = []
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Measures the `with` block as a span, also if it raises.
+
+        Args:
+            name (str): Span name.
+            **attributes: Span attributes, more can be set on the yielded span.
+
+        Yields:
+            Span: Span.
+        """
+        span = Span(name, time.perf_counter(), attributes)
+        self.spans.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.duration = time.perf_counter() - span.start
+
+    def set(self, **attributes) -> None:
+        """
+        Sets attributes of the trace.
+        """
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "timestamp": self.timestamp,
+            "duration_ms": 1000 * self.duration,
+            "attributes": self.attributes,
+            "spans": [span.to_dict(self.start) for span in self.spans],
+        }
+
+
+class _NullSpan:
+    def set(self, **attributes) -> None:
+        pass
+
+
+class _NullTrace:
+    # stands in for Trace when tracing is disabled, records nothing
+    _span = _NullSpan()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        yield self._span
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+NULL_TRACE = _NullTrace()
+
+
+class JSONLExporter:
+    """
+    Appends traces to a JSON Lines file, one trace per line.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def export(self, trace: dict) -> None:
+        line = json.dumps(trace, ensure_ascii=False)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(f"{line}\n")
+
+
+class RingBufferExporter:
+    """
+    Keeps the last `max_traces` traces in memory.
+    """
+
+    def __init__(self, max_traces: int = 1000) -> None:
+        self._traces = collections.deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+
+    def export(self, trace: dict) -> None:
+        with self._lock:
+            self._traces.append(trace)
+
+    def traces(self) -> list[dict]:
+        """
+        Returns kept traces, oldest first.
+        """
+        with self._lock:
+            return list(self._traces)
+
+
+class Tracer:
+    """
+    Creates traces and passes a sample of finished ones to an exporter (any object
+    with an `export(trace: dict)` method). A trace is exported with probability
+    `sample_rate` or, if `slow_ms` is set, whenever it took at least `slow_ms`
+    milliseconds, so that tail latency is never sampled away. Without an exporter
+    tracing is disabled and costs nothing.
+    """
+
+    def __init__(
+        self,
+        exporter=None,
+        sample_rate: float = 1.0,
+        slow_ms: float | None = None,
+        seed: int | None = None,
+    ) -> None:
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("Sample rate must be between 0 and 1.")
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self._random = random.Random(seed)
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        """
+        Measures the `with` block as a trace and exports it if sampled.
+
+        Args:
+            name (str): Trace name.
+            **attributes: Trace attributes, more can be set on the yielded trace.
+
+        Yields:
+            Trace: Trace (a no-op stand-in if tracing is disabled).
+        """
+        if self.exporter is None:
+            yield NULL_TRACE
+            return
+        trace = Trace(name, **attributes)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.set(error=type(e).__name__)
+            raise
+        finally:
+            trace.duration = time.perf_counter() - trace.start
+            if self._sampled(trace):
+                self.exporter.export(trace.to_dict())
+
+    def _sampled(self, trace: Trace) -> bool:
+        if self.slow_ms is not None and 1000 * trace.duration >= self.slow_ms:
+            return True
+        return self._random.random() < self.sample_rate
+
+
+def get_tracer() -> Tracer:
+    """
+    Returns a tracer set up in config.json (`tracing`): `exporter` is `jsonl`
+    (appending to `path`) or `memory` (keeping the last `max_traces`), sampled with
+    `sample_rate` and `slow_ms`.
+
+    Raises:
+        ValueError: If the exporter is unknown.
+
+    Returns:
+        Tracer: Tracer, disabled if tracing is not enabled.
+    """
+    tracing_config = config.get("tracing", {})
+    if not tracing_config.get("enabled", False):
+        return Tracer()
+    exporter_name = tracing_config.get("exporter", "jsonl")
+    if exporter_name == "jsonl":
+        exporter = JSONLExporter(
+            Path(__file__).parent.parent.joinpath(
+                tracing_config.get("path", "traces/traces.jsonl")
+            )
+        )
+    elif exporter_name == "memory":
+        exporter = RingBufferExporter(tracing_config.get("max_traces", 1000))
+    else:
+        raise ValueError(f"Unknown trace exporter `{exporter_name}`.")
+    return Tracer(
+        exporter,
+        sample_rate=tracing_config.get("sample_rate", 1.0),
+        slow_ms=tracing_config.get("slow_ms"),
+    )
@@ -0,0 +1,122 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+
+MODULES = [
+    "scripts.cache",
+    "scripts.ingestion",
+    "scripts.embeddings",
+    "scripts.loader",
+    "scripts.interface",
+    "scripts.parser",
+]
+
+
+def import_time(module: str, top: int = 10, baseline: set | None = None) -> dict:
+    """
+    Imports a module in a fresh interpreter with `-X importtime` and returns its
+    cumulative import time with the slowest of the packages it pulls in.
+
+    Args:
+        module (str): Module to import.
+        top (int, optional): Number of slowest packages to report. Defaults to 10.
+        baseline (set | None, optional): Packages imported at interpreter startup,
+        left out of the report. Defaults to None.
+
+    Returns:
+        dict: `module`, `total_ms` (None if the import failed), `error` and
+        `slowest` ([package, cumulative ms] pairs).
+    """
+    timings = _import_timings(f"import {module}")
+    baseline = baseline or set()
+    # top level packages only, their submodules are included in cumulative times
+    slowest = sorted(
+        (
+            (name, ms)
+            for name, ms in timings.items()
+            if "." not in name and name not in baseline and name != module
+        ),
+        key=lambda item: -item[1],
+    )
+    return {
+        "module": module,
+        "total_ms": timings.get(module),
+        "error": timings.get("error"),
+        "slowest": slowest[:top],
+    }
+
+
+def _import_timings(code: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, package = line.split("|")
+        name = package.strip()
+        timings[name] = max(timings.get(name, 0), int(cumulative) / 1000)
+    if result.returncode:
+        return {"error": result.stderr.splitlines()[-1]}
+    return timings
+
+
+def command_time(args: list[str], repeat: int = 3) -> float:
+    """
+    Returns the best wall time of a command run in a fresh interpreter.
+
+    Args:
+        args (list[str]): Arguments of the python interpreter.
+        repeat (int, optional): Number of runs. Defaults to 3.
+
+    Returns:
+        float: Time in milliseconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True)
+        times.append(1000 * (time.perf_counter() - start))
+    return min(times)
+
+
+def main(output: str | None = None, top: int = 10):
+    # packages imported by the interpreter itself
+    baseline = set(_import_timings("pass"))
+    report = {
+        "python": sys.version.split()[0],
+        "modules": [
+            import_time(module, top=top, baseline=baseline) for module in MODULES
+        ],
+        "run_help_ms": command_time(["scripts/run.py", "--help"]),
+    }
+    for row in report["modules"]:
+        if row["total_ms"] is None:
+            print(f"{row['module']:<20} FAILED: {row['error']}")
+            continue
+        slowest = ", ".join(f"{name} {ms:.0f}" for name, ms in row["slowest"][:3])
+        print(f"{row['module']:<20} {row['total_ms']:8.1f} ms  ({slowest})")
+    print(f"{'run.py --help':<20} {report['run_help_ms']:8.1f} ms")
+    if output is not None:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Reports import time of project modules (python -X importtime)."
+    )
+    parser.add_argument("-o", "--output", help="JSON file to save the report to.")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    main(output=args.output, top=args.top)
@@ -0,0 +1,307 @@
+import argparse
+import copy
+import json
+import math
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from pathlib import Path
+
+import repackage
+from docx import Document
+
+repackage.up(2)
+from scripts import parser
+from scripts.normalization import Normalizer
+
+ROOT = Path(__file__).parent.parent.parent
+TEST_FILES = ROOT.joinpath("tests", "test_files")
+# a syllabus in the layout `jsonize_pdf` expects, the test PDFs have none
+SYLABUS_TEXT = (
+    "Sylabus praktyk zawodowych na kierunku Ekonomia 1. Nazwa przedmiotu Praktyka "
+    "zawodowa 2. Forma zajęć praktyka 3. Rok akademicki, rok studiów, semestr "
+    "realizacji przedmiotu 2023/2024, rok II, semestr 4 4. Stopień studiów, tryb "
+    "studiów I stopień, stacjonarne 5. Cel przedmiotu Zdobycie doświadczenia 2 z 5 "
+    "K_W01 EP-1 6. Wymagania wstępne Brak 7. Metody kształcenia Wskazane przez "
+    "praktykodawcę; Wiedza Kod efektu Metody weryfikacji 8. "
+)
+# scaling exponent (log of time ratio over log of size ratio between the two
+# largest scales) above which a function is reported as superlinear
+MAX_EXPONENT = 1.3
+FILE_FUNCTIONS = {
+    "extract_text_from_docx": (parser.extract_text_from_docx, ".docx"),
+    "extract_text_from_textual_pdf": (parser.extract_text_from_textual_pdf, ".pdf"),
+    "extract_text_from_pdf": (parser.extract_text_from_pdf, ".pdf"),
+}
+TEXT_FUNCTIONS = {
+    "chunk_text": parser.chunk_text,
+    "split_on_points": parser.split_on_points,
+    "jsonize_pdf": parser.jsonize_pdf,
+    "replace_forbidden_chars": parser.replace_forbidden_chars,
+    "replace_whitespaces": parser.replace_whitespaces,
+    "remove_page_numbers": parser.remove_page_numbers,
+    "remove_codes": parser.remove_codes,
+    "remove_keywords": parser.remove_keywords,
+    "Normalizer": Normalizer(
+        {";": ",", "$": "S"},
+        remove_page_numbers=True,
+        keywords=["Wiedza", "Kod efektu", "Metody weryfikacji"],
+        remove_codes=True,
+    ),
+}
+
+
+def scale_docx(file_path: Path, target_path: Path, scale: int) -> Path:
+    """
+    Writes a DOCX file with the body of a given one repeated `scale` times.
+
+    Args:
+        file_path (Path): DOCX file to scale.
+        target_path (Path): File to write.
+        scale (int): Number of copies of the body.
+
+    Returns:
+        Path: `target_path`.
+    """
+    doc = Document(file_path)
+    body = doc.element.body
+    # section properties must stay the last element of the body
+    elements = [element for element in body if not element.tag.endswith("sectPr")]
+    for _ in range(scale - 1):
+        for element in elements:
+            body.insert(len(body) - 1, copy.deepcopy(element))
+    doc.save(target_path)
+    return target_path
+
+
+def load_inputs(scales: list[int], path: Path) -> tuple[list[tuple], list[tuple]]:
+    """
+    Prepares benchmark inputs: files of `tests/test_files` (DOCX files also scaled
+    up, PDFs only as they are) and texts extracted from them plus a synthetic
+    syllabus, repeated `scale` times.
+
+    Args:
+        scales (list[int]): Scales of the inputs.
+        path (Path): Directory to write scaled files to.
+
+    Returns:
+        tuple[list[tuple], list[tuple]]: File inputs and text inputs, as (name,
+        scale, input, size in bytes) tuples.
+    """
+    files = []
+    texts = [("synthetic:sylabus", SYLABUS_TEXT)]
+    for file_path in sorted(TEST_FILES.iterdir()):
+        if file_path.suffix == ".docx":
+            for scale in scales:
+                target_path = file_path
+                if scale > 1:
+                    target_path = path.joinpath(f"{scale}x_{file_path.name}")
+                    scale_docx(file_path, target_path, scale)
+                size = target_path.stat().st_size
+                files.append((file_path.name, scale, str(target_path), size))
+            text = parser.extract_text_from_docx(str(file_path))
+        elif file_path.suffix == ".pdf":
+            size = file_path.stat().st_size
+            files.append((file_path.name, 1, str(file_path), size))
+            text = parser.extract_text_from_textual_pdf(str(file_path))
+        else:
+            continue
+        if text:
+            texts.append((file_path.name, text))
+    scaled_texts = []
+    for name, text in texts:
+        for scale in scales:
+            scaled = " ".join([text] * scale)
+            scaled_texts.append((name, scale, scaled, len(scaled.encode("utf-8"))))
+    return files, scaled_texts
+
+
+def measure(function, argument, size: int, repeat: int, min_time: float) -> dict:
+    """
+    Measures a call: best time of `repeat` rounds (each at least `min_time`
+    seconds long) and peak memory allocated by Python during a single call.
+
+    Args:
+        function (Callable): Function to call.
+        argument: Its argument.
+        size (int): Input size in bytes.
+        repeat (int): Number of rounds.
+        min_time (float): Minimal duration of a round in seconds.
+
+    Returns:
+        dict: `bytes`, `seconds`, `peak_kib` and `mb_per_s`.
+    """
+    timer = timeit.Timer(lambda: function(argument))
+    # number of calls per round calibrated on a single (warm-up) call
+    elapsed = timer.timeit(number=1)
+    number = max(1, math.ceil(min_time / max(elapsed, 1e-9)))
+    seconds = min(timer.repeat(repeat=repeat, number=number)) / number
+    tracemalloc.start()
+    function(argument)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "bytes": size,
+        "seconds": seconds,
+        "peak_kib": peak / 1024,
+        "mb_per_s": size / seconds / 1e6,
+    }
+
+
+def scaling(results: list[dict]) -> list[dict]:
+    """
+    Returns scaling exponents of functions between the two largest scales of every
+    input: about 1 for linear time, 2 for quadratic.
+
+    Args:
+        results (list[dict]): Benchmark results.
+
+    Returns:
+        list[dict]: `function`, `input`, `exponent` and `superlinear` flag.
+    """
+    series = {}
+    for row in results:
+        series.setdefault((row["function"], row["input"]), []).append(row)
+    exponents = []
+    for (function, name), rows in series.items():
+        if len(rows) < 2:
+            continue
+        small, large = sorted(rows, key=lambda row: row["bytes"])[-2:]
+        exponent = math.log(large["seconds"] / small["seconds"]) / math.log(
+            large["bytes"] / small["bytes"]
+        )
+        exponents.append(
+            {
+                "function": function,
+                "input": name,
+                "exponent": exponent,
+                "superlinear": exponent > MAX_EXPONENT,
+            }
+        )
+    return exponents
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compares times of a report with a baseline report.
+
+    Args:
+        report (dict): Current report.
+        baseline (dict): Report to compare with.
+        tolerance (float): Allowed relative slowdown, e.g. 0.2 for 20%.
+
+    Returns:
+        list[str]: Descriptions of benchmarks slower by more than tolerance.
+    """
+    base = {
+        (row["function"], row["input"], row["scale"]): row["seconds"]
+        for row in baseline["results"]
+    }
+    regressions = []
+    for row in report["results"]:
+        base_seconds = base.get((row["function"], row["input"], row["scale"]))
+        if base_seconds is None:
+            continue
+        change = (row["seconds"] - base_seconds) / base_seconds
+        if change > tolerance:
+            regressions.append(
+                f"{row['function']}({row['input']}, {row['scale']}x): "
+                f"{1e6 * base_seconds:.1f} -> {1e6 * row['seconds']:.1f} us "
+                f"({change:+.0%})"
+            )
+    return regressions
+
+
+def main(
+    scales: list[int] | None = None,
+    functions: list[str] | None = None,
+    repeat: int = 3,
+    min_time: float = 0.05,
+    output: str | None = None,
+    baseline: str | None = None,
+    tolerance: float = 0.2,
+) -> int:
+    if scales is None:
+        scales = [1, 10, 100]
+    results = []
+    skipped = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files, texts = load_inputs(scales, Path(tmp_dir))
+        benchmarks = [
+            (name, function, input_)
+            for name, (function, suffix) in FILE_FUNCTIONS.items()
+            for input_ in files
+            if input_[0].endswith(suffix)
+        ] + [
+            (name, function, input_)
+            for name, function in TEXT_FUNCTIONS.items()
+            for input_ in texts
+        ]
+        for name, function, (input_name, scale, argument, size) in benchmarks:
+            if (functions and name not in functions) or name in skipped:
+                continue
+            try:
+                row = measure(function, argument, size, repeat, min_time)
+            except Exception as e:
+                # e.g. aspose or the spaCy model is not installed
+                skipped[name] = f"{type(e).__name__}: {e}"
+                continue
+            results.append(
+                {"function": name, "input": input_name, "scale": scale, **row}
+            )
+            print(
+                f"{name:<30} {input_name:<28} {scale:>4}x {row['bytes']:>9} B "
+                f"{1e6 * row['seconds']:>11.1f} us {row['peak_kib']:>9.1f} KiB "
+                f"{row['mb_per_s']:>8.2f} MB/s"
+            )
+    report = {
+        "python": sys.version.split()[0],
+        "results": results,
+        "scaling": scaling(results),
+        "skipped": skipped,
+    }
+    for name, error in skipped.items():
+        print(f"SKIPPED {name}: {error}")
+    status = 0
+    for row in report["scaling"]:
+        if row["superlinear"]:
+            print(f"SUPERLINEAR {row['function']}({row['input']}): {row['exponent']:.2f}")
+            status = 1
+    if output is not None:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+    if baseline is not None:
+        with open(baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    parser_ = argparse.ArgumentParser(
+        description=(
+            "Benchmarks parser functions over tests/test_files and scaled-up copies: "
+            "time, peak memory, throughput and scaling."
+        )
+    )
+    parser_.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser_.add_argument(
+        "--functions", nargs="+", help="Functions to benchmark, all by default."
+    )
+    parser_.add_argument("--repeat", type=int, default=3)
+    parser_.add_argument(
+        "--min_time", type=float, default=0.05, help="Minimal round time in seconds."
+    )
+    parser_.add_argument("-o", "--output", help="JSON file to save the report to.")
+    parser_.add_argument("--baseline", help="JSON report to compare with.")
+    parser_.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed relative slowdown before a benchmark is flagged.",
+    )
+    args = parser_.parse_args()
+    sys.exit(main(**vars(args)))
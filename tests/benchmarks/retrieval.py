@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import repackage
+
+repackage.up(2)
+from scripts import interface
+from scripts.corpus import write_corpus
+from scripts.embeddings import HashingEmbeddings
+from scripts.loader import LocalIndex, TextProcessing
+from scripts.tracing import Tracer
+
+ROOT = Path(__file__).parent.parent.parent
+QUERY_FILES = [
+    ROOT.joinpath("tests", "func_tests", "queries.txt"),
+    ROOT.joinpath("tests", "hyperparameter_tuning", "queries.txt"),
+]
+NAMESPACE = "benchmark"
+# latency metrics regress when they grow, throughput metrics when they drop
+LOWER_IS_BETTER = ["p50_ms", "p95_ms", "p99_ms", "mean_ms"]
+HIGHER_IS_BETTER = ["qps", "chunks_per_s"]
+
+
+def load_queries() -> list[str]:
+    """
+    Returns real user queries kept with the functional tests.
+
+    Returns:
+        list[str]: Queries.
+    """
+    queries = []
+    for file_path in QUERY_FILES:
+        with open(file_path, "r", encoding="utf-8") as f:
+            queries.extend(line.strip() for line in f if line.strip())
+    return queries
+
+
+def make_corpus(n_records: int, queries: list[str], seed: int = 0) -> list[dict]:
+    """
+    Generates a reproducible corpus of sentences made of the query vocabulary, so
+    that queries have close and distant matches in it.
+
+    Args:
+        n_records (int): Number of records.
+        queries (list[str]): Queries to take vocabulary from.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        list[dict]: Records with `text`, `source`, `file_type` and `chunk_index`.
+    """
+    rng = random.Random(seed)
+    vocabulary = sorted({word for query in queries for word in re.findall(r"\w+", query)})
+    records = []
+    for i in range(n_records):
+        words = rng.choices(vocabulary, k=rng.randint(15, 60))
+        records.append(
+            {
+                "text": " ".join(words) + ".",
+                "source": f"document_{i // 20}.pdf",
+                "file_type": "Inny",
+                "chunk_index": i % 20,
+            }
+        )
+    return records
+
+
+def percentiles(latencies: list[float], seconds: float) -> dict:
+    """
+    Summarizes latencies of calls made in `seconds`.
+
+    Args:
+        latencies (list[float]): Latencies in seconds.
+        seconds (float): Wall time of all calls.
+
+    Returns:
+        dict: `n`, `p50_ms`, `p95_ms`, `p99_ms`, `mean_ms` and `qps`.
+    """
+    latencies_ms = 1000 * np.asarray(latencies)
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {
+        "n": len(latencies),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "mean_ms": float(latencies_ms.mean()),
+        "qps": len(latencies) / seconds,
+    }
+
+
+def bench_ingestion(index: LocalIndex, records: list[dict], path: Path) -> dict:
+    """
+    Measures loading a Parquet corpus with `load_data_into_index`.
+
+    Args:
+        index (LocalIndex): Empty index to load into.
+        records (list[dict]): Corpus records.
+        path (Path): Directory to write the corpus to.
+
+    Returns:
+        dict: `chunks`, `seconds` and `chunks_per_s`.
+    """
+    file_path = path.joinpath("corpus.parquet")
+    write_corpus(records, file_path)
+    start = time.perf_counter()
+    index.load_data_into_index(file_path, namespace=NAMESPACE)
+    seconds = time.perf_counter() - start
+    chunks = index.index.namespaces[NAMESPACE].size
+    return {"chunks": chunks, "seconds": seconds, "chunks_per_s": chunks / seconds}
+
+
+def bench_queries(queries: list[str], n_queries: int) -> dict:
+    """
+    Measures sequential `make_conversation` calls, as in the CLI: each one runs on
+    the background event loop shared by synchronous calls (see `run_sync`).
+
+    Args:
+        queries (list[str]): Queries, cycled.
+        n_queries (int): Number of calls.
+
+    Returns:
+        dict: See `percentiles`.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for i in range(n_queries):
+        query_start = time.perf_counter()
+        interface.make_conversation(queries[i % len(queries)], namespace=NAMESPACE)
+        latencies.append(time.perf_counter() - query_start)
+    return percentiles(latencies, time.perf_counter() - start)
+
+
+def bench_concurrent_queries(
+    queries: list[str], n_queries: int, concurrency: int
+) -> dict:
+    """
+    Measures `amake_conversation` calls served concurrently from one event loop,
+    at most `concurrency` at a time.
+
+    Args:
+        queries (list[str]): Queries, cycled.
+        n_queries (int): Number of calls.
+        concurrency (int): Maximal number of calls in flight.
+
+    Returns:
+        dict: See `percentiles`, with `concurrency`.
+    """
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def ask(query):
+            async with semaphore:
+                query_start = time.perf_counter()
+                await interface.amake_conversation(query, namespace=NAMESPACE)
+                latencies.append(time.perf_counter() - query_start)
+
+        await asyncio.gather(
+            *(ask(queries[i % len(queries)]) for i in range(n_queries))
+        )
+        return latencies
+
+    start = time.perf_counter()
+    latencies = asyncio.run(run())
+    result = percentiles(latencies, time.perf_counter() - start)
+    result["concurrency"] = concurrency
+    return result
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compares a report with a baseline report.
+
+    Args:
+        report (dict): Current report.
+        baseline (dict): Report to compare with.
+        tolerance (float): Allowed relative change, e.g. 0.2 for 20%.
+
+    Returns:
+        list[str]: Descriptions of metrics that regressed by more than tolerance.
+    """
+    regressions = []
+    for section, values in report["results"].items():
+        base_values = baseline["results"].get(section, {})
+        for metric, value in values.items():
+            base = base_values.get(metric)
+            if not base:
+                continue
+            change = (value - base) / base
+            if (metric in LOWER_IS_BETTER and change > tolerance) or (
+                metric in HIGHER_IS_BETTER and change < -tolerance
+            ):
+                regressions.append(
+                    f"{section}.{metric}: {base:.3f} -> {value:.3f} ({change:+.0%})"
+                )
+    return regressions
+
+
+def main(
+    records: int = 5000,
+    queries: int = 1000,
+    concurrency: int = 16,
+    dimension: int = 1024,
+    seed: int = 0,
+    output: str | None = None,
+    baseline: str | None = None,
+    tolerance: float = 0.2,
+) -> int:
+    query_texts = load_queries()
+    embed = HashingEmbeddings(dimension=dimension)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir)
+        index = LocalIndex(index_name="benchmark", path=path.joinpath("index"))
+        index._manifest_dir = lambda: path.joinpath("manifests")
+        text_processing = TextProcessing()
+        text_processing.embed = embed
+        index._text_processing = text_processing
+        # the raw retrieval path: no caches, no tracing
+        interface.index = index
+        interface.text_processing = text_processing
+        interface.answer_cache = None
+        interface.semantic_cache = None
+        interface.tracer = Tracer()
+        # tokenizer and its token length table are built once per process
+        text_processing.text_splitter.split_text("warm-up")
+        ingestion = bench_ingestion(index, make_corpus(records, query_texts, seed), path)
+        # warm-up, e.g. lazy imports and word caches of the embedder
+        bench_queries(query_texts, len(query_texts))
+        report = {
+            "python": sys.version.split()[0],
+            "parameters": {
+                "records": records,
+                "queries": queries,
+                "concurrency": concurrency,
+                "embeddings": embed.model,
+                "seed": seed,
+            },
+            "results": {
+                "ingestion": ingestion,
+                "make_conversation": bench_queries(query_texts, queries),
+                "amake_conversation": bench_concurrent_queries(
+                    query_texts, queries, concurrency
+                ),
+            },
+        }
+    for section, values in report["results"].items():
+        print(f"{section}: " + ", ".join(f"{k} {v:.6g}" for k, v in values.items()))
+    if output is not None:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+    if baseline is not None:
+        with open(baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Benchmarks ingestion and retrieval offline, with the hashing embedder "
+            "and the local vectorstore."
+        )
+    )
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="JSON file to save the report to.")
+    parser.add_argument("--baseline", help="JSON report to compare with.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed relative change before a metric is flagged as a regression.",
+    )
+    args = parser.parse_args()
+    sys.exit(main(**vars(args)))
@@ -0,0 +1,54 @@
+"""
+Test doubles shared by the test modules: a text splitter and embeddings clients
+that need no tokenizer, network or API quota.
+"""
+import time
+
+
+class WordSplitter:
+    # one chunk (and one token) per word
+    def split_text(self, text):
+        return text.split()
+
+    def split_texts(self, texts):
+        return [self.split_text(text) for text in texts]
+
+    def split_texts_with_lengths(self, texts):
+        return [[(word, 1) for word in self.split_text(text)] for text in texts]
+
+
+class LengthEmbeddings:
+    # embeds a text as [1, its length], counting requests
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [[1.0, float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [1.0, float(len(text))]
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+class InterruptedEmbeddings(LengthEmbeddings):
+    # fails on a given text (after `delay` seconds, e.g. to let earlier batches be
+    # upserted) and records the texts it embedded
+    def __init__(self, fail_on, delay=0.0):
+        super().__init__()
+        self.fail_on = fail_on
+        self.delay = delay
+        self.texts = []
+
+    def embed_documents(self, texts):
+        if self.fail_on in texts:
+            time.sleep(self.delay)
+            raise ConnectionError("Connection reset")
+        self.texts.extend(texts)
+        return super().embed_documents(texts)
@@ -5,7 +5,7 @@ import repackage
 
 repackage.up(2)
 
-from scripts.interface import make_conversation
+from scripts.interface import format_answer, make_conversations
 
 
 def main(verbose=False):
@@ -25,12 +25,13 @@ def main(verbose=False):
 
     # read queries, perform conversation and write queries and answers into trget file
     with open(queries_file_path, "r", encoding="utf-8") as q:
-        with open(answers_file_path, "a", encoding="utf-8") as a:
-            for query in q.readlines():
-                answer = make_conversation(query=query, verbose=verbose) + "\n"
-                final_query = query.replace("\n", "")
-                result = f"{final_query};{answer}"
-                a.write(result)
+        queries = q.readlines()
+    with open(answers_file_path, "a", encoding="utf-8") as a:
+        for query, (answer, score) in zip(queries, make_conversations(queries)):
+            answer = format_answer(answer, score, verbose=verbose) + "\n"
+            final_query = query.replace("\n", "")
+            result = f"{final_query};{answer}"
+            a.write(result)
 
 
 if __name__ == "__main__":
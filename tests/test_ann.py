@@ -0,0 +1,79 @@
+# to run: .venv/Scripts/python.exe -m pytest -vv  tests/test_ann.py -s
+import numpy as np
+import pytest
+import repackage
+
+repackage.up()
+from scripts import ann
+from scripts.loader import LocalVectorStore
+
+
+@pytest.fixture(name="vectors")
+def vectors():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(8, 16))
+    points = centers[rng.integers(0, 8, 400)] + 0.1 * rng.normal(size=(400, 16))
+    yield ann.normalize(points)
+
+
+def test_top_k_rows():
+    rows, scores = ann.top_k_rows(np.array([0.1, 0.9, 0.5, 0.7]), 2)
+    assert rows.tolist() == [1, 3]
+    assert scores.tolist() == [0.9, 0.7]
+
+
+def test_normalize_zero_vector():
+    assert ann.normalize(np.zeros(3)).tolist() == [0.0, 0.0, 0.0]
+
+
+def test_ivf_build_offsets(vectors):
+    ivf, order = ann.IVFFlat.build(vectors, nlist=8)
+    assert sorted(order.tolist()) == list(range(len(vectors)))
+    assert ivf.offsets[0] == 0
+    assert ivf.indexed == len(vectors)
+
+
+def test_ivf_search_all_lists_is_exact(vectors):
+    ivf, order = ann.IVFFlat.build(vectors, nlist=8)
+    sorted_vectors = vectors[order]
+    query = sorted_vectors[0]
+    rows, _ = ivf.search(sorted_vectors, query, 5, nprobe=8)
+    exact_rows, _ = ann.top_k_rows(sorted_vectors @ query, 5)
+    assert rows.tolist() == exact_rows.tolist()
+
+
+def test_ivf_search_scans_tail(vectors):
+    ivf, order = ann.IVFFlat.build(vectors[:-1], nlist=8)
+    sorted_vectors = np.concatenate([vectors[:-1][order], vectors[-1:]])
+    rows, _ = ivf.search(sorted_vectors, vectors[-1], 1, nprobe=1)
+    assert rows.tolist() == [len(vectors) - 1]
+
+
+def test_ivf_remove_rows():
+    ivf = ann.IVFFlat(np.zeros((2, 2)), np.array([0, 2, 4]))
+    ivf.remove_rows(np.array([True, False, True, True, True]))
+    assert ivf.offsets.tolist() == [0, 1, 3]
+
+
+def test_recall_report(vectors):
+    ivf, order = ann.IVFFlat.build(vectors, nlist=8)
+    sorted_vectors = vectors[order]
+    report = ann.recall_report(sorted_vectors, ivf, sorted_vectors[:10], nprobes=[8])
+    assert report[0]["nprobe"] == "exact"
+    assert report[1]["recall"] == 1.0
+
+
+def test_local_vector_store_ann_mmap(vectors, tmp_path):
+    store = LocalVectorStore(tmp_path)
+    store.upsert(
+        vectors=[(str(i), v, {"i": i}) for i, v in enumerate(vectors)], namespace="ns"
+    )
+    store.build_ann("ns", nlist=8)
+    store.save("ns")
+    loaded = LocalVectorStore(tmp_path, mmap=True, nprobe=8)
+    assert isinstance(loaded.namespaces["ns"].vectors, np.memmap)
+    res = loaded.query(vector=vectors[3], top_k=1, namespace="ns")
+    assert res["matches"][0]["metadata"] == {"i": 3}
+    loaded.delete(ids=["3"], namespace="ns")
+    res = loaded.query(vector=vectors[3], top_k=1, namespace="ns")
+    assert res["matches"][0]["id"] != "3"
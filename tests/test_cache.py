@@ -0,0 +1,234 @@
+# to run: .venv/Scripts/python.exe -m pytest -vv  tests/test_cache.py -s
+import asyncio
+import os
+import sqlite3
+import threading
+
+import pytest
+import repackage
+
+repackage.up()
+from scripts import cache
+from fakes import LengthEmbeddings
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return [float(len(text)), 1.0]
+
+
+@pytest.fixture(name="embedding_cache")
+def embedding_cache(tmp_path):
+    yield cache.EmbeddingCache(tmp_path.joinpath("embeddings.sqlite"), max_entries=3)
+
+
+def test_embedding_cache_get_many(embedding_cache):
+    embedding_cache.put_many("model", ["a", "bb"], [[1.0, 2.0], [3.0, 4.0]])
+    assert embedding_cache.get_many("model", ["bb", "c", "a"]) == [
+        [3.0, 4.0],
+        None,
+        [1.0, 2.0],
+    ]
+    assert embedding_cache.get_many("other-model", ["a"]) == [None]
+
+
+def test_embedding_cache_evicts_least_recently_used(embedding_cache):
+    embedding_cache.put_many("model", ["a", "b", "c"], [[1.0], [2.0], [3.0]])
+    embedding_cache.get_many("model", ["a"])
+    embedding_cache.put_many("model", ["d"], [[4.0]])
+    assert len(embedding_cache) == 3
+    assert embedding_cache.get_many("model", ["a", "b"]) == [[1.0], None]
+
+
+def test_embedding_cache_touches_in_batches(embedding_cache, monkeypatch):
+    def last_used():
+        with sqlite3.connect(embedding_cache.path) as connection:
+            return dict(connection.execute("SELECT key, last_used FROM embeddings"))
+
+    embedding_cache.put_many("model", ["a", "b"], [[1.0], [2.0]])
+    stored = last_used()
+    # hits are not written one by one
+    embedding_cache.get_many("model", ["a"])
+    assert last_used() == stored
+    embedding_cache.flush()
+    key = embedding_cache.make_key("model", "a")
+    assert last_used()[key] > stored[key]
+    monkeypatch.setattr(cache, "_TOUCH_FLUSH_ENTRIES", 2)
+    stored = last_used()
+    embedding_cache.get_many("model", ["a"])
+    assert last_used() == stored
+    embedding_cache.get_many("model", ["b"])
+    assert all(last_used()[key] > stored[key] for key in stored)
+
+
+def test_embedding_cache_is_persistent(tmp_path):
+    path = tmp_path.joinpath("embeddings.sqlite")
+    cache.EmbeddingCache(path).put_many("model", ["a"], [[1.0]])
+    assert cache.EmbeddingCache(path).get_many("model", ["a"]) == [[1.0]]
+
+
+def test_cached_embeddings_embed_documents(embedding_cache):
+    embeddings = CountingEmbeddings()
+    cached = cache.CachedEmbeddings(embeddings, embedding_cache, "model")
+    result = cached.embed_documents(["a", "bb", "a"])
+    assert result == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert cached.embed_documents(["bb", "ccc"]) == [[2.0, 1.0], [3.0, 1.0]]
+    assert embeddings.calls == [["a", "bb"], ["ccc"]]
+
+
+def test_cached_embeddings_embed_query(embedding_cache):
+    embeddings = CountingEmbeddings()
+    cached = cache.CachedEmbeddings(embeddings, embedding_cache, "model")
+    cached.embed_query("query")
+    assert cached.embed_query("query") == [5.0, 1.0]
+    assert embeddings.calls == [["query"]]
+
+
+def test_cached_embeddings_async_off_event_loop(embedding_cache):
+    cached = cache.CachedEmbeddings(LengthEmbeddings(), embedding_cache, "model")
+    threads = set()
+    get_many = embedding_cache.get_many
+
+    def recording_get_many(*args):
+        threads.add(threading.get_ident())
+        return get_many(*args)
+
+    embedding_cache.get_many = recording_get_many
+
+    async def run():
+        await cached.aembed_query("query")
+        return await cached.aembed_documents(["a", "query"])
+
+    assert asyncio.run(run()) == [[1.0, 1.0], [1.0, 5.0]]
+    assert threading.get_ident() not in threads
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_parse_cache(tmp_path):
+    file_path = tmp_path.joinpath("file.docx")
+    file_path.write_bytes(b"content")
+    parse_cache = cache.ParseCache(tmp_path.joinpath("parse.sqlite"), version="1")
+    assert parse_cache.get(file_path) is None
+    parse_cache.put(file_path, ["zdanie 1", "zdanie 2"])
+    assert parse_cache.get(file_path) == ["zdanie 1", "zdanie 2"]
+    parse_cache.close()
+    parse_cache = cache.ParseCache(tmp_path.joinpath("parse.sqlite"), version="1")
+    assert parse_cache.get(file_path) == ["zdanie 1", "zdanie 2"]
+    assert cache.ParseCache(tmp_path.joinpath("parse.sqlite"), "2").get(file_path) is None
+
+
+def test_parse_cache_modified_file(tmp_path):
+    file_path = tmp_path.joinpath("file.docx")
+    file_path.write_bytes(b"content")
+    parse_cache = cache.ParseCache(tmp_path.joinpath("parse.sqlite"), version="1")
+    parse_cache.put(file_path, [])
+    # touched only
+    os.utime(file_path, ns=(0, 10**9))
+    assert parse_cache.get(file_path) == []
+    file_path.write_bytes(b"CONTENT")
+    os.utime(file_path, ns=(0, 2 * 10**9))
+    assert parse_cache.get(file_path) is None
+
+
+def test_normalize_query():
+    query = "  Jak zmienić   PROMOTORA?\n"
+    assert cache.normalize_query(query) == "jak zmienić promotora"
+    assert cache.normalize_query("Jak zmienić promotora ?!") == "jak zmienić promotora"
+
+
+def test_normalize_query_keeps_meaningful_punctuation():
+    assert cache.normalize_query("Ocena 3.5?") != cache.normalize_query("Ocena 35?")
+    assert cache.normalize_query("Kurs C++") != cache.normalize_query("Kurs C")
+    assert cache.normalize_query("Kurs C++.") == "kurs c++"
+
+
+def test_answer_cache_make_key():
+    key_1 = cache.AnswerCache.make_key("Jak zmienić promotora?", "ns", 0.8, "sentences")
+    key_2 = cache.AnswerCache.make_key("jak zmienić promotora\n", "ns", 0.8, "sentences")
+    key_3 = cache.AnswerCache.make_key("jak zmienić promotora", "ns", 0.9, "sentences")
+    assert key_1 == key_2
+    assert key_1 != key_3
+
+
+def test_answer_cache_ttl():
+    clock = FakeClock()
+    answer_cache = cache.AnswerCache(ttl=10, clock=clock)
+    answer_cache.put(("q", "ns"), "answer")
+    clock.now = 9
+    assert answer_cache.get(("q", "ns")) == "answer"
+    clock.now = 10
+    assert answer_cache.get(("q", "ns")) is None
+    assert (answer_cache.hits, answer_cache.misses) == (1, 1)
+
+
+def test_answer_cache_lru():
+    answer_cache = cache.AnswerCache(max_entries=2)
+    answer_cache.put(("a", "ns"), 1)
+    answer_cache.put(("b", "ns"), 2)
+    answer_cache.get(("a", "ns"))
+    answer_cache.put(("c", "ns"), 3)
+    assert answer_cache.get(("b", "ns")) is None
+    assert answer_cache.get(("a", "ns")) == 1
+
+
+def test_invalidate_namespace():
+    answer_cache = cache.AnswerCache()
+    answer_cache.put(("a", "ns"), 1)
+    answer_cache.put(("a", "other"), 2)
+    cache.invalidate_namespace("ns")
+    assert answer_cache.get(("a", "ns")) is None
+    assert answer_cache.get(("a", "other")) == 2
+
+
+def test_semantic_cache_get():
+    semantic_cache = cache.SemanticCache(max_distance=0.01)
+    semantic_cache.put([1.0, 0.0], "ns", 0.8, "sentences", "answer")
+    assert semantic_cache.get([2.0, 0.01], "ns", 0.8, "sentences") == "answer"
+    assert semantic_cache.get([1.0, 1.0], "ns", 0.8, "sentences") is None
+    assert semantic_cache.get([1.0, 0.0], "other", 0.8, "sentences") is None
+    assert semantic_cache.hit_rate == pytest.approx(1 / 3)
+
+
+def test_semantic_cache_evicts_least_recently_used():
+    semantic_cache = cache.SemanticCache(max_entries=2, max_distance=0.01)
+    semantic_cache.put([1.0, 0.0, 0.0], "ns", 0.8, "sentences", "a")
+    semantic_cache.put([0.0, 1.0, 0.0], "ns", 0.8, "sentences", "b")
+    semantic_cache.get([1.0, 0.0, 0.0], "ns", 0.8, "sentences")
+    semantic_cache.put([0.0, 0.0, 1.0], "ns", 0.8, "sentences", "c")
+    assert len(semantic_cache) == 2
+    assert semantic_cache.get([0.0, 1.0, 0.0], "ns", 0.8, "sentences") is None
+    assert semantic_cache.get([1.0, 0.0, 0.0], "ns", 0.8, "sentences") == "a"
+
+
+def test_semantic_cache_forgets_unused_parameters():
+    semantic_cache = cache.SemanticCache(max_entries=2, max_distance=0.01)
+    for i in range(100):
+        semantic_cache.put([1.0, 0.0], f"ns{i}", 0.8, "sentences", i)
+    # only parameters of live entries are kept
+    assert len(semantic_cache._param_ids) == 2
+    assert semantic_cache.get([1.0, 0.0], "ns99", 0.8, "sentences") == 99
+    assert semantic_cache.get([1.0, 0.0], "ns0", 0.8, "sentences") is None
+    cache.invalidate_namespace()
+    assert semantic_cache._param_ids == {}
+
+
+def test_semantic_cache_invalidate_namespace():
+    semantic_cache = cache.SemanticCache()
+    semantic_cache.put([1.0, 0.0], "ns", 0.8, "sentences", "answer")
+    cache.invalidate_namespace("ns")
+    assert semantic_cache.get([1.0, 0.0], "ns", 0.8, "sentences") is None
@@ -0,0 +1,40 @@
+# to run: .venv/Scripts/python.exe -m pytest -vv  tests/test_corpus.py -s
+import pyarrow.parquet as pq
+import repackage
+
+repackage.up()
+from scripts.corpus import read_batches, read_records, write_corpus
+from scripts.ingestion import content_hash
+
+
+def test_write_corpus(tmp_path):
+    file_path = tmp_path.joinpath("corpus.parquet")
+    records = [
+        {
+            "text": f'"tekst"; nr {i}\nzażółć',
+            "source": "dir/file.docx",
+            "file_type": "Inny",
+            "chunk_index": i,
+        }
+        for i in range(5)
+    ]
+    assert write_corpus(records, file_path, batch_size=2) == 5
+    assert list(read_records(file_path, batch_size=2)) == records
+    table = pq.read_table(file_path)
+    assert table.column("content_hash").to_pylist() == [
+        content_hash(record["text"]) for record in records
+    ]
+
+
+def test_write_corpus_empty(tmp_path):
+    file_path = tmp_path.joinpath("corpus.parquet")
+    assert write_corpus([], file_path) == 0
+    assert list(read_records(file_path)) == []
+
+
+def test_read_batches(tmp_path):
+    file_path = tmp_path.joinpath("corpus.parquet")
+    write_corpus(({"text": str(i), "source": "file"} for i in range(10)), file_path)
+    batches = list(read_batches(file_path, columns=["text"], batch_size=4))
+    assert [batch.num_rows for batch in batches] == [4, 4, 2]
+    assert batches[0].schema.names == ["text"]
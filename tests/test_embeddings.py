@@ -0,0 +1,48 @@
+# to run: .venv/Scripts/python.exe -m pytest -vv  tests/test_embeddings.py -s
+import asyncio
+
+import numpy as np
+import pytest
+import repackage
+
+repackage.up()
+from scripts import embeddings
+from scripts.embeddings import HashingEmbeddings
+
+
+def test_hashing_embeddings_embed_documents():
+    model = HashingEmbeddings(dimension=64)
+    vectors = np.array(model.embed_documents(["Regulamin studiów", "", "regulamin"]))
+    assert vectors.shape == (3, 64)
+    assert np.linalg.norm(vectors, axis=1) == pytest.approx([1.0, 0.0, 1.0], abs=1e-6)
+    assert model.embed_documents(["Regulamin studiów"])[0] == pytest.approx(
+        vectors[0].tolist()
+    )
+    assert HashingEmbeddings(dimension=64).embed_query("regulamin") == pytest.approx(
+        vectors[2].tolist()
+    )
+
+
+def test_hashing_embeddings_similarity():
+    model = HashingEmbeddings()
+    query, close, far = model.embed_array(
+        ["regulamin studiów", "regulaminu studiów", "opłata za akademik"]
+    )
+    assert query @ close > query @ far
+
+
+def test_hashing_embeddings_async():
+    model = HashingEmbeddings(dimension=64)
+    assert asyncio.run(model.aembed_query("tekst")) == model.embed_query("tekst")
+    assert asyncio.run(model.aembed_documents(["tekst"])) == model.embed_documents(
+        ["tekst"]
+    )
+
+
+def test_get_embeddings(monkeypatch):
+    monkeypatch.setitem(embeddings.config, "embeddings", {"backend": "local"})
+    assert isinstance(embeddings.get_embeddings(), HashingEmbeddings)
+    assert embeddings.get_dimension() == 1024
+    monkeypatch.setitem(embeddings.config, "embeddings", {"backend": "other"})
+    with pytest.raises(ValueError, match="Unknown embeddings backend `other`."):
+        embeddings.get_embeddings()
@@ -0,0 +1,288 @@
+# to run: .venv/Scripts/python.exe -m pytest -vv  tests/test_ingestion.py -s
+from types import SimpleNamespace
+
+import pytest
+import repackage
+
+repackage.up()
+from scripts.ingestion import (
+    Checkpoint,
+    IngestionPipeline,
+    Manifest,
+    TokenBudget,
+    chunk_id,
+    is_throttling_error,
+    pack,
+)
+from scripts.loader import LocalVectorStore
+from scripts.metrics import Metrics
+from fakes import InterruptedEmbeddings, LengthEmbeddings, WordSplitter
+
+
+class FailingEmbeddings:
+    def embed_documents(self, texts):
+        raise ConnectionError("API unavailable")
+
+
+class RateLimitError(Exception):
+    http_status = 429
+
+
+class ThrottlingEmbeddings(LengthEmbeddings):
+    # refuses requests of more than `max_texts` texts, like a provider over quota
+    def __init__(self, max_texts):
+        super().__init__()
+        self.max_texts = max_texts
+
+    def embed_documents(self, texts):
+        if len(texts) > self.max_texts:
+            raise RateLimitError("Rate limit reached")
+        return super().embed_documents(texts)
+
+
+def make_pipeline(index, embeddings, **kwargs):
+    text_processing = SimpleNamespace(text_splitter=WordSplitter(), embed=embeddings)
+    return IngestionPipeline(
+        index=index,
+        text_processing=text_processing,
+        namespace="ns",
+        target_column="sentences",
+        **kwargs,
+    )
+
+
+def test_ingestion_pipeline_run():
+    store = LocalVectorStore()
+    pipeline = make_pipeline(store, LengthEmbeddings(), batch_limit=2, embed_workers=3)
+    records = [{"text": f"record {i} text", "source": "file"} for i in range(50)]
+    # "record" and "text" chunks repeat in all records of the source
+    assert pipeline.run(records) == 52
+    assert store.describe_index_stats()["namespaces"]["ns"]["vector_count"] == 52
+    metadata = store.namespaces["ns"].metadata[0]
+    assert metadata["sentences"] in [record["text"] for record in records]
+    assert metadata["chunk"] in (0, 1, 2)
+
+
+def test_ingestion_pipeline_metrics():
+    metrics = Metrics()
+    pipeline = make_pipeline(
+        LocalVectorStore(), LengthEmbeddings(), batch_limit=2, metrics=metrics
+    )
+    pipeline.run([{"text": "a b c", "source": "file"}, {"text": "d", "source": "file"}])
+    summary = metrics.summary()
+    assert summary["records_total"] == 2
+    assert summary["chunks_total"] == 4
+    assert summary["tokens_total"] == 4
+    assert summary["embedding_requests_total"] == 2
+    assert summary["embedding_batch_size"]["sum"] == 4
+    assert summary["upsert_requests_total"] == 2
+    assert summary["upsert_payload_bytes"]["min"] > 0
+    assert summary["ingestion_seconds"]["count"] == 1
+
+
+def test_ingestion_pipeline_run_empty():
+    store = LocalVectorStore()
+    assert make_pipeline(store, LengthEmbeddings()).run([]) == 0
+
+
+def test_ingestion_pipeline_run_failure():
+    metrics = Metrics()
+    pipeline = make_pipeline(
+        LocalVectorStore(), FailingEmbeddings(), batch_limit=1, metrics=metrics
+    )
+    with pytest.raises(RuntimeError, match="Ingestion failed.") as e:
+        pipeline.run({"text": f"record {i}", "source": "file"} for i in range(100))
+    assert isinstance(e.value.__cause__, ConnectionError)
+    assert metrics.summary()["errors_total"]["stage=embed"] >= 1
+
+
+def test_chunk_id():
+    assert chunk_id("file", "text") == chunk_id("file", "text")
+    assert chunk_id("file", "text") != chunk_id("other file", "text")
+    assert chunk_id("file", "text") != chunk_id("file", "other text")
+
+
+def test_ingestion_pipeline_incremental(tmp_path):
+    store = LocalVectorStore()
+    manifest_path = tmp_path.joinpath("ns.json")
+    records = [{"text": "a b c", "source": "file"}]
+    make_pipeline(store, LengthEmbeddings(), manifest=Manifest(manifest_path)).run(
+        records
+    )
+    pipeline = make_pipeline(store, LengthEmbeddings(), manifest=Manifest(manifest_path))
+    assert pipeline.run([{"text": "a b d", "source": "file"}]) == 1
+    assert (pipeline.skipped, pipeline.deleted) == (2, 1)
+    ids = {chunk_id("file", text) for text in "abd"}
+    assert set(store.namespaces["ns"].ids) == ids
+    assert set(Manifest(manifest_path).entries) == ids
+
+
+def test_ingestion_pipeline_prunes_loaded_sources_only(tmp_path):
+    store = LocalVectorStore()
+    manifest_path = tmp_path.joinpath("ns.json")
+
+    def load(records):
+        pipeline = make_pipeline(
+            store, LengthEmbeddings(), manifest=Manifest(manifest_path)
+        )
+        pipeline.run(records)
+        return pipeline
+
+    load([{"text": "a b c", "source": "first"}])
+    assert load([{"text": "d", "source": "second"}]).deleted == 0
+    assert len(store.namespaces["ns"].ids) == 4
+    # reloading a source prunes its vanished chunks only
+    assert load([{"text": "a b", "source": "first"}]).deleted == 1
+    assert set(store.namespaces["ns"].ids) == {
+        chunk_id("first", "a"),
+        chunk_id("first", "b"),
+        chunk_id("second", "d"),
+    }
+
+
+def test_ingestion_pipeline_failure_keeps_manifest(tmp_path):
+    store = LocalVectorStore()
+    manifest = Manifest(tmp_path.joinpath("ns.json"))
+    manifest.entries = {"old": "file"}
+    pipeline = make_pipeline(store, FailingEmbeddings(), manifest=manifest)
+    with pytest.raises(RuntimeError):
+        pipeline.run([{"text": "a", "source": "file"}])
+    assert Manifest(tmp_path.joinpath("ns.json")).entries == {"old": "file"}
+
+
+def test_ingestion_pipeline_resume(tmp_path):
+    store = LocalVectorStore()
+    records = [{"text": f"w{i}", "source": "file"} for i in range(10)]
+
+    def pipeline(embeddings):
+        return make_pipeline(
+            store,
+            embeddings,
+            batch_limit=2,
+            embed_workers=1,
+            upsert_workers=1,
+            manifest=Manifest(tmp_path.joinpath("ns.json")),
+            checkpoint=Checkpoint(tmp_path.joinpath("ns.checkpoint.jsonl")),
+        )
+
+    with pytest.raises(RuntimeError):
+        interrupted = pipeline(InterruptedEmbeddings(fail_on="w8", delay=0.2))
+        interrupted.run(records, input_key="v1")
+    assert Checkpoint(tmp_path.joinpath("ns.checkpoint.jsonl")).load("v1") == (
+        8,
+        {chunk_id("file", f"w{i}"): "file" for i in range(8)},
+    )
+    embeddings = InterruptedEmbeddings(fail_on=None)
+    resumed = pipeline(embeddings)
+    assert resumed.run(records, resume=True, input_key="v1") == 2
+    assert resumed.resumed == 8
+    # nothing embedded twice, nothing missing
+    assert embeddings.texts == ["w8", "w9"]
+    assert len(store.namespaces["ns"].ids) == 10
+    assert len(Manifest(tmp_path.joinpath("ns.json")).entries) == 10
+    assert not tmp_path.joinpath("ns.checkpoint.jsonl").exists()
+
+
+def test_checkpoint(tmp_path):
+    checkpoint = Checkpoint(tmp_path.joinpath("checkpoint.jsonl"))
+    assert checkpoint.load("v1") == (0, {})
+    checkpoint.start("v1", offset=5)
+    checkpoint.commit(None, {"b": "file"})
+    checkpoint.commit(7, {"a": "file"})
+    checkpoint.close()
+    assert checkpoint.load("v1") == (7, {"a": "file", "b": "file"})
+    # offsets of another input are not resumed, its chunks are still upserted
+    assert checkpoint.load("v2") == (0, {"a": "file", "b": "file"})
+    assert checkpoint.load(None) == (0, {"a": "file", "b": "file"})
+    # a line torn by a crash is ignored
+    with open(checkpoint.path, "a", encoding="utf-8") as f:
+        f.write('{"offset": 9, "ids": {"c"')
+    assert checkpoint.load("v1") == (7, {"a": "file", "b": "file"})
+    checkpoint.delete()
+    assert not checkpoint.path.exists()
+
+
+def test_ingestion_pipeline_metadata():
+    store = LocalVectorStore()
+    record = {"text": "a b", "source": "file", "file_type": "Inny", "chunk_index": None}
+    make_pipeline(store, LengthEmbeddings()).run([record])
+    assert store.namespaces["ns"].metadata[0] == {
+        "chunk": 0,
+        "sentences": "a b",
+        "source": "file",
+        "file_type": "Inny",
+    }
+
+
+def test_ingestion_pipeline_token_budget():
+    metrics = Metrics()
+    pipeline = make_pipeline(
+        LocalVectorStore(),
+        LengthEmbeddings(),
+        metrics=metrics,
+        token_budget=TokenBudget(max_tokens=3, min_tokens=1),
+    )
+    records = [{"text": f"a{i} b{i} c{i} d{i}", "source": "file"} for i in range(5)]
+    assert pipeline.run(records) == 20
+    # 1 token per word in WordSplitter
+    assert metrics.summary()["embedding_batch_tokens"]["max"] == 3
+    assert metrics.summary()["embedding_requests_total"] == 7
+
+
+def test_ingestion_pipeline_throttling():
+    metrics = Metrics()
+    token_budget = TokenBudget(max_tokens=8, min_tokens=1)
+    pipeline = make_pipeline(
+        LocalVectorStore(),
+        ThrottlingEmbeddings(max_texts=2),
+        embed_workers=1,
+        metrics=metrics,
+        token_budget=token_budget,
+        retry_backoff=0,
+    )
+    records = [{"text": f"a{i} b{i} c{i} d{i}", "source": "file"} for i in range(4)]
+    assert pipeline.run(records) == 16
+    assert metrics.summary()["retries_total"]["stage=embed"] >= 1
+    assert token_budget.value < 8
+    # a request that never fits fails after max_retries
+    pipeline = make_pipeline(
+        LocalVectorStore(),
+        ThrottlingEmbeddings(max_texts=0),
+        token_budget=TokenBudget(max_tokens=8, min_tokens=1),
+        max_retries=2,
+        retry_backoff=0,
+    )
+    with pytest.raises(RuntimeError, match="Ingestion failed.") as e:
+        pipeline.run([{"text": "a b", "source": "file"}])
+    assert isinstance(e.value.__cause__, RateLimitError)
+
+
+def test_token_budget():
+    budget = TokenBudget(max_tokens=1000, min_tokens=100, target_latency=1.0)
+    budget.throttle()
+    assert budget.value == 500
+    budget.record(latency=0.5)
+    assert budget.value == 600
+    budget.record(latency=2.0)
+    assert budget.value == 300
+    for _ in range(10):
+        budget.throttle()
+    assert budget.value == 100
+    with pytest.raises(ValueError):
+        TokenBudget(max_tokens=10, min_tokens=20)
+
+
+def test_pack():
+    assert pack([1, 2, 3, 1, 5], max_tokens=4, max_items=10) == [
+        slice(0, 2),
+        slice(2, 4),
+        slice(4, 5),
+    ]
+    assert pack([1, 1, 1], max_tokens=10, max_items=2) == [slice(0, 2), slice(2, 3)]
+    assert pack([], max_tokens=10, max_items=2) == []
+
+
+def test_is_throttling_error():
+    assert is_throttling_error(RateLimitError())
+    assert is_throttling_error(TimeoutError())
+    assert not is_throttling_error(ValueError())
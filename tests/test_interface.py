@@ -0,0 +1,135 @@
+# to run: .venv/Scripts/python.exe -m pytest -vv  tests/test_interface.py -s
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+import repackage
+
+repackage.up()
+from scripts import interface
+from scripts.cache import AnswerCache, SemanticCache
+from scripts.loader import LocalIndex, get_session
+from scripts.tracing import RingBufferExporter, Tracer
+from fakes import LengthEmbeddings
+
+
+@pytest.fixture(name="local_index")
+def local_index(tmp_path, monkeypatch):
+    li = LocalIndex(index_name="lazarski-test", path=tmp_path)
+    li.index.upsert(
+        vectors=[
+            ("a", [1.0, 1.0], {"sentences": "short"}),
+            ("b", [1.0, 10.0], {"sentences": "long"}),
+        ],
+        namespace="ns",
+    )
+    embeddings = LengthEmbeddings()
+    monkeypatch.setattr(interface, "index", li)
+    monkeypatch.setattr(interface, "text_processing", SimpleNamespace(embed=embeddings))
+    yield li
+
+
+def test_get_answer_1():
+    res = [({"sentences": "answer"}, 0.9)]
+    assert interface.get_answer(res, 0.8, "sentences") == ("answer", 0.9)
+
+
+def test_get_answer_2():
+    res = [({"sentences": "answer"}, 0.7)]
+    assert interface.get_answer(res, 0.8, "sentences") == ("Not in KB.", 0.7)
+
+
+def test_get_answer_3():
+    assert interface.get_answer([], 0.8, "sentences") == ("Not in KB.", 0.0)
+
+
+def test_format_answer():
+    assert interface.format_answer("answer", 0.9) == "answer"
+    assert interface.format_answer("answer", 0.9, verbose=True) == "score: 0.9 answer"
+
+
+def test_make_conversation(local_index):
+    answer = interface.make_conversation("x", namespace="ns", threshold=0.5)
+    assert answer == "short"
+
+
+def test_make_conversations(local_index):
+    result = interface.make_conversations(
+        ["x", "ten chars!", "y"], namespace="ns", threshold=0.5
+    )
+    assert [answer for answer, _ in result] == ["short", "long", "short"]
+    assert interface.text_processing.embed.calls == 1
+    assert interface.make_conversations([], namespace="ns") == []
+
+
+def test_make_conversation_shares_session(local_index):
+    async def session_id():
+        return id(get_session())
+
+    # sync calls reuse one event loop, so one pooled HTTP session
+    assert interface.run_sync(session_id()) == interface.run_sync(session_id())
+
+    async def ask():
+        # also callable from a thread with a running event loop
+        return interface.make_conversation("x", namespace="ns", threshold=0.5)
+
+    assert asyncio.run(ask()) == "short"
+
+
+def test_amake_conversation(local_index):
+    async def ask():
+        return await asyncio.gather(
+            interface.amake_conversation("x", namespace="ns", threshold=0.5),
+            interface.amake_conversation("ten chars!", namespace="ns", threshold=0.5),
+        )
+
+    assert asyncio.run(ask()) == ["short", "long"]
+
+
+def test_make_conversation_answer_cache(local_index, monkeypatch):
+    monkeypatch.setattr(interface, "answer_cache", AnswerCache())
+    interface.make_conversations(["x"], namespace="ns", threshold=0.5)
+    calls = interface.text_processing.embed.calls
+    assert interface.make_conversation("X?\n", namespace="ns", threshold=0.5) == "short"
+    assert interface.make_conversations(["x"], namespace="ns", threshold=0.5) == [
+        ("short", pytest.approx(1.0))
+    ]
+    assert interface.text_processing.embed.calls == calls
+    local_index._delete_data("ns")
+    assert interface.make_conversation("x", namespace="ns", threshold=0.5) == "Not in KB."
+
+
+def test_make_conversation_semantic_cache(local_index, monkeypatch):
+    semantic_cache = SemanticCache(max_distance=0.01)
+    monkeypatch.setattr(interface, "semantic_cache", semantic_cache)
+    interface.make_conversation("x", namespace="ns", threshold=0.5)
+    # "y" has the same embedding as "x" in LengthEmbeddings
+    async def not_queried(*args, **kwargs):
+        raise AssertionError("index queried on a semantic cache hit")
+
+    monkeypatch.setattr(local_index, "aquery", not_queried)
+    monkeypatch.setattr(local_index, "query", not_queried)
+    assert interface.make_conversation("y", namespace="ns", threshold=0.5) == "short"
+    assert semantic_cache.hits == 1
+
+
+def test_make_conversation_trace(local_index, monkeypatch):
+    exporter = RingBufferExporter()
+    monkeypatch.setattr(interface, "tracer", Tracer(exporter))
+    monkeypatch.setattr(interface, "answer_cache", AnswerCache())
+    interface.make_conversation("x", namespace="ns", threshold=0.5)
+    interface.make_conversation("x", namespace="ns", threshold=0.5)
+    miss, hit = exporter.traces()
+    assert [span["name"] for span in miss["spans"]] == [
+        "normalization",
+        "cache_lookup",
+        "embedding",
+        "vector_search",
+        "thresholding",
+    ]
+    assert miss["attributes"]["namespace"] == "ns"
+    assert miss["attributes"]["score"] == pytest.approx(1.0)
+    assert miss["attributes"]["answer_cache_hit"] is False
+    assert miss["spans"][-1]["found"] is True
+    assert [span["name"] for span in hit["spans"]] == ["normalization", "cache_lookup"]
+    assert hit["spans"][1]["hit"] is True
@@ -1,14 +1,27 @@
 # to run: .venv/Scripts/python.exe -m pytest -vv  tests/test_loader.py -s
+import json
+import os
 from pathlib import Path, WindowsPath
+from types import SimpleNamespace
 
+import numpy as np
 import pinecone
 import pytest
 import repackage
 from datasets import load_dataset
 
 repackage.up()
-from scripts.interface import PineconeIndex, TextProcessing
-from scripts.loader import convert_path_to_string
+from scripts import loader
+from scripts.corpus import write_corpus
+from scripts.ingestion import chunk_id
+from scripts.loader import (
+    LocalIndex,
+    LocalVectorStore,
+    PineconeIndex,
+    TextProcessing,
+    convert_path_to_string,
+)
+from fakes import InterruptedEmbeddings, LengthEmbeddings, WordSplitter
 
 
 @pytest.fixture(name="pinecone_index_name")
@@ -121,3 +134,228 @@ def test_convert_path_to_string_8():
 def test_convert_path_to_string_9():
     with pytest.raises(TypeError, match="Path must be a string, Path or WindowsPath."):
         convert_path_to_string(True)
+
+
+def test_local_vector_store_query():
+    store = LocalVectorStore()
+    store.upsert(
+        vectors=[("a", [1.0, 0.0], {"sentences": "a"}), ("b", [0.0, 1.0], {})],
+        namespace="ns",
+    )
+    res = store.query(vector=[0.9, 0.1], top_k=2, namespace="ns")
+    assert [match["id"] for match in res["matches"]] == ["a", "b"]
+    assert res["matches"][0]["metadata"] == {"sentences": "a"}
+    assert store.query(vector=[0.9, 0.1], namespace="other")["matches"] == []
+
+
+def test_local_vector_store_upsert_overwrites():
+    store = LocalVectorStore()
+    store.upsert(vectors=[("a", [1.0, 0.0], {})], namespace="ns")
+    store.upsert(vectors=[("a", [0.0, 1.0], {})], namespace="ns")
+    res = store.query(vector=[0.0, 1.0], namespace="ns")
+    assert store.describe_index_stats()["total_vector_count"] == 1
+    assert res["matches"][0]["score"] == pytest.approx(1.0)
+
+
+def test_local_vector_store_delete():
+    store = LocalVectorStore()
+    vectors = [("a", [1.0, 0.0], {}), ("b", [0.0, 1.0], {}), ("c", [1.0, 1.0], {})]
+    store.upsert(vectors=vectors, namespace="ns")
+    store.delete(ids=["a"], namespace="ns")
+    res = store.query(vector=[1.0, 0.0], top_k=3, namespace="ns")
+    assert [match["id"] for match in res["matches"]] == ["c", "b"]
+    store.delete(delete_all=True, namespace="ns")
+    assert store.describe_index_stats()["total_vector_count"] == 0
+
+
+def test_local_vector_store_save(tmp_path):
+    store = LocalVectorStore(tmp_path)
+    store.upsert(vectors=[("a", [1.0, 0.0], {"sentences": "ą"})], namespace="")
+    store.save()
+    res = LocalVectorStore(tmp_path).query(vector=[1.0, 0.0], namespace="")
+    assert res["matches"][0]["metadata"] == {"sentences": "ą"}
+
+
+def test_local_vector_store_save_interrupted(tmp_path, monkeypatch):
+    store = LocalVectorStore(tmp_path)
+    store.upsert(vectors=[("a", [1.0, 0.0], {"sentences": "a"})], namespace="ns")
+    store.save()
+    store.upsert(vectors=[("b", [0.0, 1.0], {"sentences": "b"})], namespace="ns")
+
+    def interrupted_dump(data, f, **kwargs):
+        f.write('{"namespace": "ns", "ids": ["a"')
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(loader.json, "dump", interrupted_dump)
+    with pytest.raises(KeyboardInterrupt):
+        store.save()
+    monkeypatch.undo()
+    # the previous version is still intact
+    assert LocalVectorStore(tmp_path).namespaces["ns"].ids == ["a"]
+
+
+def test_local_vector_store_save_interrupted_after_vectors(tmp_path, monkeypatch):
+    store = LocalVectorStore(tmp_path)
+    store.upsert(vectors=[("a", [1.0, 0.0], {"sentences": "a"})], namespace="ns")
+    store.save()
+    store.upsert(vectors=[("b", [0.0, 1.0], {"sentences": "b"})], namespace="ns")
+    replace = os.replace
+
+    def interrupted_replace(src, dst):
+        # vectors are written, the process dies before the json is renamed
+        if str(dst).endswith(".json"):
+            raise KeyboardInterrupt
+        replace(src, dst)
+
+    monkeypatch.setattr(loader.os, "replace", interrupted_replace)
+    with pytest.raises(KeyboardInterrupt):
+        store.save()
+    monkeypatch.undo()
+    reloaded = LocalVectorStore(tmp_path)
+    assert reloaded.namespaces["ns"].ids == ["a"]
+    res = reloaded.query(vector=[0.0, 1.0], top_k=2, namespace="ns")
+    assert [match["id"] for match in res["matches"]] == ["a"]
+    # the next save commits the new vectors and removes files of older generations
+    store.save()
+    reloaded = LocalVectorStore(tmp_path, mmap=True)
+    assert reloaded.namespaces["ns"].ids == ["a", "b"]
+    assert sorted(path.name for path in tmp_path.glob("ns.*npy")) == ["ns.3.npy"]
+
+
+def test_local_vector_store_save_generations(tmp_path):
+    store = LocalVectorStore(tmp_path)
+    vectors = [(str(i), [1.0, float(i)], {}) for i in range(8)]
+    store.upsert(vectors=vectors, namespace="ns")
+    store.namespaces["ns"].build_ivf(nlist=2)
+    store.save()
+    store.delete(delete_all=True, namespace="ns")
+    store.upsert(vectors=vectors[:2], namespace="ns")
+    store.save()
+    # the recreated namespace does not overwrite files of the one on disk
+    assert sorted(path.name for path in tmp_path.glob("ns.*")) == [
+        "ns.2.npy",
+        "ns.json",
+    ]
+    assert LocalVectorStore(tmp_path).namespaces["ns"].ids == ["0", "1"]
+    store.delete(delete_all=True, namespace="ns")
+    store.save("ns")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_local_vector_store_load_inconsistent(tmp_path):
+    store = LocalVectorStore(tmp_path)
+    vectors = [(str(i), [1.0, float(i)], {}) for i in range(8)]
+    store.upsert(vectors=vectors, namespace="ns")
+    store.namespaces["ns"].build_ivf(nlist=2)
+    store.save()
+    offsets = np.load(tmp_path.joinpath("ns.1.offsets.npy"))
+    offsets[-1] = 100
+    np.save(tmp_path.joinpath("ns.1.offsets.npy"), offsets)
+    # an IVF index built for other vectors is dropped
+    assert LocalVectorStore(tmp_path).namespaces["ns"].ivf is None
+    with open(tmp_path.joinpath("ns.json"), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data["ids"].append("8")
+    with open(tmp_path.joinpath("ns.json"), "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    with pytest.raises(ValueError):
+        LocalVectorStore(tmp_path)
+
+
+def test_local_index_query(tmp_path):
+    li = LocalIndex(index_name="lazarski-test", path=tmp_path)
+    li.index.upsert(vectors=[("a", [3.0, 4.0], {"sentences": "a"})], namespace="ns")
+    assert li.query([3.0, 4.0], namespace="ns") == [
+        ({"sentences": "a"}, pytest.approx(1.0))
+    ]
+
+
+def test_local_index_load_records_into_index(tmp_path, monkeypatch):
+    li = LocalIndex(index_name="lazarski-test", path=tmp_path.joinpath("index"))
+    li._text_processing = SimpleNamespace(
+        text_splitter=WordSplitter(), embed=LengthEmbeddings()
+    )
+    monkeypatch.setattr(li, "_manifest_dir", lambda: tmp_path.joinpath("manifests"))
+    records = ({"text": text, "source": "file"} for text in ["a bb", "ccc"])
+    li.load_records_into_index(records, namespace="ns")
+    assert li.index.describe_index_stats()["namespaces"]["ns"]["vector_count"] == 3
+    # the namespace is persisted together with its manifest
+    assert len(LocalVectorStore(tmp_path.joinpath("index")).namespaces["ns"].ids) == 3
+    assert len(li.get_manifest("ns").entries) == 3
+
+
+def test_local_index_load_data_into_index_resume(tmp_path, monkeypatch):
+    li = LocalIndex(index_name="lazarski-test", path=tmp_path.joinpath("index"))
+    monkeypatch.setattr(li, "_manifest_dir", lambda: tmp_path.joinpath("manifests"))
+    # one upsert worker and one chunk per batch: committed in order
+    monkeypatch.setitem(
+        loader.config,
+        "general",
+        {"batch_limit": 1, "embed_workers": 1, "upsert_workers": 1, "queue_size": 1},
+    )
+    file_path = tmp_path.joinpath("corpus.parquet")
+    write_corpus([{"text": f"w{i}", "source": "file.pdf"} for i in range(4)], file_path)
+    embeddings = InterruptedEmbeddings(fail_on="w3")
+    li._text_processing = SimpleNamespace(text_splitter=WordSplitter(), embed=embeddings)
+    with pytest.raises(RuntimeError):
+        li.load_data_into_index(file_path, namespace="ns")
+    # what was upserted before the failure is persisted with its manifest
+    stored = LocalVectorStore(tmp_path.joinpath("index")).namespaces["ns"].ids
+    assert set(stored) == set(li.get_manifest("ns").entries)
+    assert li.get_checkpoint("ns").path.is_file()
+    embeddings = InterruptedEmbeddings(fail_on=None)
+    li._text_processing = SimpleNamespace(text_splitter=WordSplitter(), embed=embeddings)
+    li.load_data_into_index(file_path, namespace="ns", resume=True)
+    # only chunks not upserted before are embedded
+    assert embeddings.texts == [f"w{i}" for i in range(len(stored), 4)]
+    assert not li.get_checkpoint("ns").path.is_file()
+    assert li.index.describe_index_stats()["namespaces"]["ns"]["vector_count"] == 4
+
+
+def test_local_index_load_two_files_into_namespace(tmp_path, monkeypatch):
+    li = LocalIndex(index_name="lazarski-test", path=tmp_path.joinpath("index"))
+    li._text_processing = SimpleNamespace(
+        text_splitter=WordSplitter(), embed=LengthEmbeddings()
+    )
+    monkeypatch.setattr(li, "_manifest_dir", lambda: tmp_path.joinpath("manifests"))
+    for name, texts in (("a", ["a b", "c"]), ("b", ["d"])):
+        records = [{"text": text, "source": f"{name}.pdf"} for text in texts]
+        write_corpus(records, tmp_path.joinpath(f"{name}.parquet"))
+    li.load_data_into_index(tmp_path.joinpath("a.parquet"), namespace="ns")
+    li.load_data_into_index(tmp_path.joinpath("b.parquet"), namespace="ns")
+    # loading the second file keeps chunks of the first one
+    assert li.index.describe_index_stats()["namespaces"]["ns"]["vector_count"] == 4
+    assert len(li.get_manifest("ns").entries) == 4
+
+
+def test_local_index_load_data_into_index_killed(tmp_path, monkeypatch):
+    li = LocalIndex(index_name="lazarski-test", path=tmp_path.joinpath("index"))
+    monkeypatch.setattr(li, "_manifest_dir", lambda: tmp_path.joinpath("manifests"))
+    file_path = tmp_path.joinpath("corpus.parquet")
+    write_corpus([{"text": f"w{i}", "source": "file.pdf"} for i in range(4)], file_path)
+    # a load killed after journaling batches the vectorstore never saved
+    checkpoint = li.get_checkpoint("ns")
+    checkpoint.start("killed", 0)
+    checkpoint.commit(2, {chunk_id("file.pdf", f"w{i}"): "file.pdf" for i in (0, 1)})
+    checkpoint.close()
+    embeddings = InterruptedEmbeddings(fail_on=None)
+    li._text_processing = SimpleNamespace(text_splitter=WordSplitter(), embed=embeddings)
+    li.load_data_into_index(file_path, namespace="ns", resume=True)
+    assert sorted(embeddings.texts) == ["w0", "w1", "w2", "w3"]
+    assert len(LocalVectorStore(tmp_path.joinpath("index")).namespaces["ns"].ids) == 4
+    assert len(li.get_manifest("ns").entries) == 4
+
+
+def test_local_index_load_data_into_index_parquet(tmp_path, monkeypatch):
+    li = LocalIndex(index_name="lazarski-test", path=tmp_path.joinpath("index"))
+    li._text_processing = SimpleNamespace(
+        text_splitter=WordSplitter(), embed=LengthEmbeddings()
+    )
+    monkeypatch.setattr(li, "_manifest_dir", lambda: tmp_path.joinpath("manifests"))
+    file_path = tmp_path.joinpath("corpus.parquet")
+    record = {"text": "a; b", "source": "file.pdf", "file_type": "Inny", "chunk_index": 0}
+    write_corpus([record], file_path)
+    li.load_data_into_index(file_path, namespace="ns")
+    metadata = li.index.namespaces["ns"].metadata[0]
+    assert metadata["sentences"] == "a; b"
+    assert metadata["file_type"] == "Inny"
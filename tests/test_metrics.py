@@ -0,0 +1,59 @@
+# to run: .venv/Scripts/python.exe -m pytest -vv  tests/test_metrics.py -s
+import json
+
+import pytest
+import repackage
+
+repackage.up()
+from scripts.metrics import Metrics
+
+
+def test_metrics_summary():
+    metrics = Metrics()
+    metrics.inc("chunks_total", 3)
+    metrics.inc("chunks_total")
+    metrics.inc("errors_total", stage="embed")
+    metrics.observe("embedding_seconds", 0.5)
+    metrics.observe("embedding_seconds", 1.5)
+    summary = metrics.summary()
+    assert summary["chunks_total"] == 4
+    assert summary["errors_total"] == {"stage=embed": 1}
+    assert summary["embedding_seconds"] == {
+        "count": 2,
+        "sum": 2.0,
+        "mean": 1.0,
+        "min": 0.5,
+        "max": 1.5,
+    }
+    metrics.reset()
+    assert metrics.summary() == {}
+
+
+def test_metrics_timer():
+    metrics = Metrics()
+    with pytest.raises(ValueError):
+        with metrics.timer("parse_seconds", file_type="Sylabus"):
+            raise ValueError
+    assert metrics.summary()["parse_seconds"]["file_type=Sylabus"]["count"] == 1
+
+
+def test_metrics_to_prometheus():
+    metrics = Metrics(prefix="test")
+    metrics.inc("files_parsed_total", file_type='Sylabus "A"', status="ok")
+    metrics.observe("upsert_payload_bytes", 100)
+    lines = metrics.to_prometheus().splitlines()
+    assert "# TYPE test_files_parsed_total counter" in lines
+    assert 'test_files_parsed_total{file_type="Sylabus \\"A\\"",status="ok"} 1' in lines
+    assert "# TYPE test_upsert_payload_bytes summary" in lines
+    assert "test_upsert_payload_bytes_count 1" in lines
+    assert "test_upsert_payload_bytes_sum 100" in lines
+
+
+def test_metrics_save(tmp_path):
+    metrics = Metrics()
+    metrics.inc("records_total")
+    metrics.save(tmp_path, "ingestion")
+    with open(tmp_path.joinpath("ingestion.json"), "r", encoding="utf-8") as f:
+        assert json.load(f) == {"records_total": 1}
+    prom = tmp_path.joinpath("ingestion.prom").read_text(encoding="utf-8")
+    assert "chatbot_records_total 1" in prom
@@ -0,0 +1,58 @@
+# to run: .venv/Scripts/python.exe -m pytest -vv  tests/test_normalization.py -s
+import pytest
+import repackage
+
+repackage.up()
+from scripts.normalization import Normalizer, get_normalizer
+
+
+def test_normalizer_replacements():
+    normalizer = Normalizer({";": ",", "$": "S", "--": "-"})
+    assert normalizer("  a;\n\t b $3 -- c  ") == "a, b S3 - c"
+
+
+def test_normalizer_replacement_whitespaces():
+    normalizer = Normalizer({"->": "  to\n", ";": " ;\t"})
+    assert normalizer("a->b;c") == "a to b ; c"
+    assert normalizer(["a->b", "x;"]) == ["a to b", "x ;"]
+
+
+def test_normalizer_page_numbers():
+    normalizer = Normalizer(remove_page_numbers=True)
+    assert normalizer("some random 2 z 3 text") == "some random text"
+    assert normalizer("text1 z 4text") == "texttext"
+
+
+def test_normalizer_keywords():
+    normalizer = Normalizer(keywords=["sample", "a"])
+    assert normalizer("This is a sample text.") == "This is text."
+    normalizer = Normalizer(keywords=["Wiedza"])
+    assert normalizer("aWiedza Wiedza;") == "a ;"
+    assert normalizer("aWiedzab") == "ab"
+
+
+def test_normalizer_codes():
+    normalizer = Normalizer(remove_codes=True)
+    text = "This K_K1 is a EP-22 sample K_12 text."
+    assert normalizer(text) == "This is a sample text."
+
+
+def test_normalizer_many():
+    normalizer = Normalizer({";": ","}, remove_page_numbers=True)
+    texts = [" a;  b ", "", "1 z 2", "c\0d  e"]
+    assert normalizer(texts) == [normalizer(text) for text in texts]
+    assert normalizer([]) == []
+
+
+def test_normalizer_type_errors():
+    with pytest.raises(TypeError, match="Must be a dictionary."):
+        Normalizer(0)
+    with pytest.raises(TypeError, match="Text must be string or list of strings."):
+        Normalizer()([0])
+    with pytest.raises(TypeError, match="Text must be string or list of strings."):
+        Normalizer()(0)
+
+
+def test_get_normalizer():
+    assert get_normalizer() is get_normalizer()
+    assert get_normalizer(remove_page_numbers=True) is not get_normalizer()
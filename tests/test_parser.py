@@ -1,6 +1,7 @@
 # to run: .venv/Scripts/python.exe -m pytest -vv  tests/test_parser.py -s
 import os
 from pathlib import Path
+from types import SimpleNamespace
 
 import aspose.pdf as pdf
 import pytest
@@ -185,6 +186,20 @@ def test_determine_language_3():
     assert parser.determine_language(text) == "de"
 
 
+def test_determine_languages():
+    texts = [
+        "Do 1920 r. koleje na ziemiach niemieckich były przeważnie własnością",
+        "The company generates about half of its total revenue",
+    ]
+    assert parser.determine_languages(texts) == ["pl", "en"]
+
+
+def test_get_nlp():
+    assert parser.get_nlp() is parser.get_nlp()
+    assert "ner" not in parser.get_nlp().pipe_names
+    assert "language_detector" in parser.get_nlp(language_detector=True).pipe_names
+
+
 def test_extract_text_from_pdf():
     filepath = r"tests/test_files/test_table_file.pdf"
     result = parser.extract_text_from_pdf(filepath)
@@ -348,3 +363,109 @@ def test_get_raw_text_from_tables():
         parser.get_raw_text_from_tables(pdf_doc, iterator)
         == "Text1 Text2 Obj2 Obj33 Obj1 Obj22"
     )
+
+
+def test_chunk_texts():
+    texts = ["A b. C d. E f.", "G h. I j. K l. M n."]
+    assert parser.chunk_texts(texts) == [parser.chunk_text(text) for text in texts]
+
+
+def test_chunk_sentences():
+    assert parser.chunk_sentences(["a", "b", "c", "d"]) == ["a b c", "b c d"]
+    assert parser.chunk_sentences(["a", "b"]) == []
+
+
+def test_parse_files_1():
+    directory = str(Path(__file__).parent.parent.joinpath(r"tests/test_files"))
+    file_paths = sorted(parser.get_files_in_dir(directory))
+    sequential = list(parser.parse_files(file_paths, workers=1))
+    parallel = list(parser.parse_files(file_paths, workers=2))
+    assert [file_path for file_path, _ in sequential] == [
+        file_path for file_path in file_paths if file_path.endswith((".pdf", ".docx"))
+    ]
+    assert parallel == sequential
+
+
+def test_parse_files_2(tmp_path):
+    broken_file = str(tmp_path.joinpath("broken.docx"))
+    with open(broken_file, "w", encoding="utf-8") as f:
+        f.write("not a docx file")
+    file_path = str(
+        Path(__file__).parent.parent.joinpath(r"tests/test_files/test_file.docx")
+    )
+    result = list(parser.parse_files([broken_file, file_path], workers=2))
+    assert result[0] == (broken_file, None)
+    assert result[1][0] == file_path
+    assert result[1][1]
+
+
+def test_iter_records():
+    directory = str(Path(__file__).parent.parent.joinpath(r"tests/test_files"))
+    records = list(parser.iter_records(directory, workers=1))
+    assert {record["source"] for record in records} <= {
+        "test_Zarządzenie_file.docx",
+        "test_file.docx",
+        "test_file.pdf",
+        "test_table_file.docx",
+        "test_table_file.pdf",
+    }
+    assert all(isinstance(record["text"], str) for record in records)
+
+
+def test_get_parse_cache_config_changed(tmp_path, monkeypatch):
+    file_path = tmp_path.joinpath("file.docx")
+    file_path.write_bytes(b"docx")
+    monkeypatch.setitem(
+        parser.config,
+        "parse_cache",
+        {"enabled": True, "path": str(tmp_path.joinpath("parse.sqlite"))},
+    )
+    monkeypatch.setitem(parser.config["general"], "replacement_dictionary", {"a": "b"})
+    parse_cache = parser.get_parse_cache()
+    parse_cache.put(file_path, ["b"])
+    parse_cache.close()
+    parse_cache = parser.get_parse_cache()
+    assert parse_cache.get(file_path) == ["b"]
+    parse_cache.close()
+    # the same file is parsed differently with another replacement dictionary
+    monkeypatch.setitem(parser.config["general"], "replacement_dictionary", {"a": "c"})
+    parse_cache = parser.get_parse_cache()
+    assert parse_cache.get(file_path) is None
+    parse_cache.close()
+
+
+def test_parse_files_bounded_submissions(monkeypatch):
+    class RecordingExecutor:
+        # runs tasks at once, counting results submitted but not yet taken
+        def __init__(self, max_workers):
+            self.max_workers = max_workers
+            self.outstanding = 0
+            self.max_outstanding = 0
+            executors.append(self)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+        def submit(self, fn, item):
+            self.outstanding += 1
+            self.max_outstanding = max(self.max_outstanding, self.outstanding)
+            result = fn(item)
+            return SimpleNamespace(result=lambda: self._take(result))
+
+        def _take(self, result):
+            self.outstanding -= 1
+            return result
+
+    executors = []
+    monkeypatch.setattr(parser, "ProcessPoolExecutor", RecordingExecutor)
+    monkeypatch.setattr(parser, "get_parse_cache", lambda: None)
+    monkeypatch.setattr(
+        parser, "_parse_file_safe", lambda file_path: ([file_path], None, 0.0)
+    )
+    file_paths = [f"file_{i}.docx" for i in range(20)]
+    result = list(parser.parse_files(file_paths, workers=3))
+    assert result == [(file_path, [file_path]) for file_path in file_paths]
+    assert executors[0].max_outstanding == 2 * 3
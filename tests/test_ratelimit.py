@@ -0,0 +1,159 @@
+# to run: .venv/Scripts/python.exe -m pytest -vv  tests/test_ratelimit.py -s
+import asyncio
+import threading
+import time
+
+import pytest
+import repackage
+
+repackage.up()
+from scripts.embeddings import HashingEmbeddings
+from scripts.ratelimit import (
+    BULK,
+    INTERACTIVE,
+    RateLimitedEmbeddings,
+    RateLimitedIndex,
+    RateLimiter,
+)
+
+
+def test_rate_limiter_burst_and_refill():
+    limiter = RateLimiter(rate=20, capacity=5, reserve=0)
+    for _ in range(5):
+        assert limiter.try_acquire(priority=BULK) == 0
+    wait = limiter.try_acquire(priority=BULK)
+    assert 0 < wait <= 1 / 20
+    start = time.perf_counter()
+    limiter.acquire(priority=BULK)
+    assert time.perf_counter() - start >= wait / 2
+
+
+def test_rate_limiter_reserve():
+    limiter = RateLimiter(rate=0.1, capacity=10, reserve=0.3)
+    taken = 0
+    while limiter.try_acquire(priority=BULK) == 0:
+        taken += 1
+    assert taken == 7
+    # interactive callers may take the reserve
+    for _ in range(3):
+        assert limiter.try_acquire(priority=INTERACTIVE) == 0
+    assert limiter.try_acquire(priority=INTERACTIVE) > 0
+
+
+def test_rate_limiter_interactive_goes_first():
+    limiter = RateLimiter(rate=10, capacity=1, reserve=0)
+    assert limiter.try_acquire(priority=INTERACTIVE) == 0
+    # an interactive caller waiting for the next token holds bulk callers back
+    assert limiter.try_acquire(priority=INTERACTIVE) > 0
+    time.sleep(0.11)
+    assert limiter.try_acquire(priority=BULK) > 0
+    assert limiter.try_acquire(priority=INTERACTIVE) == 0
+
+
+def test_rate_limiter_interactive_latency_under_bulk_load():
+    limiter = RateLimiter(rate=50, capacity=5, reserve=0.2)
+    stop = threading.Event()
+
+    def bulk():
+        while not stop.is_set():
+            limiter.acquire(priority=BULK)
+
+    threads = [threading.Thread(target=bulk) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        time.sleep(0.1)
+        waits = [limiter.acquire(priority=INTERACTIVE) for _ in range(5)]
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    # never more than about one refill (1 / rate) behind
+    assert max(waits) < 0.1
+
+
+def test_rate_limiter_aacquire():
+    limiter = RateLimiter(rate=20, capacity=1, reserve=0)
+
+    async def run():
+        return [await limiter.aacquire(priority=INTERACTIVE) for _ in range(3)]
+
+    waits = asyncio.run(run())
+    assert waits[0] == 0
+    assert sum(waits) >= 0.05
+
+
+def test_rate_limiter_shared_file(tmp_path):
+    path = tmp_path.joinpath("embeddings.json")
+    first = RateLimiter(rate=0.1, capacity=2, reserve=0, path=path)
+    second = RateLimiter(rate=0.1, capacity=2, reserve=0, path=path)
+    assert first.try_acquire() == 0
+    assert second.try_acquire() == 0
+    # the bucket is shared through the file
+    assert first.try_acquire() > 0
+    assert second.try_acquire() > 0
+    assert path.is_file()
+
+
+def test_rate_limiter_aacquire_shared_file(tmp_path):
+    path = tmp_path.joinpath("index.json")
+    limiter = RateLimiter(rate=20, capacity=1, reserve=0, path=path)
+    other = RateLimiter(rate=20, capacity=1, reserve=0, path=path)
+
+    async def run():
+        # the file lock held by another process does not block the event loop
+        with other._file_lock:
+            acquired = asyncio.ensure_future(limiter.aacquire(priority=INTERACTIVE))
+            await asyncio.sleep(0.05)
+            assert not acquired.done()
+        return await acquired
+
+    assert asyncio.run(run()) == 0
+
+
+def test_rate_limiter_invalid():
+    with pytest.raises(ValueError):
+        RateLimiter(rate=0)
+    with pytest.raises(ValueError):
+        RateLimiter(rate=1, reserve=1)
+    # bulk callers could never get a token
+    with pytest.raises(ValueError):
+        RateLimiter(rate=1, capacity=1, reserve=0.2)
+
+
+def test_rate_limiter_bulk_capacity():
+    # the default capacity leaves room for bulk requests besides the reserve
+    limiter = RateLimiter(rate=1)
+    assert limiter.capacity * (1 - limiter.reserve) >= 1
+    assert limiter.try_acquire(priority=BULK) == 0
+    # a bulk request larger than the bulk capacity takes all of it
+    limiter = RateLimiter(rate=0.1, capacity=10, reserve=0.5)
+    assert limiter.try_acquire(cost=8, priority=BULK) == 0
+    assert limiter.try_acquire(priority=INTERACTIVE) == 0
+
+
+def test_rate_limited_embeddings():
+    embeddings = HashingEmbeddings(dimension=16)
+    limited = RateLimitedEmbeddings(
+        embeddings, RateLimiter(rate=0.1, capacity=2), priority=INTERACTIVE
+    )
+    assert limited.embed_query("a") == embeddings.embed_query("a")
+    assert asyncio.run(limited.aembed_documents(["b"])) == embeddings.embed_documents(
+        ["b"]
+    )
+    assert limited.model == embeddings.model
+    assert limited.limiter.try_acquire(priority=INTERACTIVE) > 0
+
+
+def test_rate_limited_index():
+    class Index:
+        def upsert(self, vectors, namespace=None):
+            return {"upserted_count": len(vectors)}
+
+        def describe_index_stats(self):
+            return {}
+
+    limited = RateLimitedIndex(Index(), RateLimiter(rate=0.1, capacity=1, reserve=0))
+    assert limited.upsert([1, 2], namespace="ns") == {"upserted_count": 2}
+    assert limited.describe_index_stats() == {}
+    assert limited.limiter.try_acquire() > 0
@@ -0,0 +1,56 @@
+# to run: .venv/Scripts/python.exe -m pytest -vv  tests/test_splitter.py -s
+import pytest
+import repackage
+import tiktoken
+
+repackage.up()
+from scripts.splitter import TokenTextSplitter
+
+
+@pytest.fixture(name="tokenizer")
+def fixture_tokenizer():
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def test_split_text_chunk_size(tokenizer):
+    splitter = TokenTextSplitter(tokenizer, chunk_size=20, chunk_overlap=5)
+    text = " ".join(f"słowo{i}" for i in range(200))
+    chunks = splitter.split_text(text)
+    assert all(len(tokenizer.encode(chunk)) <= 20 for chunk in chunks)
+    # chunks are cut between words and cover the whole text
+    words = [word for chunk in chunks for word in chunk.split(" ")]
+    assert sorted(set(words)) == sorted(text.split(" "))
+    assert chunks[0].startswith("słowo0 ") and chunks[-1].endswith(" słowo199")
+
+
+def test_split_text_separators(tokenizer):
+    splitter = TokenTextSplitter(tokenizer, chunk_size=30, chunk_overlap=5)
+    paragraphs = [" ".join(["akapit"] * 10), " ".join(["zdanie"] * 10)]
+    assert splitter.split_text("\n\n".join(paragraphs)) == paragraphs
+
+
+def test_split_text_overlap(tokenizer):
+    splitter = TokenTextSplitter(tokenizer, chunk_size=10, chunk_overlap=4)
+    chunks = splitter.split_text(" ".join(str(i) for i in range(100, 130)))
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.split(" ")[0] in previous.split(" ")
+
+
+def test_split_texts(tokenizer):
+    splitter = TokenTextSplitter(tokenizer, chunk_size=10, chunk_overlap=2)
+    texts = ["a b c " * 20, "", "zażółć gęślą jaźń " * 10, "x" * 300]
+    assert splitter.split_texts(texts) == [splitter.split_text(text) for text in texts]
+    assert splitter.split_texts(texts)[1] == []
+    for chunks in splitter.split_texts_with_lengths(texts):
+        assert all(0 < length <= 10 for _, length in chunks)
+
+
+def test_split_text_multibyte(tokenizer):
+    splitter = TokenTextSplitter(tokenizer, chunk_size=5, chunk_overlap=0)
+    text = "źżćęąółń" * 10
+    assert "".join(splitter.split_text(text)) == text
+
+
+def test_token_text_splitter_overlap_error(tokenizer):
+    with pytest.raises(ValueError, match="Chunk overlap must be smaller"):
+        TokenTextSplitter(tokenizer, chunk_size=10, chunk_overlap=10)
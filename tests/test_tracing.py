@@ -0,0 +1,78 @@
+# to run: .venv/Scripts/python.exe -m pytest -vv  tests/test_tracing.py -s
+import json
+
+import pytest
+import repackage
+
+repackage.up()
+from scripts.tracing import (
+    NULL_TRACE,
+    JSONLExporter,
+    RingBufferExporter,
+    Tracer,
+)
+
+
+def test_tracer_trace():
+    exporter = RingBufferExporter()
+    tracer = Tracer(exporter)
+    with tracer.trace("query", namespace="ns") as trace:
+        with trace.span("cache_lookup") as span:
+            span.set(hit=False)
+        trace.set(score=0.5)
+    [exported] = exporter.traces()
+    assert exported["name"] == "query"
+    assert exported["attributes"] == {"namespace": "ns", "score": 0.5}
+    assert exported["spans"][0]["name"] == "cache_lookup"
+    assert exported["spans"][0]["hit"] is False
+    assert exported["duration_ms"] >= exported["spans"][0]["duration_ms"] >= 0
+
+
+def test_tracer_trace_error():
+    exporter = RingBufferExporter()
+    with pytest.raises(ConnectionError):
+        with Tracer(exporter).trace("query") as trace:
+            with trace.span("vector_search"):
+                raise ConnectionError
+    [exported] = exporter.traces()
+    assert exported["attributes"]["error"] == "ConnectionError"
+    assert exported["spans"][0]["error"] == "ConnectionError"
+
+
+def test_tracer_sampling():
+    exporter = RingBufferExporter()
+    tracer = Tracer(exporter, sample_rate=0.5, seed=0)
+    for _ in range(1000):
+        with tracer.trace("query"):
+            pass
+    assert 400 < len(exporter.traces()) < 600
+    # slow traces are always exported
+    exporter = RingBufferExporter()
+    tracer = Tracer(exporter, sample_rate=0.0, slow_ms=0.0)
+    with tracer.trace("query"):
+        pass
+    assert len(exporter.traces()) == 1
+    with pytest.raises(ValueError, match="Sample rate must be between 0 and 1."):
+        Tracer(exporter, sample_rate=2)
+
+
+def test_tracer_disabled():
+    with Tracer().trace("query") as trace:
+        with trace.span("embedding") as span:
+            span.set(hit=True)
+    assert trace is NULL_TRACE
+
+
+def test_ring_buffer_exporter():
+    exporter = RingBufferExporter(max_traces=2)
+    for i in range(3):
+        exporter.export({"i": i})
+    assert exporter.traces() == [{"i": 1}, {"i": 2}]
+
+
+def test_jsonl_exporter(tmp_path):
+    exporter = JSONLExporter(tmp_path.joinpath("traces", "traces.jsonl"))
+    exporter.export({"i": 0})
+    exporter.export({"i": 1})
+    with open(tmp_path.joinpath("traces", "traces.jsonl"), encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == [{"i": 0}, {"i": 1}]